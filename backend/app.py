@@ -1,21 +1,28 @@
+import asyncio
 import logging
-import sqlite3
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware import cors
 
-from . import const, database
+from . import const, database, metrics, service, slowlog
 from .router import router
 
 logging.basicConfig(
     level=logging.INFO, format="<%(asctime)s> - <%(levelname)s> - <%(message)s>"
 )
 
+if const.SLOW_QUERY_LOG:
+    slowlog.configure_file(const.SLOW_QUERY_LOG, const.SLOW_QUERY_LOG_MAX_BYTES)
+
 app = FastAPI()
 
-conn = sqlite3.connect(const.SQLITE_DB)
+conn = database.connect(const.SQLITE_DB)
 database.create_tables(conn)
 conn.close()
+# The read-only catalog routes and the search are served from memory
+service.Catalog.preload()
+service.Search.preload()
 
 app.include_router(router)
 
@@ -26,7 +33,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by the clients of other origins for the delta sync of /reads
+    expose_headers=["X-Sync-Cursor"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/")
@@ -37,6 +47,14 @@ async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    """
+    Exposes the application metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.on_event("startup")
 async def startup_event():
     logger = logging.getLogger("uvicorn.access")
@@ -45,3 +63,22 @@ async def startup_event():
         logging.Formatter("<%(asctime)s> - <%(levelname)s> - <%(message)s>")
     )
     logger.addHandler(handler)
+
+
+async def compact_tombstones():
+    """
+    Purges the expired tombstones of the reading lists periodically.
+    """
+    while True:
+        try:
+            purged = await run_in_threadpool(service.ReadingList.compact_tombstones)
+            logging.info(f"App: {purged} expired tombstones purged")
+        except Exception:
+            logging.exception("App: Tombstone compaction failed")
+        await asyncio.sleep(const.TOMBSTONE_COMPACTION_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_tombstone_compaction():
+    # Keep a reference, the event loop only holds weak references to tasks
+    app.state.tombstone_compaction = asyncio.create_task(compact_tombstones())
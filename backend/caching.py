@@ -0,0 +1,167 @@
+"""
+This module contains the HTTP caching helpers (ETag and Cache-Control)
+used by the catalog endpoints, and the in-process reading list cache.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from fastapi import status as http_status
+
+from .const import CATALOG_CACHE_CONTROL, READS_CACHE_SIZE
+
+
+def catalog_etag(version: str, request: Request) -> str:
+    """
+    Builds a strong ETag from the catalog version, the path and the query
+    parameters of the request. The same URL gets a new ETag every time the
+    catalog changes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(version.encode())
+    digest.update(request.url.path.encode())
+    for name, value in sorted(request.query_params.multi_items()):
+        digest.update(f"\0{name}={value}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """
+    Returns True if the If-None-Match header of the request matches the ETag,
+    meaning the client copy is still up to date.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    tags = (tag.strip().removeprefix("W/") for tag in header.split(","))
+    return etag in tags
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    """
+    Returns the caching headers sent with a catalog response.
+    """
+    return {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Returns an empty 304 response for the given ETag.
+    """
+    return Response(
+        status_code=http_status.HTTP_304_NOT_MODIFIED,
+        headers=cache_headers(etag),
+    )
+
+
+class ReadingListCache:
+    """
+    LRU cache of the reading list entries by user id, bounded by the total
+    number of entries it holds.
+    Only the (book id, status, last update) of the entries are cached: they
+    only change with the writes of their user, which update them in place,
+    while the details and read counts of the books are read from the
+    catalog when the list is used. The cache is per process: it relies on
+    the writes of a user going through this process.
+    """
+
+    def __init__(self, max_books):
+        self.max_books = max_books
+        self.entries = OrderedDict()
+        self.size = 0
+        # Loads in progress by user id, dropped by the writes of the user
+        self.loads = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Returns the cached (book id, status, last update) entries of a user,
+        by book id, or None if they are missing.
+        """
+        with self.lock:
+            entries = self.entries.get(user_id)
+            if entries is None:
+                return None
+            self.entries.move_to_end(user_id)
+            return [(book_id, *entry) for book_id, entry in entries.items()]
+
+    def begin_load(self, user_id):
+        """
+        Returns a token to pass to put() with the entries loaded from now on.
+        """
+        token = object()
+        with self.lock:
+            self.loads[user_id] = token
+        return token
+
+    def put(self, user_id, entries, token):
+        """
+        Caches the (book id, status, last update) entries of a user, by book
+        id, unless a write of the user happened since begin_load() returned
+        the token: the entries may not include it.
+        """
+        with self.lock:
+            if self.loads.get(user_id) is not token:
+                return
+            del self.loads[user_id]
+            self._pop(user_id)
+            if len(entries) > self.max_books:
+                return
+            self.entries[user_id] = {
+                book_id: (status, updated_at) for book_id, status, updated_at in entries
+            }
+            self.size += len(entries)
+            self._evict()
+
+    def update(self, user_id, book_id, entry):
+        """
+        Applies a write to the cached entries of a user: sets the (status,
+        last update) of the book, or removes it when `entry` is None.
+        """
+        with self.lock:
+            self.loads.pop(user_id, None)
+            entries = self.entries.get(user_id)
+            if entries is None:
+                return
+            cached = book_id in entries
+            if entry is None:
+                entries.pop(book_id, None)
+            else:
+                entries[book_id] = entry
+                if not cached:
+                    # Keep the order of the database, by book id
+                    self.entries[user_id] = dict(sorted(entries.items()))
+            self.size += (entry is not None) - cached
+            self._evict()
+
+    def invalidate(self, user_id):
+        """
+        Drops the cached entries of a user, after writes not applied in place.
+        """
+        with self.lock:
+            self.loads.pop(user_id, None)
+            self._pop(user_id)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.loads.clear()
+            self.size = 0
+
+    def _pop(self, user_id):
+        entries = self.entries.pop(user_id, None)
+        if entries is not None:
+            self.size -= len(entries)
+
+    def _evict(self):
+        while self.size > self.max_books:
+            _, entries = self.entries.popitem(last=False)
+            self.size -= len(entries)
+
+
+READING_LISTS = ReadingListCache(READS_CACHE_SIZE)
@@ -0,0 +1,111 @@
+"""
+This module contains the in-process publish/subscribe bus feeding the
+/reads/stream server-sent events.
+
+Writers publish from the thread pool, subscribers consume from the event
+loop: events are handed over with call_soon_threadsafe. Each subscriber has
+a bounded buffer. When a slow client lets it fill up, the buffered events
+are replaced by a single "overflow" event telling the client to resync with
+/reads?since=<cursor>.
+"""
+
+import asyncio
+import json
+import threading
+
+from . import metrics
+from .const import SSE_HEARTBEAT_SECONDS, SSE_QUEUE_SIZE
+
+OVERFLOW = {"type": "overflow"}
+HEARTBEAT = ": heartbeat\n\n"
+
+
+class Subscription:
+    __slots__ = ("user_id", "queue", "loop")
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(queue_size)
+        self.loop = asyncio.get_running_loop()
+
+
+def _deliver(queue: asyncio.Queue, event):
+    if queue.full():
+        while not queue.empty():
+            queue.get_nowait()
+        event = OVERFLOW
+    queue.put_nowait(event)
+
+
+class EventBus:
+    """
+    Delivers the events published for a user to all the subscriptions of
+    that user. Events are not stored, only the connected subscribers get them.
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id) -> Subscription:
+        """
+        Subscribes to the events of a user. Must be called from the event loop.
+        """
+        subscription = Subscription(user_id, self.queue_size)
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        metrics.SSE_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+        metrics.SSE_SUBSCRIBERS.dec()
+
+    def publish(self, user_id, event: dict):
+        """
+        Publishes an event to the subscribers of a user, from any thread.
+        """
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    _deliver, subscription.queue, event
+                )
+            except RuntimeError:
+                # The event loop of the subscriber is closed
+                self.unsubscribe(subscription)
+
+
+READING_LIST_EVENTS = EventBus(SSE_QUEUE_SIZE)
+
+
+def format_event(event: dict) -> str:
+    """
+    Formats an event as a server-sent event named after its type.
+    """
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(bus: EventBus, user_id, heartbeat=SSE_HEARTBEAT_SECONDS):
+    """
+    Yields the events of a user as server-sent events, with a comment every
+    `heartbeat` seconds without events so that proxies keep the connection
+    open. The subscription ends when the generator is closed.
+    """
+    subscription = bus.subscribe(user_id)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            yield format_event(event)
+    finally:
+        bus.unsubscribe(subscription)
@@ -15,3 +15,78 @@ SQLITE_DB = os.environ.get("SQLITE_DB", "db.sqlite3")
 SECRET_KEY: str = os.environ.get("JWT_SECRET")  # type: ignore
 ALGORITHM: str = os.environ.get("JWT_ALGORITHM")  # type: ignore
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("JWT_EXPIRE_MINUTES", 240))
+
+# Cache-Control header sent with the catalog endpoints. The default lets
+# browsers and proxies store the responses but revalidate them with the ETag.
+CATALOG_CACHE_CONTROL = os.environ.get("CATALOG_CACHE_CONTROL", "public, no-cache")
+
+# Statements slower than this (in milliseconds) go to the slow query log.
+# A negative value disables the log.
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+# Rotating file receiving the slow statements, empty to disable it
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", 10_000_000))
+
+# Maximum number of operations accepted by /reads/batch in one request
+READS_BATCH_MAX_SIZE = int(os.environ.get("READS_BATCH_MAX_SIZE", 500))
+
+# Maximum number of requests accepted by /batch in one call
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+
+# Days the removals from the reading lists are kept for the delta sync of
+# /reads. Older cursors get a 410 and must fetch the whole list again.
+READS_TOMBSTONE_RETENTION_DAYS = int(
+    os.environ.get("READS_TOMBSTONE_RETENTION_DAYS", 30)
+)
+# Seconds between two purges of the expired tombstones
+TOMBSTONE_COMPACTION_INTERVAL = int(
+    os.environ.get("TOMBSTONE_COMPACTION_INTERVAL", 3600)
+)
+
+# Maximum number of books of a /books page
+BOOKS_MAX_PAGE_SIZE = int(os.environ.get("BOOKS_MAX_PAGE_SIZE", 100))
+
+# Minimum seconds between two reloads of the in-memory catalog snapshot.
+# The catalog routes can serve a catalog this old, plus the load time.
+CATALOG_SNAPSHOT_REFRESH_SECONDS = float(
+    os.environ.get("CATALOG_SNAPSHOT_REFRESH_SECONDS", 2)
+)
+
+# Share (0 to 1) of the trigrams of a /search query that a title or an
+# author must contain to match. Lower values tolerate more typos.
+SEARCH_SIMILARITY_THRESHOLD = float(os.environ.get("SEARCH_SIMILARITY_THRESHOLD", 0.5))
+# Maximum number of books returned by a /search query, the most similar ones,
+# across all its pages
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 100))
+# Books among which the matches of a /search are counted to estimate their
+# total, until the search index is loaded
+SEARCH_ESTIMATE_SAMPLE = int(os.environ.get("SEARCH_ESTIMATE_SAMPLE", 10_000))
+
+# Number of suggestions computed for each prefix, the maximum n of
+# /search/suggest
+SUGGEST_TOP_K = int(os.environ.get("SUGGEST_TOP_K", 10))
+# Minimum seconds between two rebuilds of the autocomplete index, the read
+# counts ranking the suggestions can be this old
+SUGGEST_REFRESH_SECONDS = float(os.environ.get("SUGGEST_REFRESH_SECONDS", 60))
+
+# Maximum number of books of a /reads page
+READS_MAX_PAGE_SIZE = int(os.environ.get("READS_MAX_PAGE_SIZE", 500))
+
+# Maximum number of days of daily completions returned by /stats
+STATS_MAX_DAYS = int(os.environ.get("STATS_MAX_DAYS", 365))
+
+# Reading list entries held by the in-process cache, across all users
+READS_CACHE_SIZE = int(os.environ.get("READS_CACHE_SIZE", 50_000))
+
+# Events buffered for each /reads/stream client before it must resync
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", 100))
+# Seconds without events after which /reads/stream sends a heartbeat
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+
+# Comma separated ids of the users allowed to use the /admin endpoints and
+# /export/books
+ADMIN_USER_IDS = {
+    int(user_id)
+    for user_id in os.environ.get("ADMIN_USER_IDS", "").split(",")
+    if user_id
+}
@@ -7,7 +7,375 @@ import logging
 import os
 import sqlite3
 
+from . import metrics, slowlog
 
+
+def connect(path, **kwargs) -> sqlite3.Connection:
+    """
+    Opens a connection to the database at the given path.
+    All the application connections go through here so they can be counted
+    and traced by the slow query log.
+    """
+    metrics.DB_CONNECTIONS.inc()
+    conn = sqlite3.connect(path, **kwargs)
+    slowlog.install(conn)
+    return conn
+
+
+def instrumented(func):
+    """
+    Decorator recording the latency of a database function in the metrics
+    and its slow statements in the slow query log.
+    """
+    return metrics.timed(slowlog.tracked(func))
+
+
+# Schema changes of existing databases, applied in order by migrate().
+# The number of migrations applied is stored in PRAGMA user_version.
+MIGRATIONS = (
+    # 1. One row per book in a reading list, so that adding a book is a
+    # single INSERT ... ON CONFLICT. Keeps the latest of the duplicates and
+    # the tombstones of books still in the list are dropped with them.
+    (
+        """
+        DELETE FROM reading_list WHERE id NOT IN (
+            SELECT MAX(id) FROM reading_list GROUP BY user, book
+        )
+    """,
+        """
+        DELETE FROM reading_list_tombstones WHERE EXISTS (
+            SELECT 1 FROM reading_list
+            WHERE reading_list.user = reading_list_tombstones.user
+            AND reading_list.book = reading_list_tombstones.book
+        )
+    """,
+        """
+        DROP INDEX IF EXISTS reading_list_user_book
+    """,
+        """
+        CREATE UNIQUE INDEX reading_list_user_book ON reading_list (user, book)
+    """,
+    ),
+    # 2. Read count of each book, kept up to date by the reading list
+    # triggers, so that the catalog can be sorted by popularity from an index
+    (
+        """
+        ALTER TABLE books ADD COLUMN reads INTEGER NOT NULL DEFAULT 0
+    """,
+        """
+        UPDATE books SET reads = (
+            SELECT COUNT(*) FROM reading_list
+            WHERE book = books.id AND reading_status = 'complete'
+        )
+    """,
+        """
+        CREATE TRIGGER reading_list_insert_reads
+        AFTER INSERT ON reading_list
+        WHEN NEW.reading_status = 'complete'
+        BEGIN
+            UPDATE books SET reads = reads + 1 WHERE id = NEW.book;
+        END
+    """,
+        """
+        CREATE TRIGGER reading_list_update_reads
+        AFTER UPDATE OF book, reading_status ON reading_list
+        WHEN OLD.book <> NEW.book
+        OR (OLD.reading_status = 'complete') <> (NEW.reading_status = 'complete')
+        BEGIN
+            UPDATE books SET reads = reads - (OLD.reading_status = 'complete')
+            WHERE id = OLD.book;
+            UPDATE books SET reads = reads + (NEW.reading_status = 'complete')
+            WHERE id = NEW.book;
+        END
+    """,
+        """
+        CREATE TRIGGER reading_list_delete_reads
+        AFTER DELETE ON reading_list
+        WHEN OLD.reading_status = 'complete'
+        BEGIN
+            UPDATE books SET reads = reads - 1 WHERE id = OLD.book;
+        END
+    """,
+    ),
+    # 3. Authors and genres in their own tables, referenced by integer keys.
+    # The books table is rebuilt (SQLite cannot change a column type), the
+    # legacy rename keeps the reading list triggers pointing at "books".
+    # The catalog view joins the names back for the queries.
+    (
+        """
+        CREATE TABLE genres (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            books INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+        """
+        CREATE TABLE authors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            books INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+        """
+        INSERT INTO genres (name, books)
+        SELECT genre, COUNT(*) FROM books GROUP BY genre ORDER BY genre
+    """,
+        """
+        INSERT INTO authors (name, books)
+        SELECT author, COUNT(*) FROM books GROUP BY author ORDER BY author
+    """,
+        """
+        CREATE TABLE books_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author INTEGER NOT NULL,
+            genre INTEGER NOT NULL,
+            reads INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (author) REFERENCES authors (id),
+            FOREIGN KEY (genre) REFERENCES genres (id)
+        )
+    """,
+        """
+        INSERT INTO books_new
+        (id, title, author, genre, reads, created_at, updated_at)
+        SELECT books.id, title, authors.id, genres.id, reads,
+        books.created_at, books.updated_at
+        FROM books
+        JOIN authors ON authors.name = books.author
+        JOIN genres ON genres.name = books.genre
+    """,
+        """
+        DROP TABLE books
+    """,
+        "PRAGMA legacy_alter_table = ON",
+        """
+        ALTER TABLE books_new RENAME TO books
+    """,
+        "PRAGMA legacy_alter_table = OFF",
+        """
+        CREATE VIEW catalog AS
+        SELECT books.id, books.title, authors.name AS author,
+        genres.name AS genre, books.reads, books.created_at, books.updated_at
+        FROM books
+        JOIN authors ON authors.id = books.author
+        JOIN genres ON genres.id = books.genre
+    """,
+        """
+        CREATE TRIGGER books_insert_counts
+        AFTER INSERT ON books
+        BEGIN
+            UPDATE authors SET books = books + 1 WHERE id = NEW.author;
+            UPDATE genres SET books = books + 1 WHERE id = NEW.genre;
+        END
+    """,
+        """
+        CREATE TRIGGER books_update_counts
+        AFTER UPDATE OF author, genre ON books
+        BEGIN
+            UPDATE authors SET books = books - 1 WHERE id = OLD.author;
+            UPDATE authors SET books = books + 1 WHERE id = NEW.author;
+            UPDATE genres SET books = books - 1 WHERE id = OLD.genre;
+            UPDATE genres SET books = books + 1 WHERE id = NEW.genre;
+        END
+    """,
+        """
+        CREATE TRIGGER books_delete_counts
+        AFTER DELETE ON books
+        BEGIN
+            UPDATE authors SET books = books - 1 WHERE id = OLD.author;
+            UPDATE genres SET books = books - 1 WHERE id = OLD.genre;
+        END
+    """,
+    ),
+    # 4. Statistics rollups: the reading list entries of each book and of
+    # each genre by status, and the entries completed each day (and still
+    # complete). Backfilled once, then kept up to date by triggers, so that
+    # the statistics are read without scanning the reading lists.
+    (
+        """
+        CREATE TABLE book_stats (
+            book INTEGER PRIMARY KEY,
+            not_started INTEGER NOT NULL DEFAULT 0,
+            started INTEGER NOT NULL DEFAULT 0,
+            complete INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+        """
+        CREATE TABLE genre_stats (
+            genre INTEGER PRIMARY KEY,
+            not_started INTEGER NOT NULL DEFAULT 0,
+            started INTEGER NOT NULL DEFAULT 0,
+            complete INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+        """
+        CREATE TABLE daily_completions (
+            day TEXT PRIMARY KEY,
+            completions INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+        """
+        INSERT INTO book_stats (book, not_started, started, complete)
+        SELECT books.id,
+        COUNT(*) FILTER (WHERE reading_status = 'not_started'),
+        COUNT(*) FILTER (WHERE reading_status = 'started'),
+        COUNT(*) FILTER (WHERE reading_status = 'complete')
+        FROM books LEFT JOIN reading_list ON reading_list.book = books.id
+        GROUP BY books.id
+    """,
+        """
+        INSERT INTO genre_stats (genre, not_started, started, complete)
+        SELECT genres.id, COALESCE(SUM(not_started), 0),
+        COALESCE(SUM(started), 0), COALESCE(SUM(complete), 0)
+        FROM genres
+        LEFT JOIN books ON books.genre = genres.id
+        LEFT JOIN book_stats ON book_stats.book = books.id
+        GROUP BY genres.id
+    """,
+        """
+        INSERT INTO daily_completions (day, completions)
+        SELECT date(updated_at), COUNT(*) FROM reading_list
+        WHERE reading_status = 'complete'
+        GROUP BY date(updated_at)
+    """,
+        """
+        CREATE TRIGGER books_insert_stats
+        AFTER INSERT ON books
+        BEGIN
+            INSERT INTO book_stats (book) VALUES (NEW.id);
+        END
+    """,
+        """
+        CREATE TRIGGER books_update_stats
+        AFTER UPDATE OF genre ON books
+        WHEN OLD.genre <> NEW.genre
+        BEGIN
+            UPDATE genre_stats SET
+            not_started = genre_stats.not_started - stats.not_started,
+            started = genre_stats.started - stats.started,
+            complete = genre_stats.complete - stats.complete
+            FROM (SELECT * FROM book_stats WHERE book = OLD.id) AS stats
+            WHERE genre = OLD.genre;
+            UPDATE genre_stats SET
+            not_started = genre_stats.not_started + stats.not_started,
+            started = genre_stats.started + stats.started,
+            complete = genre_stats.complete + stats.complete
+            FROM (SELECT * FROM book_stats WHERE book = NEW.id) AS stats
+            WHERE genre = NEW.genre;
+        END
+    """,
+        """
+        CREATE TRIGGER books_delete_stats
+        AFTER DELETE ON books
+        BEGIN
+            UPDATE genre_stats SET
+            not_started = genre_stats.not_started - stats.not_started,
+            started = genre_stats.started - stats.started,
+            complete = genre_stats.complete - stats.complete
+            FROM (SELECT * FROM book_stats WHERE book = OLD.id) AS stats
+            WHERE genre = OLD.genre;
+            DELETE FROM book_stats WHERE book = OLD.id;
+        END
+    """,
+        """
+        CREATE TRIGGER genres_insert_stats
+        AFTER INSERT ON genres
+        BEGIN
+            INSERT INTO genre_stats (genre) VALUES (NEW.id);
+        END
+    """,
+        """
+        CREATE TRIGGER reading_list_insert_stats
+        AFTER INSERT ON reading_list
+        BEGIN
+            UPDATE book_stats SET
+            not_started = not_started + (NEW.reading_status = 'not_started'),
+            started = started + (NEW.reading_status = 'started'),
+            complete = complete + (NEW.reading_status = 'complete')
+            WHERE book = NEW.book;
+            UPDATE genre_stats SET
+            not_started = not_started + (NEW.reading_status = 'not_started'),
+            started = started + (NEW.reading_status = 'started'),
+            complete = complete + (NEW.reading_status = 'complete')
+            WHERE genre = (SELECT genre FROM books WHERE id = NEW.book);
+            INSERT INTO daily_completions (day, completions)
+            SELECT date(NEW.updated_at), 1 WHERE NEW.reading_status = 'complete'
+            ON CONFLICT (day) DO UPDATE SET completions = completions + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER reading_list_update_stats
+        AFTER UPDATE OF book, reading_status, updated_at ON reading_list
+        BEGIN
+            UPDATE book_stats SET
+            not_started = not_started - (OLD.reading_status = 'not_started'),
+            started = started - (OLD.reading_status = 'started'),
+            complete = complete - (OLD.reading_status = 'complete')
+            WHERE book = OLD.book;
+            UPDATE genre_stats SET
+            not_started = not_started - (OLD.reading_status = 'not_started'),
+            started = started - (OLD.reading_status = 'started'),
+            complete = complete - (OLD.reading_status = 'complete')
+            WHERE genre = (SELECT genre FROM books WHERE id = OLD.book);
+            UPDATE daily_completions SET completions = completions - 1
+            WHERE day = date(OLD.updated_at) AND OLD.reading_status = 'complete';
+            UPDATE book_stats SET
+            not_started = not_started + (NEW.reading_status = 'not_started'),
+            started = started + (NEW.reading_status = 'started'),
+            complete = complete + (NEW.reading_status = 'complete')
+            WHERE book = NEW.book;
+            UPDATE genre_stats SET
+            not_started = not_started + (NEW.reading_status = 'not_started'),
+            started = started + (NEW.reading_status = 'started'),
+            complete = complete + (NEW.reading_status = 'complete')
+            WHERE genre = (SELECT genre FROM books WHERE id = NEW.book);
+            INSERT INTO daily_completions (day, completions)
+            SELECT date(NEW.updated_at), 1 WHERE NEW.reading_status = 'complete'
+            ON CONFLICT (day) DO UPDATE SET completions = completions + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER reading_list_delete_stats
+        AFTER DELETE ON reading_list
+        BEGIN
+            UPDATE book_stats SET
+            not_started = not_started - (OLD.reading_status = 'not_started'),
+            started = started - (OLD.reading_status = 'started'),
+            complete = complete - (OLD.reading_status = 'complete')
+            WHERE book = OLD.book;
+            UPDATE genre_stats SET
+            not_started = not_started - (OLD.reading_status = 'not_started'),
+            started = started - (OLD.reading_status = 'started'),
+            complete = complete - (OLD.reading_status = 'complete')
+            WHERE genre = (SELECT genre FROM books WHERE id = OLD.book);
+            UPDATE daily_completions SET completions = completions - 1
+            WHERE day = date(OLD.updated_at) AND OLD.reading_status = 'complete';
+        END
+    """,
+    ),
+)
+
+# ORDER BY clause of each sort of get_books, all served by an index
+# (see create_indexes) so that only the rows of the page are read
+BOOK_SORTS = {
+    None: "id",
+    "popular": "reads DESC, id DESC",
+    "title": "title, id",
+    "recent": "id DESC",
+}
+
+# ORDER BY clause and keyset comparison of each sort of
+# iter_reading_list_page, served by the (user, reading_status, updated_at)
+# and (user, updated_at) indexes, which end with the rowid
+READING_LIST_SORTS = {
+    "recent": ("r.updated_at DESC, r.id DESC", "<"),
+    "oldest": ("r.updated_at, r.id", ">"),
+}
+
+
+@instrumented
 def create_tables(conn: sqlite3.Connection):
     """
     Crates the tables in the database and populates the books table with
@@ -75,15 +443,62 @@ def create_tables(conn: sqlite3.Connection):
     )
     conn.commit()
 
+    # Books removed from the reading lists, for the delta sync of /reads.
+    # Purged after READS_TOMBSTONE_RETENTION_DAYS by purge_tombstones.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reading_list_tombstones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book INTEGER NOT NULL,
+            user INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS reading_list_delete_tombstone
+        AFTER DELETE ON reading_list
+        BEGIN
+            INSERT INTO reading_list_tombstones (book, user)
+            VALUES (OLD.book, OLD.user);
+        END
+    """
+    )
+    conn.commit()
+
+    # Single row holding the catalog version, used to build ETags.
+    # The epoch changes whenever the database is recreated, so old ETags
+    # never match a new database with the same version number.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch TEXT NOT NULL DEFAULT (lower(hex(randomblob(8)))),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    )
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO catalog_version (id) VALUES (1)
+    """
+    )
+    conn.commit()
+    migrate(conn)
+    # After the migrations, which may rebuild the books table and its triggers
+    create_catalog_version_triggers(conn)
+    create_indexes(conn)
+    conn.commit()
+
     # Check if there is any book exists in the database
     # Populates the table only if there are no books in the database
     cursor = conn.execute(
         """
-        SELECT * FROM books
+        SELECT id FROM books LIMIT 1
     """
     )
-    books = cursor.fetchall()
-    if not books:
+    if not cursor.fetchone():
         with open(f"{os.path.dirname(__file__)}/data/books.json", "r") as f:
             books = json.load(f)
             for book in books:
@@ -92,16 +507,168 @@ def create_tables(conn: sqlite3.Connection):
     logging.info("Tables created")
 
 
+@instrumented
+def migrate(conn: sqlite3.Connection):
+    """
+    Applies the migrations the database does not have yet, each one in its
+    own transaction.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        logging.info(f"Database: Applying migration {number}")
+        conn.execute("BEGIN")
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+
+
+@instrumented
+def create_indexes(conn: sqlite3.Connection):
+    """
+    Creates the indexes used by the queries of this module.
+    Every query filtering a table is expected to use one of them, which is
+    checked by tests/unit_tests/query_plan_test.py.
+    """
+    for index in (
+        # Reading list of a user, and a given book in it (see MIGRATIONS)
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS reading_list_user_book
+        ON reading_list (user, book)
+    """,
+        # Readers and read count of a book
+        """
+        CREATE INDEX IF NOT EXISTS reading_list_book_status
+        ON reading_list (book, reading_status)
+    """,
+        # Changes to the reading list of a user, for the delta sync
+        """
+        CREATE INDEX IF NOT EXISTS reading_list_user_updated_at
+        ON reading_list (user, updated_at)
+    """,
+        # Books of a user with a given status, by last update
+        """
+        CREATE INDEX IF NOT EXISTS reading_list_user_status_updated_at
+        ON reading_list (user, reading_status, updated_at)
+    """,
+        """
+        CREATE INDEX IF NOT EXISTS reading_list_tombstones_user_deleted_at
+        ON reading_list_tombstones (user, deleted_at)
+    """,
+        # Books of a genre by id
+        """
+        CREATE INDEX IF NOT EXISTS books_genre ON books (genre)
+    """,
+        # Sorts of the catalog, filtered by genre or author (see BOOK_SORTS).
+        # The books of an author are few enough to be sorted after the lookup.
+        """
+        CREATE INDEX IF NOT EXISTS books_reads ON books (reads)
+    """,
+        """
+        CREATE INDEX IF NOT EXISTS books_title ON books (title)
+    """,
+        """
+        CREATE INDEX IF NOT EXISTS books_genre_reads ON books (genre, reads)
+    """,
+        """
+        CREATE INDEX IF NOT EXISTS books_genre_title ON books (genre, title)
+    """,
+        """
+        CREATE INDEX IF NOT EXISTS books_author_reads ON books (author, reads)
+    """,
+        """
+        CREATE INDEX IF NOT EXISTS users_username ON users (username)
+    """,
+        # Books the most users are reading (see MIGRATIONS)
+        """
+        CREATE INDEX IF NOT EXISTS book_stats_started ON book_stats (started)
+    """,
+    ):
+        conn.execute(index)
+
+
+@instrumented
+def create_catalog_version_triggers(conn: sqlite3.Connection):
+    """
+    Creates the triggers bumping the catalog version on every book write
+    and on every reading list write that changes a book's read count.
+    """
+    for trigger in (
+        """
+        CREATE TRIGGER IF NOT EXISTS books_insert_version
+        AFTER INSERT ON books
+        BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER IF NOT EXISTS books_update_version
+        AFTER UPDATE ON books
+        BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER IF NOT EXISTS books_delete_version
+        AFTER DELETE ON books
+        BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER IF NOT EXISTS reading_list_insert_version
+        AFTER INSERT ON reading_list
+        WHEN NEW.reading_status = 'complete'
+        BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER IF NOT EXISTS reading_list_update_version
+        AFTER UPDATE OF reading_status ON reading_list
+        WHEN (OLD.reading_status = 'complete') <> (NEW.reading_status = 'complete')
+        BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END
+    """,
+        """
+        CREATE TRIGGER IF NOT EXISTS reading_list_delete_version
+        AFTER DELETE ON reading_list
+        WHEN OLD.reading_status = 'complete'
+        BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END
+    """,
+    ):
+        conn.execute(trigger)
+
+
+@instrumented
 def drop_tables(conn: sqlite3.Connection):
     """
     Drops the tables from the database. Not used in the application.
     """
     logging.info("Dropping tables")
+    conn.execute(
+        """
+        DROP VIEW IF EXISTS catalog
+    """
+    )
     conn.execute(
         """
         DROP TABLE IF EXISTS books
     """
     )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS authors
+    """
+    )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS genres
+    """
+    )
     conn.execute(
         """
         DROP TABLE IF EXISTS users
@@ -112,53 +679,114 @@ def drop_tables(conn: sqlite3.Connection):
         DROP TABLE IF EXISTS reading_list
     """
     )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS catalog_version
+    """
+    )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS reading_list_tombstones
+    """
+    )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS book_stats
+    """
+    )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS genre_stats
+    """
+    )
+    conn.execute(
+        """
+        DROP TABLE IF EXISTS daily_completions
+    """
+    )
+    conn.execute("PRAGMA user_version = 0")
     conn.commit()
     logging.info("Tables dropped")
 
 
+@instrumented
 def create_book(title, author, genre, conn: sqlite3.Connection):
     """
-    Creates a new book in the database.
+    Creates a new book in the database, and its author and genre if they
+    are new. Returns the id of the book.
     """
     logging.info(f"Database: Creating book: {title}")
 
     conn.execute(
+        """
+        INSERT INTO authors (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+        (author,),
+    )
+    conn.execute(
+        """
+        INSERT INTO genres (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+        (genre,),
+    )
+    cursor = conn.execute(
         """
         INSERT INTO books (title, author, genre)
-        VALUES (?, ?, ?)
+        SELECT ?, authors.id, genres.id FROM authors, genres
+        WHERE authors.name = ? AND genres.name = ?
+        RETURNING id
     """,
         (title, author, genre),
     )
+    book_id = cursor.fetchone()[0]
     conn.commit()
     logging.info(f"Database: Book created: {title}")
+    return book_id
 
 
-def get_books(start, n, conn: sqlite3.Connection):
+@instrumented
+def get_books(start, n, genre, author, sort, conn: sqlite3.Connection):
     """
-    Given an offset and a limit, returns a list of books.
+    Given an offset and a limit, returns a list of books with their read
+    count, only the ones of the genre and of the author when they are not
+    None, in one of the BOOK_SORTS orders.
     """
-    logging.info(f"Database: Getting books: {start} - {n}")
+    logging.info(
+        f"Database: Getting books: {start} - {n} of genre: {genre} "
+        f"and author: {author} by {sort}"
+    )
 
+    # Only column names and BOOK_SORTS clauses are formatted into the query.
+    # The names are looked up first, then the books by their integer keys.
+    filters = {
+        column: value
+        for column, value in (("genre", genre), ("author", author))
+        if value is not None
+    }
+    where = " AND ".join(f"{column} = ?" for column in filters)
     cursor = conn.execute(
-        """
-        SELECT * FROM books LIMIT ? OFFSET ?
-    """,
-        (n, start),
+        f"""
+        SELECT id, title, author, genre, reads FROM catalog
+        WHERE {where or "TRUE"}
+        ORDER BY {BOOK_SORTS[sort]} LIMIT ? OFFSET ?
+    """,  # nosec B608
+        (*filters.values(), n, start),
     )
     books = cursor.fetchall()
     logging.info(f"Database: {len(books)} books found")
     return books
 
 
+@instrumented
 def get_genres(conn: sqlite3.Connection):
     """
-    Returns the list of all genres in the database.
+    Returns the list of the genres of the books in the database.
     """
     logging.info("Getting genres")
 
     cursor = conn.execute(
         """
-        SELECT DISTINCT genre FROM books
+        SELECT name FROM genres WHERE books > 0 ORDER BY name
     """
     )
     genres = cursor.fetchall()
@@ -166,6 +794,7 @@ def get_genres(conn: sqlite3.Connection):
     return [genre[0] for genre in genres]
 
 
+@instrumented
 def get_book(book_id, conn: sqlite3.Connection):
     """
     Returns the book with the given ID.
@@ -174,23 +803,60 @@ def get_book(book_id, conn: sqlite3.Connection):
 
     cursor = conn.execute(
         """
-        SELECT * FROM books WHERE id = ?
+        SELECT * FROM catalog WHERE id = ?
     """,
         (book_id,),
     )
     book = cursor.fetchone()
-    logging.info(f"Database: Book found: {book[1]}")
+    if book:
+        logging.info(f"Database: Book found: {book[1]}")
     return book
 
 
+@instrumented
+def get_existing_book_ids(book_ids, conn: sqlite3.Connection):
+    """
+    Given a list of book ids, returns the set of the ones that exist.
+    """
+    cursor = conn.execute(
+        """
+        SELECT id FROM books WHERE id IN (SELECT value FROM json_each(?))
+    """,
+        (json.dumps(book_ids),),
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+@instrumented
+def get_books_by_ids(book_ids, conn: sqlite3.Connection):
+    """
+    Given a list of book ids, returns the ones that exist with their read
+    count, in no particular order.
+    """
+    logging.info(f"Database: Getting {len(book_ids)} books by id")
+
+    cursor = conn.execute(
+        """
+        SELECT id, title, author, genre, reads FROM catalog
+        WHERE id IN (SELECT value FROM json_each(?))
+    """,
+        (json.dumps(book_ids),),
+    )
+    books = cursor.fetchall()
+    logging.info(f"Database: {len(books)} books found")
+    return books
+
+
+@instrumented
 def get_book_count(conn: sqlite3.Connection):
     """
-    Returns the total number of books in the database.
+    Returns the total number of books in the database, from the book counts
+    of the genres.
     """
     logging.info("Getting book count")
     cursor = conn.execute(
         """
-        SELECT COUNT(*) FROM books
+        SELECT COALESCE(SUM(books), 0) FROM genres
     """
     )
     count = cursor.fetchone()
@@ -198,68 +864,130 @@ def get_book_count(conn: sqlite3.Connection):
     return count[0]
 
 
-def search_book_by_title(title, conn: sqlite3.Connection):
+@instrumented
+def get_catalog_version(conn: sqlite3.Connection):
     """
-    Given a title, returns a list of books that contain the title (case insensitive).
+    Returns the current catalog version as an opaque string.
+    It changes every time a book or a book's read count changes.
     """
-    logging.info(f"Database: Searching book: {title}")
     cursor = conn.execute(
         """
-        SELECT * FROM books WHERE title LIKE ?
+        SELECT epoch || '-' || version FROM catalog_version WHERE id = 1
+    """
+    )
+    version = cursor.fetchone()
+    return version[0]
+
+
+@instrumented
+def search_book_by_title(title, start, n, conn: sqlite3.Connection):
+    """
+    Given a title, an offset and a limit, returns a list of books that contain
+    the title (case insensitive), by id.
+    The scan stops once the books of the page are found.
+    """
+    logging.info(f"Database: Searching book: {title}: {start} - {n}")
+    cursor = conn.execute(
+        """
+        SELECT * FROM catalog WHERE title LIKE ?
+        ORDER BY id LIMIT ? OFFSET ?
     """,
-        (f"%{title}%",),
+        (f"%{title}%", n, start),
     )
     books = cursor.fetchall()
     logging.info(f"Database: {len(books)} books found")
     return books
 
 
-def get_books_by_genre(genre, conn: sqlite3.Connection):
+@instrumented
+def count_title_matches(title, sample, conn: sqlite3.Connection):
     """
-    Given a genre, returns a list of books that belong to the genre.
+    Given a title and a sample size, returns the number of books among the
+    first `sample` ones that contain the title (case insensitive).
     """
-    logging.info(f"Database: Getting books by genre: {genre}")
     cursor = conn.execute(
         """
-        SELECT * FROM books WHERE genre = ?
+        SELECT COUNT(*) FROM (SELECT title FROM books ORDER BY id LIMIT ?)
+        WHERE title LIKE ?
     """,
-        (genre,),
+        (sample, f"%{title}%"),
     )
-    books = cursor.fetchall()
-    logging.info(f"Database: {len(books)} books found")
-    return books
+    return cursor.fetchone()[0]
+
+
+@instrumented
+def iter_books(conn: sqlite3.Connection, batch_size=500):
+    """
+    Yields all the books with their read count, in batches of rows.
+    Rows are fetched from the cursor as the caller consumes the batches,
+    so the whole table is never held in memory.
+    """
+    logging.info("Database: Exporting books")
+
+    cursor = conn.execute(
+        """
+        SELECT id, title, author, genre, reads FROM catalog ORDER BY id
+    """
+    )
+    while batch := cursor.fetchmany(batch_size):
+        yield batch
 
 
+@instrumented
 def update_book(book_id, title, author, genre, conn: sqlite3.Connection):
     """
-    Updates the book with the given ID. Not used in the application.
+    Updates the book with the given ID.
+    Returns False if the book does not exist.
     """
     logging.info(f"Database: Updating book: {book_id}")
 
     conn.execute(
+        """
+        INSERT INTO authors (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+        (author,),
+    )
+    conn.execute(
+        """
+        INSERT INTO genres (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+        (genre,),
+    )
+    cursor = conn.execute(
         """
         UPDATE books
-        SET title = ?, author = ?, genre = ?, updated_at = CURRENT_TIMESTAMP
+        SET title = ?,
+        author = (SELECT id FROM authors WHERE name = ?),
+        genre = (SELECT id FROM genres WHERE name = ?),
+        updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
+        RETURNING id
     """,
         (title, author, genre, book_id),
     )
+    updated = bool(cursor.fetchall())
     conn.commit()
-    logging.info(f"Database: Book updated: {title}")
+    if updated:
+        logging.info(f"Database: Book updated: {title}")
+    return updated
 
 
+@instrumented
 def delete_book(book_id, conn: sqlite3.Connection):
     """
-    Deletes the book with the given ID. Not used in the application.
+    Deletes the book with the given ID.
+    Returns False if the book does not exist.
     """
     logging.info(f"Database: Deleting book: {book_id}")
 
-    conn.execute(
+    cursor = conn.execute(
         """
         DELETE FROM books WHERE id = ?
+        RETURNING id
     """,
         (book_id,),
     )
+    deleted = bool(cursor.fetchall())
     conn.execute(
         """
         DELETE FROM reading_list WHERE book = ?
@@ -267,9 +995,12 @@ def delete_book(book_id, conn: sqlite3.Connection):
         (book_id,),
     )
     conn.commit()
-    logging.info(f"Database: Book deleted: {book_id}")
+    if deleted:
+        logging.info(f"Database: Book deleted: {book_id}")
+    return deleted
 
 
+@instrumented
 def create_user(username, password_hash, conn: sqlite3.Connection):
     """
     Creates a new user in the database.
@@ -287,6 +1018,7 @@ def create_user(username, password_hash, conn: sqlite3.Connection):
     logging.info(f"Database: User created: {username}")
 
 
+@instrumented
 def get_users(conn: sqlite3.Connection):
     """
     Returns the list of all users in the database. Not used in the application.
@@ -303,6 +1035,7 @@ def get_users(conn: sqlite3.Connection):
     return users
 
 
+@instrumented
 def get_user(user_id, conn: sqlite3.Connection):
     """
     Returns the user with the given ID.
@@ -321,6 +1054,7 @@ def get_user(user_id, conn: sqlite3.Connection):
     return user
 
 
+@instrumented
 def get_user_by_username(username, conn: sqlite3.Connection):
     """
     Returns the user with the given username.
@@ -339,6 +1073,7 @@ def get_user_by_username(username, conn: sqlite3.Connection):
     return user
 
 
+@instrumented
 def update_user(user_id, username, password_hash, conn: sqlite3.Connection):
     """
     Updates the user with the given ID. Not used in the application.
@@ -357,6 +1092,7 @@ def update_user(user_id, username, password_hash, conn: sqlite3.Connection):
     logging.info(f"Database: User updated: {username}")
 
 
+@instrumented
 def delete_user(user_id, conn: sqlite3.Connection):
     """
     Deletes the user with the given ID. Not used in the application.
@@ -379,6 +1115,7 @@ def delete_user(user_id, conn: sqlite3.Connection):
     logging.info(f"Database: User deleted: {user_id}")
 
 
+@instrumented
 def create_reading_list(
     user_id,
     book_id,
@@ -387,22 +1124,32 @@ def create_reading_list(
 ):
     """
     Given a user_id and a book_id, adds the book to user's library.
+    Returns the time it was added, or None if the book does not exist or is
+    already in the library.
     """
     logging.info(
         f"Database: Adding book to reading list: {book_id} for user: {user_id}"
     )
 
-    conn.execute(
+    cursor = conn.execute(
         """
         INSERT INTO reading_list (book, user, reading_status)
-        VALUES (?, ?, ?)
+        SELECT id, ?, ? FROM books WHERE id = ?
+        ON CONFLICT (user, book) DO NOTHING
+        RETURNING updated_at
     """,
-        (book_id, user_id, reading_status),
+        (user_id, reading_status, book_id),
     )
+    rows = cursor.fetchall()
     conn.commit()
-    logging.info(f"Database: Book added to reading list: {book_id} for user: {user_id}")
+    if rows:
+        logging.info(
+            f"Database: Book added to reading list: {book_id} for user: {user_id}"
+        )
+        return rows[0][0]
 
 
+@instrumented
 def get_reading_lists(user_id, conn: sqlite3.Connection):
     """
     Given a user_id, returns the list of books in the user's library.
@@ -411,7 +1158,7 @@ def get_reading_lists(user_id, conn: sqlite3.Connection):
 
     cursor = conn.execute(
         """
-        SELECT * FROM reading_list WHERE user = ?
+        SELECT * FROM reading_list WHERE user = ? ORDER BY book
     """,
         (user_id,),
     )
@@ -420,6 +1167,198 @@ def get_reading_lists(user_id, conn: sqlite3.Connection):
     return reading_lists
 
 
+@instrumented
+def iter_reading_list(user_id, conn: sqlite3.Connection, batch_size=500):
+    """
+    Given a user_id, yields the books in the user's library with their read
+    count and reading status, in batches of rows.
+    """
+    logging.info(f"Database: Exporting reading list for user: {user_id}")
+
+    cursor = conn.execute(
+        """
+        SELECT b.id, b.title, b.author, b.genre, b.reads, r.reading_status,
+        strftime('%Y-%m-%dT%H:%M:%S', r.updated_at)
+        FROM reading_list r JOIN catalog b ON b.id = r.book
+        WHERE r.user = ? ORDER BY r.id
+    """,
+        (user_id,),
+    )
+    while batch := cursor.fetchmany(batch_size):
+        yield batch
+
+
+@instrumented
+def iter_reading_list_page(
+    user_id, status, sort, after, n, conn: sqlite3.Connection, batch_size=500
+):
+    """
+    Given a user_id, yields in batches of rows the first n books of the
+    user's library with their read count, reading status and last update,
+    only the ones with the status when it is not None, in one of the
+    READING_LIST_SORTS orders. When `after` is not None, only the books
+    coming after its (updated_at, id) are returned.
+    """
+    logging.info(
+        f"Database: Getting {n} books of status: {status} by {sort} after {after} "
+        f"from reading list for user: {user_id}"
+    )
+
+    # Only the READING_LIST_SORTS clauses and constant filters are formatted
+    # into the query
+    order, comparison = READING_LIST_SORTS[sort]
+    filters, params = ["r.user = ?"], [user_id]
+    if status is not None:
+        filters.append("r.reading_status = ?")
+        params.append(status)
+    if after is not None:
+        filters.append(f"(r.updated_at, r.id) {comparison} (?, ?)")
+        params.extend(after)
+    cursor = conn.execute(
+        f"""
+        SELECT b.id, b.title, b.author, b.genre, b.reads, r.reading_status,
+        r.updated_at, r.id
+        FROM reading_list r JOIN catalog b ON b.id = r.book
+        WHERE {" AND ".join(filters)}
+        ORDER BY {order} LIMIT ?
+    """,  # nosec B608
+        (*params, n),
+    )
+    while batch := cursor.fetchmany(batch_size):
+        yield batch
+
+
+@instrumented
+def begin_write(conn: sqlite3.Connection):
+    """
+    Starts a write transaction, taking the database write lock at once: the
+    reads made until the commit see the state the writes apply to.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+
+
+@instrumented
+def get_reading_list_statuses(user_id, book_ids, conn: sqlite3.Connection):
+    """
+    Given a user_id and a list of book ids, returns the reading status of the
+    ones in the user's library, by book id.
+    """
+    logging.info(
+        f"Database: Getting status of {len(book_ids)} books for user: {user_id}"
+    )
+
+    cursor = conn.execute(
+        """
+        SELECT book, reading_status FROM reading_list
+        WHERE user = ? AND book IN (SELECT value FROM json_each(?))
+    """,
+        (user_id, json.dumps(book_ids)),
+    )
+    return dict(cursor.fetchall())
+
+
+@instrumented
+def apply_reading_list_changes(
+    user_id, inserts, updates, deletes, conn: sqlite3.Connection
+):
+    """
+    Given a user_id, adds the (book_id, status) inserts, applies the
+    (status, book_id) updates and removes the deleted book ids from the
+    user's library, in a single transaction.
+    """
+    logging.info(
+        f"Database: Applying {len(inserts)} inserts, {len(updates)} updates and "
+        f"{len(deletes)} deletes to reading list for user: {user_id}"
+    )
+
+    conn.executemany(
+        """
+        INSERT INTO reading_list (book, user, reading_status)
+        VALUES (?, ?, ?)
+        ON CONFLICT (user, book) DO NOTHING
+    """,
+        [(book_id, user_id, status) for book_id, status in inserts],
+    )
+    conn.executemany(
+        """
+        UPDATE reading_list
+        SET reading_status = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE book = ? AND user = ?
+    """,
+        [(status, book_id, user_id) for status, book_id in updates],
+    )
+    conn.executemany(
+        """
+        DELETE FROM reading_list WHERE book = ? AND user = ?
+    """,
+        [(book_id, user_id) for book_id in deletes],
+    )
+    conn.commit()
+    logging.info(f"Database: Reading list changes applied for user: {user_id}")
+
+
+@instrumented
+def get_reading_list_changes(user_id, since, conn: sqlite3.Connection):
+    """
+    Given a user_id and a timestamp, returns the books of the user's library
+    added or updated since then, with their read count, reading status and
+    last update.
+    """
+    logging.info(
+        f"Database: Getting reading list changes since {since} for user: {user_id}"
+    )
+
+    cursor = conn.execute(
+        """
+        SELECT b.id, b.title, b.author, b.genre, b.reads, r.reading_status, r.updated_at
+        FROM reading_list r JOIN catalog b ON b.id = r.book
+        WHERE r.user = ? AND r.updated_at >= ?
+    """,
+        (user_id, since),
+    )
+    changes = cursor.fetchall()
+    logging.info(f"Database: {len(changes)} changed books found")
+    return changes
+
+
+@instrumented
+def get_tombstones(user_id, since, conn: sqlite3.Connection):
+    """
+    Given a user_id and a timestamp, returns the ids of the books removed from
+    the user's library since then.
+    """
+    logging.info(f"Database: Getting removed books since {since} for user: {user_id}")
+
+    cursor = conn.execute(
+        """
+        SELECT DISTINCT book FROM reading_list_tombstones
+        WHERE user = ? AND deleted_at >= ?
+    """,
+        (user_id, since),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+@instrumented
+def purge_tombstones(before, conn: sqlite3.Connection):
+    """
+    Deletes the tombstones older than the given timestamp.
+    Returns the number of deleted tombstones.
+    """
+    logging.info(f"Database: Purging tombstones older than {before}")
+
+    cursor = conn.execute(
+        """
+        DELETE FROM reading_list_tombstones WHERE deleted_at < ?
+    """,
+        (before,),
+    )
+    conn.commit()
+    logging.info(f"Database: {cursor.rowcount} tombstones purged")
+    return cursor.rowcount
+
+
+@instrumented
 def get_book_in_reading_list(user_id, book_id, conn: sqlite3.Connection):
     """
     Given a user_id and a book_id, returns the book in user's library.
@@ -440,6 +1379,7 @@ def get_book_in_reading_list(user_id, book_id, conn: sqlite3.Connection):
     return book
 
 
+@instrumented
 def get_completed_books(user_id, conn: sqlite3.Connection):
     """
     Given a user_id, returns the list of books that the user has completed.
@@ -458,6 +1398,7 @@ def get_completed_books(user_id, conn: sqlite3.Connection):
     return completed_books
 
 
+@instrumented
 def get_readers(book_id, conn: sqlite3.Connection):
     """
     Given a book_id, returns the list of users who have added the book to their library.
@@ -475,6 +1416,7 @@ def get_readers(book_id, conn: sqlite3.Connection):
     return readers
 
 
+@instrumented
 def get_book_read_count(book_id, conn: sqlite3.Connection):
     """
     Given a book_id, returns the number of users who have completed the book.
@@ -483,36 +1425,110 @@ def get_book_read_count(book_id, conn: sqlite3.Connection):
 
     cursor = conn.execute(
         """
-        SELECT COUNT(*) FROM reading_list WHERE book = ?
-        AND reading_status = 'complete'
+        SELECT reads FROM books WHERE id = ?
     """,
         (book_id,),
     )
-    count = cursor.fetchone()
+    count = cursor.fetchone() or (0,)
     logging.info(f"Database: {count[0]} readers found")
     return count[0]
 
 
+@instrumented
+def get_status_totals(conn: sqlite3.Connection):
+    """
+    Returns the number of reading list entries of each status, as a
+    (not_started, started, complete) tuple, from the genre rollups.
+    """
+    cursor = conn.execute(
+        """
+        SELECT COALESCE(SUM(not_started), 0), COALESCE(SUM(started), 0),
+        COALESCE(SUM(complete), 0)
+        FROM genre_stats
+    """
+    )
+    return cursor.fetchone()
+
+
+@instrumented
+def get_genre_stats(conn: sqlite3.Connection):
+    """
+    Returns the name and the number of reading list entries of each status
+    of the genres having books, by name.
+    """
+    cursor = conn.execute(
+        """
+        SELECT genres.name, s.not_started, s.started, s.complete
+        FROM genre_stats s JOIN genres ON genres.id = s.genre
+        WHERE genres.books > 0 ORDER BY genres.name
+    """
+    )
+    return cursor.fetchall()
+
+
+@instrumented
+def get_daily_completions(since, conn: sqlite3.Connection):
+    """
+    Given a day (YYYY-MM-DD), returns the (day, completions) of the days
+    since then having books completed, and still complete, by day.
+    """
+    cursor = conn.execute(
+        """
+        SELECT day, completions FROM daily_completions
+        WHERE day >= ? AND completions > 0 ORDER BY day
+    """,
+        (since,),
+    )
+    return cursor.fetchall()
+
+
+@instrumented
+def get_trending_books(n, conn: sqlite3.Connection):
+    """
+    Returns the n books the most users are reading, with their read count
+    and their number of readers.
+    """
+    logging.info(f"Database: Getting {n} trending books")
+
+    cursor = conn.execute(
+        """
+        SELECT c.id, c.title, c.author, c.genre, c.reads, s.started
+        FROM book_stats s JOIN catalog c ON c.id = s.book
+        WHERE s.started > 0
+        ORDER BY s.started DESC, s.book DESC LIMIT ?
+    """,
+        (n,),
+    )
+    return cursor.fetchall()
+
+
+@instrumented
 def remove_from_reading_list(user_id, book_id, conn: sqlite3.Connection):
     """
     Given a user_id and a book_id, removes the book from user's library.
+    Returns False if the book was not in the library.
     """
     logging.info(
         f"Database: Removing book: {book_id} from reading list for user: {user_id}"
     )
 
-    conn.execute(
+    cursor = conn.execute(
         """
         DELETE FROM reading_list WHERE book = ? AND user = ?
+        RETURNING id
     """,
         (book_id, user_id),
     )
+    removed = bool(cursor.fetchall())
     conn.commit()
-    logging.info(
-        f"Database: Book removed: {book_id} from reading list for user: {user_id}"
-    )
+    if removed:
+        logging.info(
+            f"Database: Book removed: {book_id} from reading list for user: {user_id}"
+        )
+    return removed
 
 
+@instrumented
 def update_reading_status(
     user_id,
     book_id,
@@ -522,22 +1538,28 @@ def update_reading_status(
     """
     Given a user_id, a book_id, and a reading_status, updates the reading status
     of the book in user's library.
+    Returns the time of the update, or None if the book is not in the library
+    or already has this status, in which case nothing is written.
     """
     logging.info(
         f"Database: Updating reading status: {reading_status} for book:"
         f"{book_id} in reading list for user: {user_id}"
     )
 
-    conn.execute(
+    cursor = conn.execute(
         """
         UPDATE reading_list
         SET reading_status = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE book = ? AND user = ?
+        WHERE book = ? AND user = ? AND reading_status <> ?
+        RETURNING updated_at
     """,
-        (reading_status, book_id, user_id),
+        (reading_status, book_id, user_id, reading_status),
     )
+    rows = cursor.fetchall()
     conn.commit()
-    logging.info(
-        f"Database: Reading status updated: {reading_status} for book:"
-        f"{book_id} in reading list for user: {user_id}"
-    )
+    if rows:
+        logging.info(
+            f"Database: Reading status updated: {reading_status} for book:"
+            f"{book_id} in reading list for user: {user_id}"
+        )
+        return rows[0][0]
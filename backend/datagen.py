@@ -0,0 +1,274 @@
+"""
+This module contains the synthetic dataset generator used for scale testing.
+
+It bulk-loads books, users and reading lists into a SQLite database with
+production-like distributions: a few genres and prolific authors hold most
+of the catalog, a few books are read by most users and reading list sizes
+have a long tail. The output only depends on the seed.
+
+    poetry run python -m backend.datagen --db bench.sqlite3 --books 100000 \\
+        --users 5000 --reads-per-user 20
+"""
+
+import argparse
+import logging
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from . import database
+from .service import Hasher
+
+GENRES = {
+    "Fiction": 18,
+    "Mystery": 10,
+    "Romance": 10,
+    "Fantasy": 9,
+    "Science Fiction": 8,
+    "Thriller": 8,
+    "Historical Fiction": 6,
+    "Young Adult": 6,
+    "Biography": 4,
+    "Horror": 4,
+    "Non-Fiction": 4,
+    "Adventure": 3,
+    "Classics": 3,
+    "Dystopian": 2,
+    "Self-Help": 2,
+    "History": 2,
+    "Poetry": 1,
+    "Philosophy": 1,
+    "Graphic Novel": 1,
+    "Drama": 1,
+}
+FIRST_NAMES = (
+    "Ada Alan Alice Amara Anna Arthur Ben Chloe Clara Daniel David Elena Emma "
+    "Ethan Felix George Grace Hana Henry Iris Isaac Jack James Julia Kai Laura "
+    "Leo Lina Lucas Maya Mia Noah Nora Oliver Omar Paul Priya Rosa Sam Sara "
+    "Sofia Theo Victor Yara Yusuf Zoe"
+).split()
+LAST_NAMES = (
+    "Abbott Ahmed Baker Brown Carter Chen Clarke Cohen Davis Diaz Evans Fischer "
+    "Garcia Gray Hall Hughes Ito Jensen Khan Kim Lee Lopez Martin Miller Moore "
+    "Morgan Murphy Nakamura Novak Okafor Park Patel Quinn Reed Rossi Santos "
+    "Silva Smith Stone Taylor Tanaka Walker Ward Weber White Wilson Young"
+).split()
+ADJECTIVES = (
+    "Silent Hidden Last Broken Golden Burning Distant Forgotten Crimson Endless "
+    "Secret Wild Quiet Lost Frozen Shattered Midnight Fallen Bright Hollow"
+).split()
+NOUNS = (
+    "River Garden Kingdom Shadow Promise Letter Island City Mirror Storm Crown "
+    "Heart Road House Orchard Station Winter Song Empire Lighthouse"
+).split()
+PLACES = (
+    "Avalon Bramblewood Cairo Dunmore Eldham Florence Glasgow Havana Istanbul "
+    "Kyoto Lisbon Marrakesh Oslo Prague Quebec Riverton Samarkand Tangier Vienna"
+).split()
+TITLE_TEMPLATES = (
+    "The {adjective} {noun}",
+    "{noun} of {place}",
+    "The {noun} of {place}",
+    "A {adjective} {noun}",
+    "{adjective} {noun}s",
+    "The {place} {noun}",
+)
+# Share of each status in the reading lists
+STATUSES = {"not_started": 35, "started": 20, "complete": 45}
+# Zipf exponents of the book popularity and of the author output
+BOOK_POPULARITY_EXPONENT = 1.07
+AUTHOR_OUTPUT_EXPONENT = 0.9
+# Most books of an author are in the author's primary genre
+PRIMARY_GENRE_SHARE = 0.8
+# Password of every generated user
+DEFAULT_PASSWORD = "password"  # nosec B105
+
+
+def zipf_weights(n, exponent):
+    """
+    Returns the cumulative Zipf weights of n ranks, for random.choices.
+    """
+    return list(accumulate(1 / rank**exponent for rank in range(1, n + 1)))
+
+
+def _title(rng):
+    template = rng.choice(TITLE_TEMPLATES)
+    return template.format(
+        adjective=rng.choice(ADJECTIVES),
+        noun=rng.choice(NOUNS),
+        place=rng.choice(PLACES),
+    )
+
+
+def _timestamp(rng, now, days):
+    moment = now - timedelta(seconds=rng.randrange(days * 86400))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def generate_books(conn: sqlite3.Connection, n, rng: random.Random):
+    """
+    Inserts n books. Authors get a primary genre and a Zipf distributed
+    number of books, so a few prolific authors write a large share.
+    """
+    genres = list(GENRES)
+    n_authors = max(1, n // 6)
+    authors = [
+        (
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            rng.choices(genres, weights=list(GENRES.values()))[0],
+        )
+        for _ in range(n_authors)
+    ]
+    author_weights = zipf_weights(n_authors, AUTHOR_OUTPUT_EXPONENT)
+
+    def rows():
+        for author, primary_genre in rng.choices(
+            authors, cum_weights=author_weights, k=n
+        ):
+            genre = primary_genre
+            if rng.random() > PRIMARY_GENRE_SHARE:
+                genre = rng.choices(genres, weights=list(GENRES.values()))[0]
+            yield _title(rng), author, genre
+
+    conn.executemany(
+        """
+        INSERT INTO authors (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+        ((author,) for author, _ in authors),
+    )
+    conn.executemany(
+        """
+        INSERT INTO genres (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+        ((genre,) for genre in genres),
+    )
+    conn.executemany(
+        """
+        INSERT INTO books (title, author, genre)
+        SELECT ?, authors.id, genres.id FROM authors, genres
+        WHERE authors.name = ? AND genres.name = ?
+    """,
+        rows(),
+    )
+
+
+def generate_users(conn: sqlite3.Connection, n, password_hash, first_id=1):
+    """
+    Inserts n users named user{id}, expecting their ids to start at first_id.
+    They share the same password hash: hashing once keeps bcrypt out of the
+    load time.
+    """
+    conn.executemany(
+        """
+        INSERT INTO users (username, password_hash) VALUES (?, ?)
+    """,
+        ((f"user{first_id + i}", password_hash) for i in range(n)),
+    )
+
+
+def generate_reading_lists(
+    conn: sqlite3.Connection, user_ids, book_ids, reads_per_user, rng: random.Random
+):
+    """
+    Inserts the reading lists of the given users. List sizes follow a Pareto
+    distribution with the given mean and books are picked with a Zipf
+    distributed popularity, in a random order of the catalog.
+    """
+    book_ids = list(book_ids)
+    rng.shuffle(book_ids)
+    popularity = zipf_weights(len(book_ids), BOOK_POPULARITY_EXPONENT)
+    statuses = list(STATUSES)
+    status_weights = list(STATUSES.values())
+    now = datetime.now().replace(microsecond=0)
+
+    def rows():
+        for user_id in user_ids:
+            # Pareto with alpha 2 has a mean of twice its scale
+            size = int(rng.paretovariate(2) * reads_per_user / 2)
+            size = min(size, len(book_ids))
+            books = set()
+            while len(books) < size:
+                books.update(
+                    rng.choices(book_ids, cum_weights=popularity, k=size - len(books))
+                )
+            for book_id in books:
+                updated_at = _timestamp(rng, now, 365)
+                yield (
+                    book_id,
+                    user_id,
+                    rng.choices(statuses, weights=status_weights)[0],
+                    updated_at,
+                    updated_at,
+                )
+
+    conn.executemany(
+        """
+        INSERT INTO reading_list
+        (book, user, reading_status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+        rows(),
+    )
+
+
+def generate(
+    conn: sqlite3.Connection,
+    books,
+    users,
+    reads_per_user=20,
+    seed=42,
+    password=DEFAULT_PASSWORD,
+):
+    """
+    Creates the tables if needed and adds the generated books, users and
+    reading lists in a single transaction. Returns the number of rows added
+    to each table.
+    """
+    rng = random.Random(seed)  # nosec B311
+    database.create_tables(conn)
+    # The database can be rebuilt from the seed, durability is not needed
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+
+    first_book = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+    first_user = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+    generate_books(conn, books, rng)
+    generate_users(conn, users, Hasher.password_hash(password), first_user + 1)
+    book_ids = range(1, first_book + books + 1)
+    user_ids = range(first_user + 1, first_user + users + 1)
+    before = conn.execute("SELECT COUNT(*) FROM reading_list").fetchone()[0]
+    generate_reading_lists(conn, user_ids, book_ids, reads_per_user, rng)
+    after = conn.execute("SELECT COUNT(*) FROM reading_list").fetchone()[0]
+    conn.commit()
+    return {"books": books, "users": users, "reading_list": after - before}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset.")
+    parser.add_argument("--db", required=True, help="SQLite database to fill")
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument(
+        "--reads-per-user",
+        type=int,
+        default=20,
+        help="Mean size of the reading lists",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--password", default=DEFAULT_PASSWORD, help="Password of every generated user"
+    )
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    conn = sqlite3.connect(args.db)
+    counts = generate(
+        conn, args.books, args.users, args.reads_per_user, args.seed, args.password
+    )
+    conn.close()
+    print(", ".join(f"{count} {table} rows" for table, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
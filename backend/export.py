@@ -0,0 +1,66 @@
+"""
+This module contains the encoders used to stream data exports.
+"""
+
+import csv
+import io
+
+import orjson
+
+from .models import ExportFormat
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def to_ndjson(batches, columns):
+    """
+    Encodes batches of rows as newline delimited JSON objects.
+    Yields one chunk per batch.
+    """
+    for batch in batches:
+        yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+
+def to_csv(batches, columns):
+    """
+    Encodes batches of rows as CSV, starting with a header line.
+    Yields one chunk per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+
+
+def to_json_page(batches, columns, key):
+    """
+    Encodes (rows, next cursor) batches as a JSON object holding the list of
+    rows under `key` and the cursor of the last batch as "next_cursor".
+    Yields one chunk per batch.
+    """
+    yield b'{"' + key.encode() + b'":['
+    separator, next_cursor = b"", None
+    for batch, next_cursor in batches:
+        if batch:
+            yield separator + b",".join(
+                orjson.dumps(dict(zip(columns, row))) for row in batch
+            )
+            separator = b","
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b"}"
+
+
+def encode(batches, columns, fmt: ExportFormat):
+    """
+    Returns the encoded chunks for the given format.
+    """
+    if fmt == ExportFormat.csv:
+        return to_csv(batches, columns)
+    return to_ndjson(batches, columns)
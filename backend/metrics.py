@@ -0,0 +1,272 @@
+"""
+This module contains the in-process metrics of the application and their
+rendering in the Prometheus text format.
+
+Metrics are plain dictionaries of numbers updated without locks. Under the
+GIL an update can only be lost if two threads update the same sample at the
+exact same time, which is acceptable for monitoring and much cheaper than
+taking a lock on every request and query.
+"""
+
+import functools
+import inspect
+from bisect import bisect_left
+from time import perf_counter
+
+# Upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self.values.get(label_values, 0)
+
+    def samples(self):
+        # A copy: the handlers add samples while the metrics are rendered
+        for label_values, value in list(self.values.items()):
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, optionally split by labels.
+    """
+
+    type = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Counter):
+    """
+    Latency histogram with fixed buckets, optionally split by labels.
+    Each sample stores one count per bucket, the +Inf count and the sum.
+    """
+
+    type = "histogram"
+
+    def observe(self, seconds, *label_values):
+        counts = self.values.get(label_values)
+        if counts is None:
+            counts = self.values.setdefault(label_values, [0] * (len(BUCKETS) + 2))
+        counts[bisect_left(BUCKETS, seconds)] += 1
+        counts[-1] += seconds
+
+    def get(self, *label_values):
+        counts = self.values.get(label_values)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        for label_values, counts in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels}", cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels}", counts[-1]
+            yield f"{self.name}_count{labels}", cumulative
+
+
+class HitRatio:
+    """
+    Gauge derived from a cache counter with a "cache" and a "result" label.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, description, counter: Counter):
+        self.name = name
+        self.description = description
+        self.counter = counter
+
+    def samples(self):
+        caches = {label_values[0] for label_values in list(self.counter.values)}
+        for cache in sorted(caches):
+            hits = self.counter.get(cache, "hit")
+            total = hits + self.counter.get(cache, "miss")
+            yield self.name + _format_labels(("cache",), (cache,)), hits / total
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code.",
+    ("method", "route", "status"),
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ("method", "route"),
+)
+DB_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Latency of the functions of the database module.",
+    ("function",),
+)
+DB_CONNECTIONS = Counter(
+    "db_connections_opened_total",
+    "SQLite connections opened by the application.",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+CACHE_HIT_RATIO = HitRatio(
+    "cache_hit_ratio",
+    "Share of cache lookups that were hits.",
+    CACHE_REQUESTS,
+)
+BCRYPT_QUEUE = Gauge(
+    "bcrypt_queue_depth",
+    "Password hashes and verifications running or waiting for a CPU.",
+)
+SSE_SUBSCRIBERS = Gauge(
+    "sse_subscribers",
+    "Clients connected to the /reads/stream changefeed.",
+)
+
+REGISTRY: tuple[Counter | HitRatio, ...] = (
+    HTTP_REQUESTS,
+    HTTP_LATENCY,
+    DB_LATENCY,
+    DB_CONNECTIONS,
+    CACHE_REQUESTS,
+    CACHE_HIT_RATIO,
+    BCRYPT_QUEUE,
+    SSE_SUBSCRIBERS,
+)
+
+
+def render() -> str:
+    """
+    Renders all the metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(f"{name} {value}" for name, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+_DONE = object()
+
+
+def timed(func):
+    """
+    Decorator recording the latency of a database function.
+    For generator functions the time spent producing all the items is recorded.
+    """
+    name = func.__name__
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            elapsed = 0.0
+            iterator = func(*args, **kwargs)
+            try:
+                while True:
+                    start = perf_counter()
+                    item = next(iterator, _DONE)
+                    elapsed += perf_counter() - start
+                    if item is _DONE:
+                        return
+                    yield item
+            finally:
+                iterator.close()
+                DB_LATENCY.observe(elapsed, name)
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(perf_counter() - start, name)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status code of every request,
+    labelled by route template (e.g. /api/books/genre) to keep the number of
+    samples bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = None
+
+    def route_path(self, scope):
+        if route := scope.get("route"):
+            return route.path
+        if self.routes is None and "app" in scope:
+            self.routes = {
+                getattr(route, "endpoint", None): route.path
+                for route in scope["app"].routes
+            }
+        return (self.routes or {}).get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self.route_path(scope)
+            HTTP_LATENCY.observe(perf_counter() - start, scope["method"], route)
+            HTTP_REQUESTS.inc(scope["method"], route, str(status))
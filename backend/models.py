@@ -2,8 +2,9 @@
 This module contains the pydantic schemas to represent data
 """
 
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
+from typing import Any
 
 from pydantic import BaseModel
 
@@ -15,6 +16,26 @@ class StatusEnum(str, Enum):
     complete = "complete"
 
 
+# Enum for the file formats of the /export endpoints
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+# Enum for the sort orders of the /books endpoint
+class CatalogSort(str, Enum):
+    popular = "popular"
+    # Named title_ since a title member would override str.title
+    title_ = "title"
+    recent = "recent"
+
+
+# Enum for the sort orders of the /reads pages, by last update
+class ReadsSort(str, Enum):
+    recent = "recent"
+    oldest = "oldest"
+
+
 # Model to represent a book. Used for book related endpoints
 class Book(BaseModel):
     id: int
@@ -24,6 +45,32 @@ class Book(BaseModel):
     reads: int | None = None
 
 
+# Model for a page of search results. Used for /search?limit=
+class SearchPage(BaseModel):
+    books: list[Book]
+    next_cursor: str | None = None
+    total_estimate: int | None = None
+
+
+# Enum for the kinds of texts suggested by the /search/suggest endpoint
+class SuggestionKind(str, Enum):
+    title_ = "title"
+    author = "author"
+
+
+# Model for a completion of a search. Used for the /search/suggest endpoint
+class Suggestion(BaseModel):
+    text: str
+    kind: SuggestionKind
+    reads: int
+
+
+# Model for books looked up by id. Used for the /books/batch endpoint
+class BookBatch(BaseModel):
+    books: list[Book]
+    missing: list[int]
+
+
 # Model to manage pagination of books
 class Books(BaseModel):
     books: list[Book]
@@ -65,7 +112,98 @@ class EditReadingList(BaseModel):
     status: StatusEnum | None = None
 
 
+# Enum for the operations of the /reads/batch endpoint
+class BatchAction(str, Enum):
+    add = "add"
+    update = "update"
+    remove = "remove"
+
+
+# Model for one operation on a user's library. Used for the /reads/batch endpoint
+class ReadingListOperation(BaseModel):
+    action: BatchAction
+    book_id: int
+    status: StatusEnum | None = None
+
+
+# Model for the result of one operation. Used for the /reads/batch endpoint
+class ReadingListOperationResult(BaseModel):
+    action: BatchAction
+    book_id: int
+    status_code: int
+    detail: str
+
+
+# Model for one GET request of the /batch endpoint, e.g. /api/books?start=15
+class SubRequest(BaseModel):
+    path: str
+    params: dict[str, str | int] = {}
+
+
+# Model for the response to one request of the /batch endpoint
+class SubResponse(BaseModel):
+    path: str
+    status_code: int
+    body: Any
+
+
 # Model to represent a book in a user's reading list. Used for /reads endpoint
 class MyRead(Book):
     status: StatusEnum
     updated_at: datetime
+
+
+# Model for a page of a reading list. Used for /reads?limit=
+class ReadsPage(BaseModel):
+    books: list[MyRead]
+    next_cursor: str | None = None
+
+
+# Model for the changes of a reading list since a cursor. Used for /reads?since=
+class ReadingListChanges(BaseModel):
+    changed: list[MyRead]
+    removed: list[int]
+    cursor: str
+
+
+# Model for the reading list entries of each status. Used for the /stats endpoint
+class StatusCounts(BaseModel):
+    not_started: int
+    started: int
+    complete: int
+    completion_rate: float
+
+
+# Model for the reading list entries of a genre. Used for the /stats endpoint
+class GenreStats(StatusCounts):
+    genre: str
+
+
+# Model for the books completed on a day. Used for the /stats endpoint
+class DailyCompletions(BaseModel):
+    day: date
+    completions: int
+
+
+# Model for a book and its current readers. Used for the /stats endpoint
+class TrendingBook(Book):
+    readers: int
+
+
+# Model for the catalog statistics. Used for the /stats endpoint
+class Stats(BaseModel):
+    statuses: StatusCounts
+    genres: list[GenreStats]
+    daily_completions: list[DailyCompletions]
+    trending: list[TrendingBook]
+
+
+# Model to represent a statement of the slow query log. Used for /admin/slow-queries
+class SlowQuery(BaseModel):
+    fingerprint: str
+    function: str
+    calls: int
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+    plan: list[str]
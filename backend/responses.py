@@ -0,0 +1,31 @@
+"""
+This module contains the custom response classes used by the API.
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj):
+    """
+    Serializes the pydantic models that orjson does not handle natively.
+    Models are built from trusted database rows, so their fields are dumped
+    as they are, without going through pydantic's serializer.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+    Returning it from a route skips FastAPI's response model validation and
+    `jsonable_encoder`, so it should only wrap data built by the service layer.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
@@ -2,11 +2,35 @@
 This module contains the FastAPI router that defines the API endpoints.
 """
 
-from fastapi import APIRouter, Depends
-
-from . import models, security, service
+import functools
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi import status as http_status
+from fastapi.responses import StreamingResponse
+
+from . import (
+    caching,
+    changefeed,
+    export,
+    metrics,
+    models,
+    security,
+    service,
+    slowlog,
+)
+from .const import (
+    BATCH_MAX_REQUESTS,
+    BOOKS_MAX_PAGE_SIZE,
+    READS_MAX_PAGE_SIZE,
+    SEARCH_MAX_RESULTS,
+    STATS_MAX_DAYS,
+    SUGGEST_TOP_K,
+)
+from .responses import FastJSONResponse
 
 router = APIRouter(prefix="/api")
+# Ids are SQLite integers, of 64 bits
+MAX_ID = 2**63 - 1
 
 
 # Auth routes
@@ -42,61 +66,213 @@ def me(user_id: int = Depends(security.get_user)) -> models.User:
     library and the number of books read.
     """
 
-    reading_list = service.ReadingList(user_id)
+    return _user_details(user_id, service.ReadingList(user_id))
+
+
+def _user_details(user_id, reading_list: service.ReadingList) -> models.User:
     user = service.User.get_user(user_id)
     user.total_books = len(reading_list.books)
     user.reads = len(reading_list.read_books())
     return user
 
 
+def _catalog_response(request: Request, build, catalog=None) -> Response:
+    """
+    Serves a catalog route with ETag revalidation.
+    `build` is only called when the client does not have the current version.
+    The version is read before building the body, so a concurrent write can
+    only make the ETag older than the body, never newer. Bodies built from
+    the catalog snapshot get the version of the snapshot.
+    """
+    version = catalog.version if catalog else service.Book.get_catalog_version()
+    etag = caching.catalog_etag(version, request)
+    if caching.is_fresh(request, etag):
+        metrics.CACHE_REQUESTS.inc("etag", "hit")
+        return caching.not_modified(etag)
+    metrics.CACHE_REQUESTS.inc("etag", "miss")
+    return FastJSONResponse(build(), headers=caching.cache_headers(etag))
+
+
 # Book routes
-@router.get("/books", tags=["books"])
-def get_all_books(start: int = 0, n: int = 15) -> models.Books:
+@router.get("/books", tags=["books"], response_model=models.Books)
+def get_all_books(
+    request: Request,
+    start: int = Query(0, ge=0),
+    n: int = Query(15, ge=1, le=BOOKS_MAX_PAGE_SIZE),
+    genre: str | None = None,
+    author: str | None = None,
+    sort: models.CatalogSort | None = None,
+) -> Response:
     """
     Returns the available books in the database (paginated).
+    Only the books of a genre and/or an author when given, sorted by read
+    count (popular), by title or newest first (recent).
+    """
+
+    catalog = service.Catalog.snapshot()
+    return _catalog_response(
+        request,
+        lambda: service.Book.get_books(start, n, genre, author, sort, catalog),
+        catalog,
+    )
+
+
+@router.get(
+    "/search", tags=["books"], response_model=list[models.Book] | models.SearchPage
+)
+def search_book(
+    request: Request,
+    q: str,
+    limit: int | None = Query(None, ge=1, le=SEARCH_MAX_RESULTS),
+    cursor: str | None = None,
+    estimate: bool = False,
+) -> Response:
     """
+    Search for a book by title or author (case-insensitive), tolerating
+    typos. The most similar books come first, at most SEARCH_MAX_RESULTS.
 
-    return service.Book.get_books(start, n)
+    With a limit, a cursor or estimate=true, returns a page of the results
+    instead: the books, the `next_cursor` to pass as `cursor` to get the
+    next page (null on the last one) and, with estimate=true, an estimate
+    of the number of books found.
+    """
+
+    if (limit, cursor, estimate) == (None, None, False):
+        return _catalog_response(request, lambda: service.Book.search_book(q))
+    n = limit or SEARCH_MAX_RESULTS
+    return _catalog_response(
+        request, lambda: service.Book.search_page(q, cursor, n, estimate)
+    )
 
 
-@router.get("/search", tags=["books"])
-def search_book(q: str) -> list[models.Book]:
+@router.get("/search/suggest", tags=["books"], response_model=list[models.Suggestion])
+def suggest(
+    request: Request,
+    prefix: str = Query(..., min_length=1),
+    n: int = Query(SUGGEST_TOP_K, ge=1, le=SUGGEST_TOP_K),
+) -> Response:
     """
-    Search for a book by title (case-insensitive)
+    Suggests the most read titles and authors starting with the prefix, or
+    having a word starting with it, to complete a search as it is typed.
     """
 
-    return service.Book.search_book(q)
+    suggestions = service.Search.suggestions()
+    return _catalog_response(
+        request, lambda: service.Search.suggest(prefix, n, suggestions), suggestions
+    )
 
 
-@router.get("/genre", tags=["books"])
-def get_genres() -> list[str]:
+@router.get("/genre", tags=["books"], response_model=list[str])
+def get_genres(request: Request) -> Response:
     """
     Returns the available genres in the database.
     """
 
-    return service.Book.get_genres()
+    catalog = service.Catalog.snapshot()
+    return _catalog_response(request, lambda: service.Book.get_genres(catalog), catalog)
 
 
-@router.get("/books/genre", tags=["books"])
-def get_books_by_genre(genre: str) -> list[models.Book]:
+@router.get("/books/batch", tags=["books"], response_model=models.BookBatch)
+def get_books_by_ids(
+    request: Request,
+    ids: str = Query(..., pattern=r"^\d+(,\d+)*$"),
+) -> Response:
+    """
+    Returns the books with the given comma separated ids (e.g. ids=3,1,2),
+    in the same order, and the ids of the books that do not exist.
+    At most BOOKS_MAX_PAGE_SIZE ids per request.
+    """
+
+    book_ids = [int(book_id) for book_id in ids.split(",")]
+    if len(book_ids) > BOOKS_MAX_PAGE_SIZE:
+        raise HTTPException(
+            http_status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many ids! The maximum is {BOOKS_MAX_PAGE_SIZE}.",
+        )
+    if max(book_ids) > MAX_ID:
+        raise HTTPException(
+            http_status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid id! The maximum is {MAX_ID}.",
+        )
+    catalog = service.Catalog.snapshot()
+    return _catalog_response(
+        request, lambda: service.Book.get_books_by_ids(book_ids, catalog), catalog
+    )
+
+
+@router.get("/books/genre", tags=["books"], response_model=list[models.Book])
+def get_books_by_genre(request: Request, genre: str) -> Response:
     """
     Returns the books from a specific genre.
     """
 
-    return service.Book.get_books_by_genre(genre)
+    catalog = service.Catalog.snapshot()
+    return _catalog_response(
+        request, lambda: service.Book.get_books_by_genre(genre, catalog), catalog
+    )
 
 
 # Reading list routes
-@router.get("/reads", tags=["library"])
+@router.get(
+    "/reads",
+    tags=["library"],
+    response_model=list[models.MyRead] | models.ReadingListChanges | models.ReadsPage,
+)
 def get_reading_list(
+    since: str | None = None,
+    status: models.StatusEnum | None = None,
+    sort: models.ReadsSort | None = None,
+    limit: int | None = Query(None, ge=1, le=READS_MAX_PAGE_SIZE),
+    cursor: str | None = None,
     user_id: int = Depends(security.get_user),
-) -> list[models.MyRead]:
+) -> Response:
     """
     Returns the reading list of the user.
+    The X-Sync-Cursor header holds the cursor to pass as `since` to get only
+    the books added, updated or removed after this call. Expired cursors get
+    a 410, the whole list must then be fetched again.
+
+    With a status, a sort, a limit or a cursor, returns a streamed page of
+    the list instead: the books with the status, the most recently updated
+    first (recent) or last (oldest), and the `next_cursor` to pass as
+    `cursor` to get the next page, null on the last one.
     """
 
+    if (status, sort, limit, cursor) != (None, None, None, None):
+        page = service.ReadingList.get_page(
+            user_id, status, sort, cursor, limit or READS_MAX_PAGE_SIZE
+        )
+        return StreamingResponse(
+            export.to_json_page(page, service.Export.READ_COLUMNS, "books"),
+            media_type="application/json",
+        )
+    if since is not None:
+        changes = service.ReadingList.get_changes(user_id, since)
+        return FastJSONResponse(changes, headers={"X-Sync-Cursor": changes.cursor})
+    sync_cursor = service.ReadingList.sync_cursor()
     reading_list = service.ReadingList(user_id)
-    return reading_list.books
+    return FastJSONResponse(reading_list.books, headers={"X-Sync-Cursor": sync_cursor})
+
+
+@router.get("/reads/stream", tags=["library"])
+async def stream_reading_list(
+    user_id: int = Depends(security.get_stream_user),
+) -> StreamingResponse:
+    """
+    Streams the changes of the user's reading list as server-sent events.
+    As EventSource cannot set headers, the token can also be given as an
+    access_token query parameter or cookie.
+    Events are named "added", "updated" or "removed" and hold the book id and
+    its status. An "overflow" event means that changes were dropped: fetch
+    the changes with /reads?since=<cursor>. A comment is sent as heartbeat
+    when there are no changes.
+    """
+
+    return StreamingResponse(
+        changefeed.stream(changefeed.READING_LIST_EVENTS, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/reads", tags=["library"])
@@ -108,8 +284,7 @@ def add_to_reading_list(
     Throws an error if the book is already in the reading list.
     """
     reading_list = service.ReadingList(user_id)
-    reading_list.add_book(book_id)
-    return service.Book.from_db(book_id)
+    return reading_list.add_book(book_id)
 
 
 @router.put("/reads", tags=["library"])
@@ -123,8 +298,7 @@ def change_reading_status(
     Does not do anything if the status is the same as the current status.
     """
     reading_list = service.ReadingList(user_id)
-    reading_list.change_reading_status(entry.book_id, entry.status)
-    return service.Book.from_db(entry.book_id)
+    return reading_list.change_reading_status(entry.book_id, entry.status)
 
 
 @router.delete("/reads", tags=["library"])
@@ -140,14 +314,176 @@ def remove_from_reading_list(
     return "Book removed from reading list!"
 
 
-@router.get("/recommend", tags=["library"])
+@router.post("/reads/batch", tags=["library"])
+def batch_reading_list(
+    operations: list[models.ReadingListOperation],
+    user_id: int = Depends(security.get_user),
+) -> list[models.ReadingListOperationResult]:
+    """
+    Apply several operations to the user's reading list in one request.
+    Each operation adds a book (with an optional status), updates the status
+    of a book or removes a book. Operations are applied in order, all
+    together, and each one gets its own status code and detail.
+    """
+    return service.ReadingList.apply_batch(user_id, operations)
+
+
+@router.get("/recommend", tags=["library"], response_model=list[models.Book])
 def get_recommendations(
     n: int = 15, user_id: int = Depends(security.get_user)
-) -> list[models.Book]:
+) -> FastJSONResponse:
     """
     Get book recommendations for the user based on the current reading list.
     Returns empty list if the reading list is empty.
     """
 
     reading_list = service.ReadingList(user_id)
-    return reading_list.get_recommendations(n)
+    return FastJSONResponse(reading_list.get_recommendations(n))
+
+
+# Batch routes
+# Requests accepted by /batch, by path. Each one is called with the query
+# parameters, the user id and a function returning the user's reading list.
+_BATCH_ROUTES = {
+    "/api/me": lambda params, user_id, reads: _user_details(user_id, reads()),
+    "/api/reads": lambda params, user_id, reads: reads().books,
+    "/api/recommend": lambda params, user_id, reads: reads().get_recommendations(
+        int(params.get("n", 15))
+    ),
+    "/api/genre": lambda params, user_id, reads: service.Book.get_genres(
+        service.Catalog.snapshot()
+    ),
+    "/api/books": lambda params, user_id, reads: service.Book.get_books(
+        max(int(params.get("start", 0)), 0),
+        min(max(int(params.get("n", 15)), 1), BOOKS_MAX_PAGE_SIZE),
+        params.get("genre"),
+        params.get("author"),
+        params.get("sort"),
+        service.Catalog.snapshot(),
+    ),
+    "/api/search": lambda params, user_id, reads: service.Book.search_book(
+        str(params["q"])
+    ),
+    "/api/books/genre": lambda params, user_id, reads: service.Book.get_books_by_genre(
+        str(params["genre"]), service.Catalog.snapshot()
+    ),
+}
+
+
+def _batch_call(request: models.SubRequest, user_id, reads) -> models.SubResponse:
+    handler = _BATCH_ROUTES.get(request.path)
+    if handler is None:
+        status_code, body = 404, {"detail": "Not Found"}
+    else:
+        try:
+            status_code, body = 200, handler(request.params, user_id, reads)
+        except (KeyError, ValueError):
+            status_code, body = 422, {"detail": "Invalid or missing parameter!"}
+        except HTTPException as exception:
+            status_code, body = exception.status_code, {"detail": exception.detail}
+    return models.SubResponse(path=request.path, status_code=status_code, body=body)
+
+
+@router.post("/batch", tags=["batch"], response_model=list[models.SubResponse])
+def batch(
+    requests: list[models.SubRequest], user_id: int = Depends(security.get_user)
+) -> FastJSONResponse:
+    """
+    Runs several GET requests in one call, e.g. all the requests of a page.
+    Supports /api/me, /api/reads, /api/recommend, /api/genre, /api/books,
+    /api/search and /api/books/genre. The requests share one database
+    connection and the reading list is only loaded once. Each response has
+    its own status code.
+    """
+
+    if len(requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            http_status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many requests! The maximum is {BATCH_MAX_REQUESTS}.",
+        )
+    reads = functools.cache(lambda: service.ReadingList(user_id))
+    with service.shared_connection():
+        responses = [_batch_call(request, user_id, reads) for request in requests]
+    return FastJSONResponse(responses)
+
+
+# Export routes
+@router.get("/export/books", tags=["export"])
+def export_books(
+    fmt: models.ExportFormat = Query(models.ExportFormat.ndjson, alias="format"),
+    user_id: int = Depends(security.get_admin),
+) -> StreamingResponse:
+    """
+    Streams the whole catalog, with the read count of each book,
+    as NDJSON (default) or CSV. Only for administrators.
+    """
+
+    return _export_response(
+        service.Export.books(), service.Export.BOOK_COLUMNS, fmt, "books"
+    )
+
+
+@router.get("/export/reads", tags=["export"])
+def export_reading_list(
+    fmt: models.ExportFormat = Query(models.ExportFormat.ndjson, alias="format"),
+    user_id: int = Depends(security.get_user),
+) -> StreamingResponse:
+    """
+    Streams the reading list of the user as NDJSON (default) or CSV.
+    """
+
+    return _export_response(
+        service.Export.reads(user_id), service.Export.READ_COLUMNS, fmt, "reads"
+    )
+
+
+def _export_response(batches, columns, fmt: models.ExportFormat, name: str):
+    """
+    Streams the batches of rows as a file download.
+    """
+    return StreamingResponse(
+        export.encode(batches, columns, fmt),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt.value}"'},
+    )
+
+
+# Statistics routes
+@router.get("/stats", tags=["stats"], response_model=models.Stats)
+def get_stats(
+    n: int = Query(10, ge=1, le=BOOKS_MAX_PAGE_SIZE),
+    days: int = Query(30, ge=1, le=STATS_MAX_DAYS),
+) -> FastJSONResponse:
+    """
+    Returns the number of reading list entries of each status (not_started,
+    started, complete) and the share of complete ones, overall and by genre,
+    the number of books completed each of the last `days` days, and the n
+    books the most users are currently reading.
+    Read from rollup tables updated with each reading list change.
+    """
+
+    return FastJSONResponse(service.Stats.get(n, days))
+
+
+# Admin routes
+@router.get("/admin/slow-queries", tags=["admin"])
+def get_slow_queries(
+    user_id: int = Depends(security.get_admin),
+) -> list[models.SlowQuery]:
+    """
+    Returns the statements that went over the slow query threshold,
+    with their call count, latency percentiles and query plan.
+    Slowest (by p99) first.
+    """
+
+    return slowlog.SLOW_QUERIES.report()
+
+
+@router.delete("/admin/slow-queries", tags=["admin"])
+def reset_slow_queries(user_id: int = Depends(security.get_admin)) -> str:
+    """
+    Clears the slow query log.
+    """
+
+    slowlog.SLOW_QUERIES.reset()
+    return "Slow query log cleared!"
@@ -0,0 +1,220 @@
+"""
+This module contains the in-memory trigram index of the book titles and
+authors, used for the typo-tolerant search.
+
+Texts are split into the trigrams of their words, as in PostgreSQL's
+pg_trgm: lowercased, with two spaces before and one after each word. A
+misspelled word still shares most of its trigrams with the right one.
+Each distinct title or author is indexed once, and maps to its books.
+
+A typo leaves too few of the trigrams of a short word, so the short
+queries also match the texts that sound like them, compared by their
+consonants: "Doon" finds "Dune".
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+
+_WORD = re.compile(r"\w+")
+_VOWELS = re.compile(r"[aeiouy]+")
+_REPEATS = re.compile(r"(.)\1+")
+_NO_TEXTS = array("I")
+# Trigrams contained by more than one text out of COMMON_SHARE, and by more
+# than COMMON_MIN_TEXTS texts, are common: they tell little about a text but
+# have long posting lists
+COMMON_SHARE = 100
+COMMON_MIN_TEXTS = 5000
+# Queries shorter than a trigram are not looked up in the index
+MIN_QUERY_LENGTH = 3
+# A middle typo in a word of up to SHORT_QUERY_LENGTH characters leaves
+# less than half of its trigrams. Texts sounding like such a query count as
+# SOUND_SIMILARITY similar to it
+SHORT_QUERY_LENGTH = 4
+SOUND_SIMILARITY = 0.5
+
+
+def trigrams(text) -> set[str]:
+    """
+    Returns the set of the trigrams of the words of a text.
+    """
+    grams: set[str] = set()
+    for word in _WORD.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(map("".join, zip(padded, padded[1:], padded[2:])))
+    return grams
+
+
+def sound(text) -> str:
+    """
+    Returns a rough phonetic key of a text: its first letter followed by
+    its consonants, lowercased, the repeated ones once.
+    """
+    letters = "".join(_WORD.findall(text.lower()))
+    return _REPEATS.sub(r"\1", letters[:1] + _VOWELS.sub("", letters[1:]))
+
+
+def _is_short(query):
+    words = _WORD.findall(query)
+    return len(words) == 1 and len(words[0]) <= SHORT_QUERY_LENGTH
+
+
+class TrigramIndex:
+    """
+    Inverted index from the trigrams to the titles and authors containing
+    them, updated incrementally as the books change.
+
+    Texts get an integer code, kept when their last book goes away: the
+    posting lists are append-only, and a text indexed again reuses them.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Code of each text, and by code: its number of trigrams and the
+        # sorted ids of its books
+        self.codes = {}
+        self.sizes = array("I")
+        self.books = []
+        # Codes of the texts containing each trigram
+        self.postings = {}
+        # Codes of the texts having each short sound key
+        self.sounds = {}
+        # Codes of the title and of the author of each book
+        self.entries = {}
+
+    def load(self, rows):
+        """
+        Indexes the (id, title, author) rows, replacing the indexed books.
+        """
+        # Built aside, the searches use the previous books meanwhile
+        index = TrigramIndex()
+        for book_id, title, author in rows:
+            index._add(book_id, title, author)
+        with self.lock:
+            self.codes = index.codes
+            self.sizes = index.sizes
+            self.books = index.books
+            self.postings = index.postings
+            self.sounds = index.sounds
+            self.entries = index.entries
+            self.loaded = True
+
+    def add(self, book_id, title, author):
+        """
+        Indexes a new book, or re-indexes one that changed.
+        """
+        with self.lock:
+            self._remove(book_id)
+            self._add(book_id, title, author)
+
+    def remove(self, book_id):
+        """
+        Removes a book from the index, if it is indexed.
+        """
+        with self.lock:
+            self._remove(book_id)
+
+    def search(self, query, threshold, limit=None) -> list[int]:
+        """
+        Returns the ids of the books whose title or author contains at
+        least `threshold` (0 to 1) of the trigrams of the query, only the
+        first `limit` ones when it is not None.
+        Like stop words, the trigrams found in too many texts are left out
+        of queries having other trigrams.
+        A query of one short word also matches the texts sounding like it,
+        when the threshold is at most SOUND_SIMILARITY.
+        The most similar come first: the ones containing all of the query,
+        then the ones sounding like it, then the ones matching more of the
+        query, then the ones with fewer other trigrams, then by id.
+        """
+        return self.search_page(query, threshold, 0, limit)[0]
+
+    def search_page(self, query, threshold, start, n=None) -> tuple[list[int], int]:
+        """
+        Returns the ids of the `n` books (all when None) after the first
+        `start` ones of a search, and an estimate of the number of books
+        matching: the books of the matching texts, the ones matching by
+        title and by author being counted twice.
+        """
+        with self.lock:
+            postings = self._postings(trigrams(query))
+            alike = _NO_TEXTS
+            if _is_short(query) and threshold <= SOUND_SIMILARITY:
+                alike = self.sounds.get(sound(query), _NO_TEXTS)
+            if not postings and not alike:
+                return [], 0
+            # The epsilon keeps float errors (0.6 * 5 = 3.0000000000000004)
+            # from asking for one more trigram
+            needed = max(1, math.ceil(threshold * len(postings) - 1e-9))
+            # The counting runs in C, over the posting lists of the query
+            counts: Counter[int] = Counter(dict.fromkeys(alike, 0))
+            for posting in postings:
+                counts.update(posting)
+            sounding = set(alike)
+            ranked = [
+                (
+                    count < len(postings),
+                    code not in sounding,
+                    -count,
+                    self.sizes[code] - count,
+                    code,
+                )
+                for code, count in counts.items()
+                if (count >= needed or code in sounding) and self.books[code]
+            ]
+            total = sum(len(self.books[entry[-1]]) for entry in ranked)
+            # Only the texts of the page are taken out of the heap
+            heapq.heapify(ranked)
+            end = None if n is None else start + n
+            # A book matching by title and by author is ranked once
+            matches: dict[int, None] = {}
+            while ranked and (end is None or len(matches) < end):
+                code = heapq.heappop(ranked)[-1]
+                matches.update(dict.fromkeys(self.books[code]))
+        return list(matches)[start:end], total
+
+    def _postings(self, grams):
+        """
+        Returns the posting lists of the trigrams of a query, without the
+        common ones when there are others.
+        """
+        common_size = max(COMMON_MIN_TEXTS, len(self.sizes) // COMMON_SHARE)
+        postings = [self.postings.get(gram, _NO_TEXTS) for gram in grams]
+        rare = [posting for posting in postings if len(posting) <= common_size]
+        return rare or postings
+
+    def _code(self, text):
+        code = self.codes.get(text)
+        if code is None:
+            code = self.codes[text] = len(self.sizes)
+            grams = trigrams(text)
+            self.sizes.append(len(grams))
+            self.books.append([])
+            for gram in grams:
+                self.postings.setdefault(gram, array("I")).append(code)
+            # Only the keys as short as the ones of the short queries
+            key = sound(text)
+            if len(key) <= SHORT_QUERY_LENGTH:
+                self.sounds.setdefault(key, array("I")).append(code)
+        return code
+
+    def _add(self, book_id, title, author):
+        codes = (self._code(title), self._code(author))
+        for code in codes:
+            bisect.insort(self.books[code], book_id)
+        self.entries[book_id] = codes
+
+    def _remove(self, book_id):
+        for code in self.entries.pop(book_id, ()):
+            self.books[code].remove(book_id)
+
+
+INDEX = TrigramIndex()
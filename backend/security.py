@@ -4,13 +4,18 @@ This module contains the authentication and authorization related functions.
 
 from datetime import UTC, datetime, timedelta
 
-from fastapi import HTTPException, Security
+from fastapi import Cookie, Depends, HTTPException, Query, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt
 from jose.exceptions import ExpiredSignatureError, JWTError
 from passlib.context import CryptContext
 
-from .const import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
+from .const import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    ADMIN_USER_IDS,
+    ALGORITHM,
+    SECRET_KEY,
+)
 
 pwd_context = CryptContext(schemes=["bcrypt"])
 
@@ -70,3 +75,38 @@ def get_user(
 
     token = authorization.credentials
     return get_user_from_token(token)
+
+
+def get_admin(user_id: int = Depends(get_user)) -> int:
+    """
+    Get the user id from a given Authorization header, and check that the
+    user is an administrator.
+    """
+
+    if user_id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return user_id
+
+
+def get_stream_user(
+    authorization: HTTPAuthorizationCredentials | None = Security(
+        HTTPBearer(auto_error=False)
+    ),
+    access_token: str | None = Query(None),
+    cookie_token: str | None = Cookie(None, alias="access_token"),
+) -> int:
+    """
+    Get the user id from a given Authorization header, else from the token
+    of an access_token query parameter or cookie. For the event streams:
+    the browsers' EventSource cannot send an Authorization header.
+    """
+
+    if authorization is not None:
+        return get_user(authorization)
+
+    token = access_token or cookie_token
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    return get_user_from_token(token)
@@ -2,18 +2,246 @@
 This module contains the business logic for the application.
 """
 
+import base64
+import binascii
+import contextlib
+import json
 import logging
 import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
 
 from fastapi import HTTPException
 from fastapi import status as http_status
 from passlib.context import CryptContext
+from pydantic import TypeAdapter
 
-from . import database, models
-from .const import SQLITE_DB
+from . import (
+    caching,
+    changefeed,
+    database,
+    metrics,
+    models,
+    search,
+    snapshot,
+    suggest,
+)
+from .const import (
+    READS_BATCH_MAX_SIZE,
+    READS_MAX_PAGE_SIZE,
+    READS_TOMBSTONE_RETENTION_DAYS,
+    SEARCH_ESTIMATE_SAMPLE,
+    SEARCH_MAX_RESULTS,
+    SEARCH_SIMILARITY_THRESHOLD,
+    SQLITE_DB,
+)
 
 context = CryptContext(schemes=["bcrypt"])
 
+# Validate whole lists in one pass instead of building the models one by one
+_BOOK_LIST = TypeAdapter(list[models.Book])
+_MY_READ_LIST = TypeAdapter(list[models.MyRead])
+
+
+# Format of the delta sync cursors, a UTC time with a second precision
+_CURSOR_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# Format of the SQLite CURRENT_TIMESTAMP
+_SQLITE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_shared = threading.local()
+
+
+@contextlib.contextmanager
+def shared_connection():
+    """
+    Makes the service functions called in the block, on the current thread,
+    use one shared connection instead of opening their own.
+    """
+    conn = _shared.conn = database.connect(SQLITE_DB)
+    try:
+        yield conn
+    finally:
+        _shared.conn = None
+        conn.close()
+
+
+def _connect():
+    return getattr(_shared, "conn", None) or database.connect(SQLITE_DB)
+
+
+def _close(conn):
+    if conn is not getattr(_shared, "conn", None):
+        conn.close()
+
+
+def _book_from_row(row, reads):
+    """
+    Builds a Book object from a trusted database row.
+    Skips pydantic validation, the row already has the right types.
+    """
+    return models.Book.model_construct(
+        id=row[0],
+        title=row[1],
+        author=row[2],
+        genre=row[3],
+        reads=reads,
+    )
+
+
+def _book_from_snapshot(row: snapshot.BookRow):
+    """
+    Builds a Book object from a book of the catalog snapshot.
+    """
+    return models.Book.model_construct(
+        id=row.id,
+        title=row.title,
+        author=row.author,
+        genre=row.genre,
+        reads=row.reads,
+    )
+
+
+def _status_counts(not_started, started, complete):
+    """
+    Returns the fields of a StatusCounts: the given numbers of entries and
+    the share of complete ones.
+    """
+    total = not_started + started + complete
+    return {
+        "not_started": not_started,
+        "started": started,
+        "complete": complete,
+        "completion_rate": complete / total if total else 0.0,
+    }
+
+
+def _decode_search_cursor(cursor):
+    """
+    Returns the offset of a search cursor, 0 for the first page. Throws an
+    error if it is not one.
+    """
+    if cursor is None:
+        return 0
+    if not cursor.isdecimal() or int(cursor) >= SEARCH_MAX_RESULTS:
+        raise HTTPException(
+            http_status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor!",
+        )
+    return int(cursor)
+
+
+def _estimate_title_matches(title, conn: sqlite3.Connection):
+    """
+    Estimates the number of books containing the title from the matches
+    among the first SEARCH_ESTIMATE_SAMPLE books.
+    """
+    matches = database.count_title_matches(title, SEARCH_ESTIMATE_SAMPLE, conn)
+    book_count = database.get_book_count(conn)
+    if book_count <= SEARCH_ESTIMATE_SAMPLE:
+        return matches
+    return round(matches * book_count / SEARCH_ESTIMATE_SAMPLE)
+
+
+def _get_book(book_id, conn: sqlite3.Connection):
+    """
+    Returns the Book with the given id, with its read count.
+    Throws an error if it does not exist.
+    """
+    book_data = database.get_book(book_id, conn)
+    if not book_data:
+        raise HTTPException(
+            http_status.HTTP_404_NOT_FOUND,
+            detail="Book not found!",
+        )
+    return _book_from_row(book_data, book_data[4])
+
+
+def _publish(user_id, event_type, book_id, status=None):
+    """
+    Publishes a change of a reading list to the /reads/stream subscribers.
+    """
+    event = {"type": event_type, "book_id": book_id}
+    if status is not None:
+        event["status"] = models.StatusEnum(status).value
+    changefeed.READING_LIST_EVENTS.publish(user_id, event)
+
+
+def _operation_result(operation, status_code, detail):
+    return models.ReadingListOperationResult(
+        action=operation.action,
+        book_id=operation.book_id,
+        status_code=status_code,
+        detail=detail,
+    )
+
+
+def _apply_operation(operation, statuses, existing_books):
+    """
+    Applies an operation to the reading statuses by book id, a status of
+    None meaning that the book is not in the reading list.
+    Returns the result of the operation, the statuses are left unchanged
+    when it fails.
+    """
+    book_id = operation.book_id
+    current = statuses.get(book_id)
+    if operation.action == models.BatchAction.add:
+        if book_id not in existing_books:
+            return _operation_result(operation, 404, "Book not found!")
+        if current is not None:
+            return _operation_result(operation, 400, "Book already in reading list!")
+        statuses[book_id] = operation.status or models.StatusEnum.not_started
+    elif current is None:
+        return _operation_result(operation, 404, "Book not in reading list!")
+    elif operation.action == models.BatchAction.remove:
+        statuses[book_id] = None
+    elif operation.status is None:
+        return _operation_result(operation, 400, "Status is required!")
+    else:
+        statuses[book_id] = operation.status
+    return _operation_result(operation, 200, "OK")
+
+
+def _reading_list_changes(before, after):
+    """
+    Returns the inserts, updates and deletes turning the reading statuses
+    `before` into `after`.
+    """
+    inserts, updates, deletes = [], [], []
+    for book_id, status in after.items():
+        old = before.get(book_id)
+        if old is None and status is not None:
+            inserts.append((book_id, models.StatusEnum(status).value))
+        elif old is not None and status is None:
+            deletes.append(book_id)
+        elif status != old:
+            updates.append((models.StatusEnum(status).value, book_id))
+    return inserts, updates, deletes
+
+
+def _encode_page_cursor(row):
+    """
+    Returns the cursor of the page following a reading list row: its
+    (updated_at, id), opaque to the clients.
+    """
+    return base64.urlsafe_b64encode(json.dumps(row[6:8]).encode()).decode()
+
+
+def _decode_page_cursor(cursor):
+    """
+    Returns the (updated_at, id) of a page cursor, throws an error if it is
+    not one.
+    """
+    try:
+        updated_at, entry_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        updated_at = entry_id = None
+    if not isinstance(updated_at, str) or type(entry_id) is not int:
+        raise HTTPException(
+            http_status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor!",
+        )
+    return updated_at, entry_id
+
 
 class Hasher:
     """
@@ -26,7 +254,11 @@ class Hasher:
         Hash a password using bcrypt.
         Returns different hash each time for the same password.
         """
-        return context.hash(password)
+        metrics.BCRYPT_QUEUE.inc()
+        try:
+            return context.hash(password)
+        finally:
+            metrics.BCRYPT_QUEUE.dec()
 
     @staticmethod
     def password_verification(password, hashed_password):
@@ -34,7 +266,11 @@ class Hasher:
         Verify a password against a hashed password.
         """
 
-        return context.verify(password, hashed_password)
+        metrics.BCRYPT_QUEUE.inc()
+        try:
+            return context.verify(password, hashed_password)
+        finally:
+            metrics.BCRYPT_QUEUE.dec()
 
 
 class User:
@@ -59,9 +295,9 @@ class User:
 
         if not User.verify_new_user(username):
             logging.info(f"Service: Creating user: {username}")
-            conn = sqlite3.connect(SQLITE_DB)
+            conn = _connect()
             database.create_user(username, password_hash, conn)
-            conn.close()
+            _close(conn)
         else:
             logging.error(f"Service: Username already exists: {username}")
             raise HTTPException(
@@ -75,9 +311,9 @@ class User:
         Return True if user exists, else False
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
+        conn = _connect()
         users = database.get_user_by_username(username, conn)
-        conn.close()
+        _close(conn)
         return bool(users)
 
     @staticmethod
@@ -87,9 +323,9 @@ class User:
         Returns the ID of a user if the username and password matches.
         Throws exception, in case of wrong password/
         """
-        conn = sqlite3.connect(SQLITE_DB)
+        conn = _connect()
         user = database.get_user_by_username(username, conn)
-        conn.close()
+        _close(conn)
         if not user:
             logging.error(f"Service: User not found: {username}")
             raise HTTPException(
@@ -110,9 +346,9 @@ class User:
         """
         Helper function to return a User instance given a user id
         """
-        conn = sqlite3.connect(SQLITE_DB)
+        conn = _connect()
         user = database.get_user(user_id, conn)
-        conn.close()
+        _close(conn)
         return models.User(id=user[0], username=user[1])
 
 
@@ -127,113 +363,345 @@ class Book:
         Given a book id, returns a Book class object
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        book_data = database.get_book(book_id, conn)
-        if book_data:
-            book = models.Book(
-                id=book_data[0],
-                title=book_data[1],
-                author=book_data[2],
-                genre=book_data[3],
-                reads=database.get_book_read_count(book_data[0], conn),
-            )
-            conn.close()
-            return book
-        raise HTTPException(
-            http_status.HTTP_404_NOT_FOUND,
-            detail="Book not found!",
-        )
+        conn = _connect()
+        try:
+            return _get_book(book_id, conn)
+        finally:
+            _close(conn)
 
     @staticmethod
-    def get_books(start: int, n: int):
+    def get_books(
+        start: int,
+        n: int,
+        genre=None,
+        author=None,
+        sort=None,
+        catalog: snapshot.CatalogSnapshot | None = None,
+    ):
         """
-        Helper function to get a list of books (paginated).
-        Converts the database results to Book object.
+        Helper function to get a list of books (paginated), optionally only
+        the ones of a genre and/or an author, in a models.CatalogSort order.
         Also calculates the previous and next offsets.
+        Served from the catalog snapshot when one is given, except for the
+        books of an author, which the database finds with an index.
         Returns a Books object.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        book_data = database.get_books(start, n, conn)
-        books = [
-            models.Book(
-                id=book[0],
-                title=book[1],
-                author=book[2],
-                genre=book[3],
-                reads=database.get_book_read_count(book[0], conn),
-            )
-            for book in book_data
-        ]
-        count = database.get_book_count(conn)
-        conn.close()
+        sort = models.CatalogSort(sort).value if sort else None
+        # One more book than asked tells whether there is a next page
+        if catalog is not None and author is None:
+            entries = catalog.page(start, n + 1, genre, sort)
+            books = [_book_from_snapshot(entry) for entry in entries[:n]]
+            found = len(entries)
+        else:
+            conn = _connect()
+            rows = database.get_books(start, n + 1, genre, author, sort, conn)
+            _close(conn)
+            books = [_book_from_row(row, row[4]) for row in rows[:n]]
+            found = len(rows)
 
-        return models.Books(
+        return models.Books.model_construct(
             books=books,
             previous_n=prev_n if (prev_n := start - n) >= 0 else 0,
-            next_n=start_n if (start_n := start + n) < count else None,
+            next_n=start + n if found > n else None,
         )
 
     @staticmethod
     def search_book(book_name):
         """
         Search for a book by name.
+        Returns the first page of the search, of SEARCH_MAX_RESULTS books.
+        """
+
+        return Book.search_page(book_name).books
+
+    @staticmethod
+    def search_page(
+        book_name, cursor=None, n=SEARCH_MAX_RESULTS, estimate=False
+    ) -> models.SearchPage:
+        """
+        Search for a book by name, a page of n books at a time.
+        Finds the titles and authors close to the name, typos included,
+        with the search index once it is loaded, the most similar first.
+        Until then, and for the names shorter than a trigram, finds the
+        titles containing the name, by id.
+        Only the first SEARCH_MAX_RESULTS books can be paged through.
+        Also returns the cursor of the next page and, when asked, an
+        estimate of the number of books found.
+        Throws an error if the cursor is invalid.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
+        start = _decode_search_cursor(cursor)
+        n = min(n, SEARCH_MAX_RESULTS - start)
         logging.info(f"Service: Searching for book: {book_name}")
-        book_data = database.search_book_by_title(book_name, conn)
-        if not book_data:
-            logging.error(f"Service: Book not found: {book_name}")
-            conn.close()
+        total: int | None
+        # One more book than asked tells whether there is a next page
+        if search.INDEX.loaded and len(book_name.strip()) >= search.MIN_QUERY_LENGTH:
+            # A name close to no text finds nothing: the titles are not
+            # scanned for it
+            found, total = search.INDEX.search_page(
+                book_name, SEARCH_SIMILARITY_THRESHOLD, start, n + 1
+            )
+            # The index is ahead of a stale snapshot
+            catalog = Catalog.snapshot(Book.get_catalog_version()) if found else None
+            books = Book.from_ids(found[:n], catalog)
+            matched = len(found)
+        else:
+            conn = _connect()
+            rows = database.search_book_by_title(book_name, start, n + 1, conn)
+            books = [_book_from_row(row, row[4]) for row in rows[:n]]
+            total = _estimate_title_matches(book_name, conn) if estimate else None
+            _close(conn)
+            matched = len(rows)
+
+        logging.info(f"Service: {len(books)} books found for: {book_name}")
+        more = matched > n and start + n < SEARCH_MAX_RESULTS
+        return models.SearchPage.model_construct(
+            books=books,
+            next_cursor=str(start + n) if more else None,
+            total_estimate=max(total, start + len(books)) if estimate else None,
+        )
+
+    @staticmethod
+    def from_ids(
+        book_ids, catalog: snapshot.CatalogSnapshot | None = None
+    ) -> list[models.Book]:
+        """
+        Returns the books with the given ids, in the same order, without the
+        ones that do not exist. From the catalog snapshot when one is given,
+        else with one query.
+        """
+
+        if catalog is not None:
+            found = filter(None, map(catalog.get, book_ids))
+            return [_book_from_snapshot(row) for row in found]
+        if not book_ids:
             return []
+        conn = _connect()
+        by_id = {row[0]: row for row in database.get_books_by_ids(book_ids, conn)}
+        _close(conn)
+        return [
+            _book_from_row(row, row[4])
+            for book_id in book_ids
+            if (row := by_id.get(book_id)) is not None
+        ]
+
+    @staticmethod
+    def get_books_by_ids(
+        book_ids, catalog: snapshot.CatalogSnapshot | None = None
+    ) -> models.BookBatch:
+        """
+        Helper function to get many books at once, in the order of their
+        ids, and the ids of the ones that do not exist.
+        Served from the catalog snapshot when one is given.
+        Returns a BookBatch object.
+        """
 
-        books = [
-            models.Book(
-                id=book[0],
-                title=book[1],
-                author=book[2],
-                genre=book[3],
-                reads=database.get_book_read_count(book[0], conn),
+        books = Book.from_ids(book_ids, catalog)
+        found = {book.id for book in books}
+        missing = [book_id for book_id in book_ids if book_id not in found]
+        logging.info(
+            f"Service: {len(books)} books found and {len(missing)} missing "
+            f"out of {len(book_ids)} ids"
+        )
+        return models.BookBatch.model_construct(books=books, missing=missing)
+
+    @staticmethod
+    def create_book(title, author, genre):
+        """
+        Creates a book and adds it to the search index.
+        Returns the id of the book.
+        """
+
+        conn = _connect()
+        book_id = database.create_book(title, author, genre, conn)
+        _close(conn)
+        search.INDEX.add(book_id, title, author)
+        return book_id
+
+    @staticmethod
+    def update_book(book_id, title, author, genre):
+        """
+        Updates a book and its entry in the search index.
+        Throws an error if it does not exist.
+        """
+
+        conn = _connect()
+        updated = database.update_book(book_id, title, author, genre, conn)
+        _close(conn)
+        if not updated:
+            raise HTTPException(
+                http_status.HTTP_404_NOT_FOUND,
+                detail="Book not found!",
             )
-            for book in book_data
-        ]
-        logging.info(f"Service: {len(books)} books found for: {book_name}")
-        conn.close()
-        return books
+        search.INDEX.add(book_id, title, author)
 
     @staticmethod
-    def get_genres():
+    def delete_book(book_id):
         """
-        Helper function to get the list of genres.
+        Deletes a book and removes it from the search index.
+        Throws an error if it does not exist.
         """
-        conn = sqlite3.connect(SQLITE_DB)
+
+        conn = _connect()
+        deleted = database.delete_book(book_id, conn)
+        _close(conn)
+        search.INDEX.remove(book_id)
+        if not deleted:
+            raise HTTPException(
+                http_status.HTTP_404_NOT_FOUND,
+                detail="Book not found!",
+            )
+
+    @staticmethod
+    def get_catalog_version():
+        """
+        Helper function to get the current catalog version.
+        """
+        conn = _connect()
+        version = database.get_catalog_version(conn)
+        _close(conn)
+        return version
+
+    @staticmethod
+    def get_genres(catalog: snapshot.CatalogSnapshot | None = None):
+        """
+        Helper function to get the list of genres, from the catalog snapshot
+        when one is given.
+        """
+        if catalog is not None:
+            return catalog.get_genres()
+        conn = _connect()
         genres = database.get_genres(conn)
-        conn.close()
+        _close(conn)
         return genres
 
     @staticmethod
-    def get_books_by_genre(genre):
+    def get_books_by_genre(genre, catalog: snapshot.CatalogSnapshot | None = None):
+        """
+        Helper function to get the 15 most read books of a genre.
+        """
+
+        books = Book.get_books(
+            0, 15, genre, sort=models.CatalogSort.popular, catalog=catalog
+        ).books
+        logging.info(f"Service: {len(books)} books found for genre: {genre}")
+        return books
+
+
+class Catalog:
+    """
+    Class for the in-memory snapshot of the catalog.
+    """
+
+    @staticmethod
+    def load():
+        """
+        Loads a snapshot of the whole catalog from the database.
+        """
+
+        conn = _connect()
+        try:
+            # The version is read first: a concurrent write can only make
+            # the snapshot newer than its version, and reloaded sooner
+            version = database.get_catalog_version(conn)
+            return snapshot.CatalogSnapshot(version, database.iter_books(conn))
+        finally:
+            _close(conn)
+
+    @staticmethod
+    def preload():
+        """
+        Loads the snapshot served by the catalog routes, at startup.
+        """
+
+        snapshot.CATALOG.set(Catalog.load())
+
+    @staticmethod
+    def snapshot(version=None):
+        """
+        Returns the catalog snapshot, or None if it was not loaded.
+        It is reloaded in the background when the catalog changes, so it can
+        be a few seconds behind the database: responses built from it must
+        use its version. When a version is given, only returns a snapshot
+        at that version.
+        """
+
+        current = Book.get_catalog_version() if version is None else version
+        catalog = snapshot.CATALOG.get(current, Catalog.load)
+        if catalog is None:
+            return None
+        fresh = catalog.version == current
+        metrics.CACHE_REQUESTS.inc("catalog_snapshot", "hit" if fresh else "miss")
+        if version is not None and not fresh:
+            return None
+        return catalog
+
+
+class Search:
+    """
+    Class for the in-memory search and autocomplete indexes of the catalog.
+    """
+
+    @staticmethod
+    def preload():
+        """
+        Builds the search index from the books of the database, and the
+        autocomplete index from the catalog snapshot, at startup.
+        The books written through Book afterwards are kept in the search
+        index.
+        """
+
+        conn = _connect()
+        try:
+            search.INDEX.load(
+                (book_id, title, author)
+                for batch in database.iter_books(conn)
+                for book_id, title, author, _, _ in batch
+            )
+        finally:
+            _close(conn)
+        if (catalog := snapshot.CATALOG.snapshot) is not None:
+            suggest.SUGGESTIONS.set(suggest.PrefixIndex(catalog))
+
+    @staticmethod
+    def suggestions():
+        """
+        Returns the autocomplete index, or None if it was not built.
+        It is rebuilt in the background from the catalog snapshot when the
+        snapshot changes, at most every SUGGEST_REFRESH_SECONDS: responses
+        built from it must use its version.
+        """
+
+        catalog = Catalog.snapshot()
+        if catalog is None:
+            return None
+        return suggest.SUGGESTIONS.get(
+            catalog.version, lambda: suggest.PrefixIndex(catalog)
+        )
+
+    @staticmethod
+    def suggest(prefix, n, suggestions: suggest.PrefixIndex | None):
         """
-        Helper function to get the list of books by genre.
+        Returns the n most read titles and authors starting with the prefix,
+        or with a word starting with it. Empty until the autocomplete index
+        is built.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        book_data = database.get_books_by_genre(genre, conn)
-        books = [
-            models.Book(
-                id=book[0],
-                title=book[1],
-                author=book[2],
-                genre=book[3],
-                reads=database.get_book_read_count(book[0], conn),
+        if suggestions is None:
+            return []
+        return [
+            models.Suggestion.model_construct(
+                text=text,
+                kind=(
+                    models.SuggestionKind.title_
+                    if title
+                    else models.SuggestionKind.author
+                ),
+                reads=reads,
             )
-            for book in book_data
+            for text, title, reads in suggestions.suggest(prefix, n)
         ]
-        books.sort(key=lambda book: book.reads, reverse=True)
-        logging.info(f"Service: {len(books)} books found for genre: {genre}")
-        conn.close()
-        return books[:15]
 
 
 class ReadingList:
@@ -244,37 +712,72 @@ class ReadingList:
     def __init__(self, user_id):
         """
         Initialize the ReadingList object with the user id.
+        The books are only loaded when they are first used.
         """
 
         self.user_id = user_id
-        self.books = []
-        self.load()
+        self._books = None
+
+    @property
+    def books(self):
+        """
+        The books of the reading list. Its entries come from the reading
+        list cache, the details of their books from the catalog.
+        """
+
+        if self._books is None:
+            entries = caching.READING_LISTS.get(self.user_id)
+            if entries is None:
+                metrics.CACHE_REQUESTS.inc("reading_list", "miss")
+                token = caching.READING_LISTS.begin_load(self.user_id)
+                entries = self.load()
+                caching.READING_LISTS.put(self.user_id, entries, token)
+            else:
+                metrics.CACHE_REQUESTS.inc("reading_list", "hit")
+            self._books = ReadingList.hydrate(entries)
+        return self._books
+
+    @books.setter
+    def books(self, books):
+        self._books = books
 
     def load(self):
         """
         Load's the user's library from the database.
-        Converts the database results to MyRead object.
-        """
-
-        conn = sqlite3.connect(SQLITE_DB)
-        self.books = [
-            models.MyRead(
-                id=book.id,
-                title=book.title,
-                author=book.author,
-                genre=book.genre,
-                reads=book.reads,
-                status=entry[3],
-                updated_at=entry[5],
-            )
+        Returns the (book id, status, last update) of its entries, by book id.
+        """
+
+        conn = _connect()
+        entries = [
+            (entry[1], models.StatusEnum(entry[3]), datetime.fromisoformat(entry[5]))
             for entry in database.get_reading_lists(self.user_id, conn)
-            if (book := Book.from_db(entry[1]))
         ]
+        _close(conn)
         logging.info(
             f"Service: Reading list loaded for user: {self.user_id}."
-            f"Total books: {len(self.books)}"
+            f"Total books: {len(entries)}"
         )
-        conn.close()
+        return entries
+
+    @staticmethod
+    def hydrate(entries) -> list[models.MyRead]:
+        """
+        Converts (book id, status, last update) entries to MyRead objects,
+        without the books that no longer exist. The books are looked up in
+        the catalog snapshot when it is up to date, else with one query.
+        """
+
+        if not entries:
+            return []
+        states = {
+            book_id: {"status": status, "updated_at": updated_at}
+            for book_id, status, updated_at in entries
+        }
+        catalog = Catalog.snapshot(Book.get_catalog_version())
+        return [
+            models.MyRead.model_construct(**dict(book), **states[book.id])
+            for book in Book.from_ids(list(states), catalog)
+        ]
 
     def get_genres(self):
         """
@@ -284,34 +787,41 @@ class ReadingList:
 
     def add_book(self, book_id, status=models.StatusEnum.not_started):
         """
-        Add a book to the reading list.
-        Checks if the book is already in the reading list and throws an error.
+        Add a book to the reading list and return it.
+        Checks if the book exists and is not already in the reading list,
+        throws an error otherwise.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        if database.get_book_in_reading_list(self.user_id, book_id, conn):
+        conn = _connect()
+        try:
+            added_at = database.create_reading_list(self.user_id, book_id, status, conn)
+            book = _get_book(book_id, conn)
+        finally:
+            _close(conn)
+        if added_at is None:
             logging.error(
                 f"Service: Book {book_id} already in reading list for user: {self.user_id}"
             )
-            conn.close()
             raise HTTPException(
                 http_status.HTTP_400_BAD_REQUEST,
                 detail="Book already in reading list!",
             )
-        database.create_reading_list(self.user_id, book_id, status, conn)
         logging.info(
             f"Service: Book {book_id} added to reading list for user: {self.user_id}"
         )
-        conn.close()
+        entry = (models.StatusEnum(status), datetime.fromisoformat(added_at))
+        caching.READING_LISTS.update(self.user_id, book_id, entry)
+        _publish(self.user_id, "added", book_id, status)
+        return book
 
     def read_books(self):
         """
         Get the books that have been marked complete by the user.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
+        conn = _connect()
         books = database.get_completed_books(self.user_id, conn)
-        conn.close()
+        _close(conn)
         return books
 
     def remove_book(self, book_id):
@@ -319,24 +829,214 @@ class ReadingList:
         Remove a book from the reading list.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        database.remove_from_reading_list(self.user_id, book_id, conn)
+        conn = _connect()
+        removed = database.remove_from_reading_list(self.user_id, book_id, conn)
+        _close(conn)
+        if not removed:
+            return
         logging.info(
             f"Service: Book {book_id} removed from reading list for user: {self.user_id}"
         )
-        conn.close()
+        caching.READING_LISTS.update(self.user_id, book_id, None)
+        _publish(self.user_id, "removed", book_id)
 
     def change_reading_status(self, book_id, status):
         """
-        Change the reading status of a book in the reading list.
+        Change the reading status of a book in the reading list and return
+        the book. Nothing is written when the status is unchanged.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        database.update_reading_status(self.user_id, book_id, status, conn)
+        conn = _connect()
+        try:
+            updated_at = database.update_reading_status(
+                self.user_id, book_id, status, conn
+            )
+            book = _get_book(book_id, conn)
+        finally:
+            _close(conn)
+        if updated_at is None:
+            return book
         logging.info(
             f"Service: Book {book_id} status updated to {status} for user: {self.user_id}"
         )
-        conn.close()
+        entry = (models.StatusEnum(status), datetime.fromisoformat(updated_at))
+        caching.READING_LISTS.update(self.user_id, book_id, entry)
+        _publish(self.user_id, "updated", book_id, status)
+        return book
+
+    @staticmethod
+    def apply_batch(user_id, operations: list[models.ReadingListOperation]):
+        """
+        Applies a list of add, update and remove operations to the reading
+        list in one transaction, without loading it.
+        Each operation is checked against the state left by the previous ones
+        and a failed operation does not stop the others.
+        Returns the result of each operation.
+        """
+
+        if len(operations) > READS_BATCH_MAX_SIZE:
+            raise HTTPException(
+                http_status.HTTP_400_BAD_REQUEST,
+                detail=f"Too many operations! The maximum is {READS_BATCH_MAX_SIZE}.",
+            )
+        book_ids = list({operation.book_id for operation in operations})
+        conn = _connect()
+        try:
+            # No other write can come between the read of the statuses and
+            # the write of the changes
+            database.begin_write(conn)
+            before = database.get_reading_list_statuses(user_id, book_ids, conn)
+            existing_books = database.get_existing_book_ids(book_ids, conn)
+            after = dict(before)
+            results = [
+                _apply_operation(operation, after, existing_books)
+                for operation in operations
+            ]
+            inserts, updates, deletes = _reading_list_changes(before, after)
+            database.apply_reading_list_changes(
+                user_id, inserts, updates, deletes, conn
+            )
+        except Exception:
+            # A shared connection stays open, its lock must be released
+            conn.rollback()
+            raise
+        finally:
+            _close(conn)
+        caching.READING_LISTS.invalidate(user_id)
+        for book_id, status in inserts:
+            _publish(user_id, "added", book_id, status)
+        for status, book_id in updates:
+            _publish(user_id, "updated", book_id, status)
+        for book_id in deletes:
+            _publish(user_id, "removed", book_id)
+        logging.info(
+            f"Service: {len(operations)} operations applied to reading list "
+            f"for user: {user_id}"
+        )
+        return results
+
+    @staticmethod
+    def sync_cursor():
+        """
+        Returns a cursor to get the changes made from now on.
+        """
+        return datetime.now(timezone.utc).strftime(_CURSOR_FORMAT)
+
+    @staticmethod
+    def get_changes(user_id, since):
+        """
+        Get the books added, updated and removed since a cursor, and the
+        cursor to use for the next call.
+        Changes made during the second of the cursor are returned again, so
+        none is missed. Throws an error if the cursor is older than the
+        tombstone retention.
+        """
+
+        try:
+            since_time = datetime.strptime(since, _CURSOR_FORMAT).replace(
+                tzinfo=timezone.utc
+            )
+        except ValueError:
+            raise HTTPException(
+                http_status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor!",
+            )
+        retention = timedelta(days=READS_TOMBSTONE_RETENTION_DAYS)
+        if since_time < datetime.now(timezone.utc) - retention:
+            raise HTTPException(
+                http_status.HTTP_410_GONE,
+                detail="Cursor expired, fetch the whole reading list!",
+            )
+
+        cursor = ReadingList.sync_cursor()
+        since = since_time.strftime(_SQLITE_FORMAT)
+        conn = _connect()
+        rows = database.get_reading_list_changes(user_id, since, conn)
+        removed = database.get_tombstones(user_id, since, conn)
+        _close(conn)
+
+        changed = _MY_READ_LIST.validate_python(
+            [
+                {
+                    "id": row[0],
+                    "title": row[1],
+                    "author": row[2],
+                    "genre": row[3],
+                    "reads": row[4],
+                    "status": row[5],
+                    "updated_at": row[6],
+                }
+                for row in rows
+            ]
+        )
+        # A book removed and added again is only reported as changed
+        changed_ids = {book.id for book in changed}
+        logging.info(
+            f"Service: {len(changed)} changed and {len(removed)} removed books "
+            f"since {since} for user: {user_id}"
+        )
+        return models.ReadingListChanges.model_construct(
+            changed=changed,
+            removed=[book_id for book_id in removed if book_id not in changed_ids],
+            cursor=cursor,
+        )
+
+    @staticmethod
+    def get_page(
+        user_id,
+        status: models.StatusEnum | None = None,
+        sort: models.ReadsSort | None = None,
+        cursor: str | None = None,
+        n: int = READS_MAX_PAGE_SIZE,
+    ):
+        """
+        Get a page of the reading list: the first n books, only the ones
+        with the status when given, the most recently updated first unless
+        sorted otherwise, after the cursor of the previous page when given.
+        Returns the (rows, next cursor) batches of the page, to stream, the
+        next cursor being in the last one. Throws an error if the cursor is
+        invalid.
+        """
+
+        after = None if cursor is None else _decode_page_cursor(cursor)
+        status_value = status and models.StatusEnum(status).value
+        order = models.ReadsSort(sort or models.ReadsSort.recent).value
+        return ReadingList._iter_page(user_id, status_value, order, after, n)
+
+    @staticmethod
+    def _iter_page(user_id, status, sort, after, n):
+        # The response is streamed from a thread pool, each batch may be
+        # fetched from a different thread
+        conn = database.connect(SQLITE_DB, check_same_thread=False)
+        try:
+            # One more book is fetched to know whether there is a next page
+            remaining, last, more = n, None, False
+            for batch in database.iter_reading_list_page(
+                user_id, status, sort, after, n + 1, conn
+            ):
+                rows = batch[:remaining]
+                more = more or len(rows) < len(batch)
+                if rows:
+                    remaining -= len(rows)
+                    last = rows[-1]
+                    yield [(*row[:6], row[6].replace(" ", "T")) for row in rows], None
+            yield [], _encode_page_cursor(last) if more else None
+        finally:
+            conn.close()
+
+    @staticmethod
+    def compact_tombstones():
+        """
+        Purge the tombstones older than the retention, which no valid cursor
+        can need anymore.
+        """
+
+        retention = timedelta(days=READS_TOMBSTONE_RETENTION_DAYS)
+        before = datetime.now(timezone.utc) - retention
+        conn = _connect()
+        purged = database.purge_tombstones(before.strftime(_SQLITE_FORMAT), conn)
+        _close(conn)
+        return purged
 
     def get_recommendations(self, n: int = 15):
         """
@@ -345,21 +1045,103 @@ class ReadingList:
         Returns top n books (sorted by number of reads) that are not in the reading list.
         """
 
-        conn = sqlite3.connect(SQLITE_DB)
-        # for each genre in the reading list, get the books in that genre
-        _books = []
+        reading = {book.id for book in self.books}
+        conn = _connect()
+        # The n most read books of each genre of the reading list, once the
+        # books already in the reading list are removed
+        books = {}
         for genre in self.get_genres():
-            _books.extend(database.get_books_by_genre(genre, conn))
-
-        books = list(set(_books))
-        books = [Book.from_db(book[0]) for book in books]
-
-        # remove the books that are already in the reading list
-        books = [book for book in books if book not in self.books]
+            for row in database.get_books(
+                0, n + len(reading), genre, None, "popular", conn
+            ):
+                if row[0] not in reading:
+                    books[row[0]] = _book_from_row(row, row[4])
+        _close(conn)
         logging.info(
             f"Service: Recommendations generated for user: {self.user_id}. "
             f"Total books: {len(books)}"
         )
-        books.sort(key=lambda book: book.reads, reverse=True)
-        conn.close()
-        return books[:n]
+        return sorted(books.values(), key=lambda book: book.reads, reverse=True)[:n]
+
+
+class Stats:
+    """
+    Class for the catalog statistics, read from the rollup tables kept up to
+    date by the database triggers.
+    """
+
+    @staticmethod
+    def get(n: int = 10, days: int = 30) -> models.Stats:
+        """
+        Get the number of reading list entries of each status, overall and
+        by genre, the books completed each day of the last `days` days (UTC)
+        and the n books the most users are reading.
+        """
+
+        first_day = datetime.now(timezone.utc) - timedelta(days=days - 1)
+        conn = _connect()
+        totals = database.get_status_totals(conn)
+        genres = database.get_genre_stats(conn)
+        daily = database.get_daily_completions(first_day.strftime("%Y-%m-%d"), conn)
+        trending = database.get_trending_books(n, conn)
+        _close(conn)
+
+        return models.Stats(
+            statuses=models.StatusCounts(**_status_counts(*totals)),
+            genres=[
+                models.GenreStats(genre=row[0], **_status_counts(*row[1:]))
+                for row in genres
+            ],
+            daily_completions=[
+                models.DailyCompletions(day=day, completions=completions)
+                for day, completions in daily
+            ],
+            trending=[
+                models.TrendingBook(
+                    id=row[0],
+                    title=row[1],
+                    author=row[2],
+                    genre=row[3],
+                    reads=row[4],
+                    readers=row[5],
+                )
+                for row in trending
+            ],
+        )
+
+
+class Export:
+    """
+    Class for streaming data exports.
+    The generators keep their connection open until they are exhausted or
+    closed, and only hold one batch of rows at a time.
+    """
+
+    BOOK_COLUMNS = ("id", "title", "author", "genre", "reads")
+    READ_COLUMNS = BOOK_COLUMNS + ("status", "updated_at")
+
+    @staticmethod
+    def books():
+        """
+        Yields batches of all the books in the catalog.
+        """
+
+        # The response is streamed from a thread pool, each batch may be
+        # fetched from a different thread
+        conn = database.connect(SQLITE_DB, check_same_thread=False)
+        try:
+            yield from database.iter_books(conn)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def reads(user_id):
+        """
+        Yields batches of the books in the user's reading list.
+        """
+
+        conn = database.connect(SQLITE_DB, check_same_thread=False)
+        try:
+            yield from database.iter_reading_list(user_id, conn)
+        finally:
+            conn.close()
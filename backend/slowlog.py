@@ -0,0 +1,263 @@
+"""
+This module contains the slow query log.
+
+Every connection gets a trace callback recording the statements it runs.
+The database functions are wrapped with `tracked`, which groups the traced
+statements by call and times each statement until the next one starts (or
+until the function returns), without the time spent in the tracked
+functions it calls meanwhile. For generator functions only the time spent
+producing the items counts, not the time the caller takes to consume
+them. Statements slower than the threshold are
+normalized to a fingerprint and aggregated, with their query plan.
+"""
+
+import functools
+import inspect
+import json
+import logging
+import re
+import sqlite3
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from time import perf_counter
+
+from .const import SLOW_QUERY_MS
+
+logger = logging.getLogger("backend.slowlog")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+_local = threading.local()
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalizes a statement so that executions with different values share
+    the same fingerprint: literals become ?, IN lists collapse and
+    whitespace is squeezed.
+    """
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(?+)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction (0-1) of the sorted values.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "function", "calls", "durations", "max", "plan")
+
+    def __init__(self, fingerprint, function, samples):
+        self.fingerprint = fingerprint
+        self.function = function
+        self.calls = 0
+        self.durations = deque(maxlen=samples)
+        self.max = 0.0
+        self.plan = None
+
+
+class SlowQueryLog:
+    """
+    Aggregates the slow statements by fingerprint.
+    Only the last `samples` durations of each fingerprint are kept to compute
+    the percentiles, so memory is bounded by the number of distinct statements.
+    """
+
+    def __init__(self, threshold_ms, samples=1000):
+        self.threshold = threshold_ms / 1000
+        self.samples = samples
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def record(self, function, statement, elapsed, conn=None):
+        key = fingerprint(statement)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _Entry(key, function, self.samples)
+            entry.calls += 1
+            entry.durations.append(elapsed)
+            entry.max = max(entry.max, elapsed)
+            new_plan = entry.plan is None and conn is not None
+        if new_plan:
+            entry.plan = explain(statement, conn)
+        logger.warning(
+            json.dumps(
+                {
+                    "function": function,
+                    "fingerprint": key,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "plan": entry.plan if new_plan else None,
+                }
+            )
+        )
+
+    def report(self):
+        """
+        Returns the aggregated entries, slowest (by p99) first.
+        """
+        with self.lock:
+            entries = [
+                (entry, list(entry.durations)) for entry in self.entries.values()
+            ]
+        report = [
+            {
+                "fingerprint": entry.fingerprint,
+                "function": entry.function,
+                "calls": entry.calls,
+                "p50_ms": percentile(durations, 0.5) * 1000,
+                "p99_ms": percentile(durations, 0.99) * 1000,
+                "max_ms": entry.max * 1000,
+                "plan": entry.plan or [],
+            }
+            for entry, durations in entries
+        ]
+        report.sort(key=lambda item: item["p99_ms"], reverse=True)
+        return report
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+
+SLOW_QUERIES = SlowQueryLog(SLOW_QUERY_MS)
+
+
+def explain(statement, conn):
+    """
+    Returns the query plan of the statement, one line per plan step.
+    Returns an empty plan for statements that cannot be explained.
+    """
+    if not isinstance(conn, sqlite3.Connection):
+        return []
+    _local.explaining = True
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()  # nosec
+    except sqlite3.Error:
+        return []
+    finally:
+        _local.explaining = False
+    return [row[3] for row in rows]
+
+
+def _trace(statement):
+    calls = getattr(_local, "calls", None)
+    if calls and not getattr(_local, "explaining", False):
+        # Start, statement and time spent in nested tracked calls
+        calls[-1].append([perf_counter(), statement, 0.0])
+
+
+def install(conn: sqlite3.Connection):
+    """
+    Installs the trace callback on a connection.
+    A negative threshold disables the slow query log.
+    """
+    if SLOW_QUERY_MS >= 0:
+        conn.set_trace_callback(_trace)
+
+
+def configure_file(path, max_bytes):
+    """
+    Also writes the slow statements to a rotating file.
+    """
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+
+
+def _record_statements(function, statements, end, conn):
+    ends = [start for start, _, _ in statements[1:]] + [end]
+    for (start, statement, nested), stop in zip(statements, ends):
+        elapsed = stop - start - nested
+        if elapsed >= SLOW_QUERIES.threshold:
+            SLOW_QUERIES.record(function, statement, elapsed, conn)
+
+
+class _Call:
+    """
+    Collects the statements run by a call of a tracked function, while
+    entered. The time spent in it is not charged to the statement of the
+    caller running meanwhile.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        self.calls = _local.__dict__.setdefault("calls", [])
+        self.calls.append(self.statements)
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.end = perf_counter()
+        self.calls.pop()
+        if self.calls and self.calls[-1]:
+            self.calls[-1][-1][2] += self.end - self.start
+
+
+_DONE = object()
+
+
+def tracked(func):
+    """
+    Decorator collecting the statements run by a database function and
+    recording the slow ones. Generator functions are timed while producing
+    their items: the pauses between the items are not charged to the
+    statement running.
+    """
+    name = func.__name__
+    conn_index = list(inspect.signature(func).parameters).index("conn")
+
+    def connection(args, kwargs):
+        conn = kwargs.get("conn")
+        if conn is None and len(args) > conn_index:
+            conn = args[conn_index]
+        return conn
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            call = _Call()
+            iterator = func(*args, **kwargs)
+            try:
+                while True:
+                    with call:
+                        item = next(iterator, _DONE)
+                    if item is _DONE:
+                        return
+                    yield item
+                    if call.statements:
+                        call.statements[-1][2] += perf_counter() - call.end
+            finally:
+                iterator.close()
+                if call.statements:
+                    _record_statements(
+                        name, call.statements, call.end, connection(args, kwargs)
+                    )
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = _Call()
+        try:
+            with call:
+                return func(*args, **kwargs)
+        finally:
+            if call.statements:
+                _record_statements(
+                    name, call.statements, call.end, connection(args, kwargs)
+                )
+
+    return wrapper
@@ -0,0 +1,223 @@
+"""
+This module contains the in-memory snapshot of the catalog serving the
+read-only catalog endpoints.
+
+The books are stored by column: arrays of ids, read counts and author and
+genre codes, and a list of interned titles. Rows are only materialized for
+the books of a response. A snapshot is immutable: when the catalog version
+changes, a new one is loaded in the background and replaces it as a whole.
+"""
+
+import bisect
+import logging
+import sys
+import threading
+import time
+from array import array
+
+from .const import CATALOG_SNAPSHOT_REFRESH_SECONDS
+
+# Sorts of the books (see database.BOOK_SORTS), "recent" reads the id
+# order backwards
+SORTS = (None, "popular", "title")
+# A new snapshot is loaded at least LOAD_INTERVAL_FACTOR times the duration
+# of the last load after it, so that the background loads of a large
+# catalog changing all the time take a bounded share of the CPU
+LOAD_INTERVAL_FACTOR = 10
+
+
+class BookRow:
+    """
+    View of a book of a snapshot.
+    """
+
+    __slots__ = ("snapshot", "row")
+
+    def __init__(self, snapshot, row):
+        self.snapshot = snapshot
+        self.row = row
+
+    @property
+    def id(self):
+        return self.snapshot.ids[self.row]
+
+    @property
+    def title(self):
+        return self.snapshot.titles[self.row]
+
+    @property
+    def author(self):
+        return self.snapshot.authors[self.snapshot.author_codes[self.row]]
+
+    @property
+    def genre(self):
+        return self.snapshot.genres[self.snapshot.genre_codes[self.row]]
+
+    @property
+    def reads(self):
+        return self.snapshot.reads[self.row]
+
+
+def _code(codes: dict, names: list, name):
+    code = codes.get(name)
+    if code is None:
+        code = codes[name] = len(names)
+        names.append(sys.intern(name))
+    return code
+
+
+class CatalogSnapshot:
+    """
+    Columnar copy of the catalog at a catalog version, built from batches of
+    (id, title, author, genre, reads) rows in id order.
+    The orders of every sort are computed upfront, for the whole catalog and
+    for each genre, as arrays of row numbers.
+    """
+
+    __slots__ = (
+        "version",
+        "ids",
+        "titles",
+        "authors",
+        "author_codes",
+        "genres",
+        "genre_codes",
+        "genre_index",
+        "reads",
+        "orders",
+        "genre_orders",
+    )
+
+    def __init__(self, version, batches):
+        self.version = version
+        self.ids = array("q")
+        self.titles = []
+        self.authors = []
+        self.author_codes = array("I")
+        self.genres = []
+        self.genre_codes = array("I")
+        self.reads = array("I")
+        author_index = {}
+        self.genre_index = {}
+        for batch in batches:
+            for book_id, title, author, genre, reads in batch:
+                self.ids.append(book_id)
+                self.titles.append(sys.intern(title))
+                self.author_codes.append(_code(author_index, self.authors, author))
+                self.genre_codes.append(_code(self.genre_index, self.genres, genre))
+                self.reads.append(reads)
+
+        rows = range(len(self.ids))
+        # Ties are broken by id: the sorts are stable and the rows are by id
+        self.orders = {
+            None: rows,
+            "popular": array(
+                "I", sorted(reversed(rows), key=self.reads.__getitem__, reverse=True)
+            ),
+            "title": array("I", sorted(rows, key=self.titles.__getitem__)),
+        }
+        self.genre_orders = [{sort: array("I") for sort in SORTS} for _ in self.genres]
+        for sort in SORTS:
+            for row in self.orders[sort]:
+                self.genre_orders[self.genre_codes[row]][sort].append(row)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, book_id) -> BookRow | None:
+        """
+        Returns the book with the given id, or None if it is not in the
+        snapshot.
+        """
+        row = bisect.bisect_left(self.ids, book_id)
+        if row < len(self.ids) and self.ids[row] == book_id:
+            return BookRow(self, row)
+        return None
+
+    def get_genres(self) -> list[str]:
+        """
+        Returns the genres of the books, sorted.
+        """
+        return sorted(self.genres)
+
+    def page(self, start, n, genre=None, sort=None) -> list[BookRow]:
+        """
+        Returns the n books from the offset start, only the ones of the
+        genre when it is not None, in one of the database.BOOK_SORTS orders.
+        """
+        if genre is None:
+            orders = self.orders
+        elif genre in self.genre_index:
+            orders = self.genre_orders[self.genre_index[genre]]
+        else:
+            return []
+        if sort == "recent":
+            # The same books as the id order, counted from the end
+            stop = max(len(orders[None]) - start, 0)
+            first = max(stop - n, 0)
+            rows = reversed(orders[None][first:stop])
+        else:
+            stop = start + n
+            rows = orders[sort][start:stop]
+        return [BookRow(self, row) for row in rows]
+
+
+class CurrentSnapshot:
+    """
+    Holds the snapshot served to the readers. When it is older than the
+    catalog, a new one is loaded in a background thread, one at a time and
+    at most one every `min_interval` seconds, or LOAD_INTERVAL_FACTOR times
+    the duration of the last load if longer, while the previous one keeps
+    being served.
+    Snapshots are any objects with a `version` and a length.
+    """
+
+    def __init__(self, min_interval, name="Catalog snapshot"):
+        self.min_interval = min_interval
+        self.name = name
+        self.snapshot = None
+        self.loading = False
+        self.loaded_at = float("-inf")
+        self.load_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, version, load):
+        """
+        Returns the current snapshot, or None if none was loaded. Starts
+        loading a new one with `load` if it is not at the given version.
+        """
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version != version:
+            self.refresh(load)
+        return snapshot
+
+    def refresh(self, load):
+        with self.lock:
+            interval = max(self.min_interval, self.load_seconds * LOAD_INTERVAL_FACTOR)
+            if self.loading or time.monotonic() - self.loaded_at < interval:
+                return
+            self.loading = True
+        threading.Thread(target=self._load, args=(load,), daemon=True).start()
+
+    def set(self, snapshot: CatalogSnapshot):
+        # Replacing the reference is atomic, readers see either snapshot
+        self.snapshot = snapshot
+        logging.info(
+            f"Snapshot: {self.name} of {len(snapshot)} entries "
+            f"at version {snapshot.version}"
+        )
+
+    def _load(self, load):
+        start = time.monotonic()
+        try:
+            self.set(load())
+        except Exception:
+            logging.exception(f"Snapshot: {self.name} refresh failed")
+        finally:
+            with self.lock:
+                self.loading = False
+                self.loaded_at = time.monotonic()
+                self.load_seconds = self.loaded_at - start
+
+
+CATALOG = CurrentSnapshot(CATALOG_SNAPSHOT_REFRESH_SECONDS)
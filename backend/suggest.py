@@ -0,0 +1,134 @@
+"""
+This module contains the prefix index of the titles and authors serving the
+autocomplete of the search.
+
+Texts are normalized (lowercased, without accents nor punctuation) and keyed
+from each of their words, so "hob" suggests "The Hobbit". The keys are kept
+sorted: the ones starting with a prefix are a range, found by bisection.
+The most read texts of the prefixes of many keys are computed upfront, the
+ranges of the other prefixes are short enough to be ranked on the fly.
+"""
+
+import bisect
+import heapq
+import re
+import sys
+import unicodedata
+from array import array
+
+from .const import SUGGEST_REFRESH_SECONDS, SUGGEST_TOP_K
+from .snapshot import CatalogSnapshot, CurrentSnapshot
+
+_WORD = re.compile(r"\w+")
+# Sorts after any character, the keys starting with p are >= p and < p + _LAST
+_LAST = chr(sys.maxunicode)
+# Prefixes of more keys than this get their suggestions computed upfront
+SCAN_KEYS = 256
+
+
+def normalize(text) -> str:
+    """
+    Returns the lowercase words of a text, without accents, separated by
+    single spaces.
+    """
+    text = text.casefold()
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_WORD.findall(text))
+
+
+def _keys(text):
+    """
+    Returns the keys of a text: its normalized words from each word on.
+    """
+    words = normalize(text).split(" ")
+    return {" ".join(words[start:]) for start in range(len(words))} - {""}
+
+
+class PrefixIndex:
+    """
+    Index of the titles and authors of a catalog snapshot by prefix, with
+    their total read count.
+    Texts are numbered from the most read: the best texts of a set of keys
+    are the ones with the smallest codes.
+    """
+
+    __slots__ = ("version", "texts", "titles", "reads", "keys", "codes", "top")
+
+    def __init__(self, catalog: CatalogSnapshot, k=SUGGEST_TOP_K):
+        self.version = catalog.version
+        title_reads: dict[str, int] = {}
+        for title, reads in zip(catalog.titles, catalog.reads):
+            title_reads[title] = title_reads.get(title, 0) + reads
+        author_reads = [0] * len(catalog.authors)
+        for code, reads in zip(catalog.author_codes, catalog.reads):
+            author_reads[code] += reads
+
+        # (reads, is a title, text) of every text, the most read first
+        texts = sorted(
+            [(-reads, 0, title) for title, reads in title_reads.items()]
+            + [
+                (-reads, 1, author)
+                for author, reads in zip(catalog.authors, author_reads)
+            ]
+        )
+        self.texts = [text for _, _, text in texts]
+        self.titles = [kind == 0 for _, kind, _ in texts]
+        self.reads = array("Q", [-reads for reads, _, _ in texts])
+
+        entries = sorted(
+            (key, code) for code, text in enumerate(self.texts) for key in _keys(text)
+        )
+        self.keys = [key for key, _ in entries]
+        self.codes = array("I", [code for _, code in entries])
+        # Codes of the best texts of the prefixes of more than SCAN_KEYS keys
+        self.top: dict[str, list[int]] = {}
+        self._rank("", 0, len(self.keys), k)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _rank(self, prefix, lo, hi, k):
+        """
+        Returns the codes of the k best texts of the keys lo to hi, which
+        start with the prefix. Stores the ones of the long ranges, down the
+        prefixes one character at a time.
+        """
+        if hi - lo <= SCAN_KEYS:
+            return heapq.nsmallest(k, set(self.codes[lo:hi]))
+        depth = len(prefix) + 1
+        best = set()
+        # The keys equal to the prefix come first, then the longer ones
+        equal = bisect.bisect_right(self.keys, prefix, lo, hi)
+        best.update(self.codes[lo:equal])
+        lo = equal
+        while lo < hi:
+            child = self.keys[lo][:depth]
+            end = bisect.bisect_left(self.keys, child + _LAST, lo, hi)
+            best.update(self._rank(child, lo, end, k))
+            lo = end
+        top = self.top[prefix] = heapq.nsmallest(k, best)
+        return top
+
+    def suggest(self, prefix, n) -> list[tuple[str, bool, int]]:
+        """
+        Returns the (text, is a title, reads) of the n most read texts
+        having a key starting with the prefix, at most k.
+        """
+        normalized = normalize(prefix)
+        if not normalized:
+            return []
+        # A space after the last word only matches the whole word
+        prefix = normalized + " " if prefix[-1].isspace() else normalized
+        top = self.top.get(prefix)
+        if top is None:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + _LAST, lo)
+            top = heapq.nsmallest(n, set(self.codes[lo:hi]))
+        return [
+            (self.texts[code], self.titles[code], self.reads[code]) for code in top[:n]
+        ]
+
+
+SUGGESTIONS = CurrentSnapshot(SUGGEST_REFRESH_SECONDS, name="Prefix index")
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from backend import datagen
+
+# Number of books (and about as many reading list rows) of the generated
+# datasets. e.g. BENCH_SIZES=1000,100000,1000000
+SIZES = [int(size) for size in os.environ.get("BENCH_SIZES", "1000").split(",")]
+SEED = 42
+PASSWORD = "benchpass"
+READS_PER_USER = 50
+
+
+def build_dataset(path, size):
+    """
+    Creates a database with `size` books and one user for every 50 of them,
+    each reading 50 books on average. Deterministic for a given size.
+    """
+    conn = sqlite3.connect(path)
+    datagen.generate(
+        conn,
+        books=size,
+        users=max(10, size // READS_PER_USER),
+        reads_per_user=READS_PER_USER,
+        seed=SEED,
+        password=PASSWORD,
+    )
+    conn.close()
+
+
+@pytest.fixture(scope="session", params=SIZES, ids=str)
+def dataset(request, tmp_path_factory):
+    """
+    Generated database, with a few ids and values to query it with.
+    """
+    size = request.param
+    path = str(tmp_path_factory.mktemp("bench") / f"books-{size}.sqlite3")
+    build_dataset(path, size)
+
+    conn = sqlite3.connect(path)
+    user_id, username = conn.execute(
+        """
+        SELECT u.id, u.username FROM users u
+        JOIN reading_list r ON r.user = u.id
+        GROUP BY u.id ORDER BY COUNT(*) DESC LIMIT 1
+        """
+    ).fetchone()
+    book_id = conn.execute(
+        "SELECT book FROM reading_list WHERE user = ? LIMIT 1", (user_id,)
+    ).fetchone()[0]
+    conn.close()
+
+    return SimpleNamespace(
+        path=path,
+        size=size,
+        user_id=user_id,
+        username=username,
+        password=PASSWORD,
+        book_id=book_id,
+        genre="Fiction",
+        title_query="Garden",
+        typo_query="Hiden Gardn",
+    )
+
+
+@pytest.fixture
+def conn(dataset):
+    conn = sqlite3.connect(dataset.path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def bench(request, benchmark, dataset):
+    """
+    Runs a function with a number of rounds that shrinks with the dataset,
+    so the largest datasets stay practical to benchmark.
+    Results are grouped by module and dataset size.
+    """
+    rounds = max(3, 20_000 // dataset.size)
+    benchmark.group = f"{request.module.__name__.split('.')[-1]}[{dataset.size}]"
+
+    def run(func, *args, setup=None):
+        """
+        Benchmarks func(*args). `setup` can instead return the (args, kwargs)
+        of each round, to reset the state changed by a write.
+        """
+        if setup:
+            return benchmark.pedantic(func, setup=setup, rounds=rounds)
+        return benchmark.pedantic(func, args=args, rounds=rounds, iterations=1)
+
+    return run
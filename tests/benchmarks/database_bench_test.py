@@ -0,0 +1,267 @@
+"""
+Benchmarks of the functions of the database module.
+drop_tables is left out, it would destroy the dataset.
+"""
+
+import ast
+import inspect
+import itertools
+import sys
+
+import backend.database as db
+
+_names = itertools.count()
+# Not queries, helpers of the module, or destroying the dataset
+NOT_BENCHMARKED = {"connect", "instrumented", "drop_tables"}
+
+
+def test_every_function_is_benchmarked():
+    functions = {
+        name
+        for name, func in inspect.getmembers(db, inspect.isfunction)
+        if func.__module__ == db.__name__ and name not in NOT_BENCHMARKED
+    }
+    tree = ast.parse(inspect.getsource(sys.modules[__name__]))
+    benchmarked = {
+        node.attr
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Attribute)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == "db"
+    }
+    assert functions - benchmarked == set()
+
+
+# Schema and books
+def test_create_tables(bench, conn):
+    bench(db.create_tables, conn)
+
+
+def test_migrate(bench, conn):
+    bench(db.migrate, conn)
+
+
+def test_create_indexes(bench, conn):
+    bench(db.create_indexes, conn)
+
+
+def test_create_catalog_version_triggers(bench, conn):
+    bench(db.create_catalog_version_triggers, conn)
+
+
+def test_create_book(bench, conn):
+    bench(db.create_book, "Bench Book", "Bench Author", "Genre 0", conn)
+
+
+def test_get_books_first_page(bench, conn):
+    bench(db.get_books, 0, 15, None, None, None, conn)
+
+
+def test_get_books_last_page(bench, conn, dataset):
+    bench(db.get_books, dataset.size - 15, 15, None, None, None, conn)
+
+
+def test_get_genres(bench, conn):
+    bench(db.get_genres, conn)
+
+
+def test_get_book(bench, conn, dataset):
+    bench(db.get_book, dataset.book_id, conn)
+
+
+def test_get_existing_book_ids(bench, conn, dataset):
+    book_ids = list(range(dataset.size, 0, -dataset.size // 50))
+    bench(db.get_existing_book_ids, book_ids, conn)
+
+
+def test_get_books_by_ids(bench, conn, dataset):
+    bench(db.get_books_by_ids, list(range(dataset.size, 0, -dataset.size // 50)), conn)
+
+
+def test_get_book_count(bench, conn):
+    bench(db.get_book_count, conn)
+
+
+def test_get_catalog_version(bench, conn):
+    bench(db.get_catalog_version, conn)
+
+
+def test_search_book_by_title(bench, conn, dataset):
+    bench(db.search_book_by_title, dataset.title_query, 0, 101, conn)
+
+
+def test_count_title_matches(bench, conn, dataset):
+    bench(db.count_title_matches, dataset.title_query, 10_000, conn)
+
+
+def test_get_popular_books_of_genre(bench, conn, dataset):
+    bench(db.get_books, 0, 15, dataset.genre, None, "popular", conn)
+
+
+def test_iter_books(bench, conn):
+    bench(lambda: sum(len(batch) for batch in db.iter_books(conn)))
+
+
+def test_update_book(bench, conn, dataset):
+    bench(db.update_book, 1, "1984", "George Orwell", "Dystopian", conn)
+
+
+def test_delete_book(bench, conn):
+    def setup():
+        db.create_book("Deleted Book", "Bench Author", "Genre 0", conn)
+        book_id = conn.execute("SELECT MAX(id) FROM books").fetchone()[0]
+        return (book_id, conn), {}
+
+    bench(db.delete_book, setup=setup)
+
+
+# Users
+def test_create_user(bench, conn):
+    bench(lambda: db.create_user(f"bench{next(_names)}", "hash", conn))
+
+
+def test_get_users(bench, conn):
+    bench(db.get_users, conn)
+
+
+def test_get_user(bench, conn, dataset):
+    bench(db.get_user, dataset.user_id, conn)
+
+
+def test_get_user_by_username(bench, conn, dataset):
+    bench(db.get_user_by_username, dataset.username, conn)
+
+
+def test_update_user(bench, conn, dataset):
+    password_hash = db.get_user(dataset.user_id, conn)[2]
+    bench(db.update_user, dataset.user_id, dataset.username, password_hash, conn)
+
+
+def test_delete_user(bench, conn):
+    def setup():
+        db.create_user(f"deleted{next(_names)}", "hash", conn)
+        user_id = conn.execute("SELECT MAX(id) FROM users").fetchone()[0]
+        return (user_id, conn), {}
+
+    bench(db.delete_user, setup=setup)
+
+
+# Reading lists
+def test_create_reading_list(bench, conn, dataset):
+    def setup():
+        db.remove_from_reading_list(dataset.user_id, 1, conn)
+        return (dataset.user_id, 1, "not_started", conn), {}
+
+    bench(db.create_reading_list, setup=setup)
+
+
+def test_get_reading_lists(bench, conn, dataset):
+    bench(db.get_reading_lists, dataset.user_id, conn)
+
+
+def test_iter_reading_list(bench, conn, dataset):
+    bench(
+        lambda: sum(len(batch) for batch in db.iter_reading_list(dataset.user_id, conn))
+    )
+
+
+def test_iter_reading_list_page(bench, conn, dataset):
+    bench(
+        lambda: sum(
+            len(batch)
+            for batch in db.iter_reading_list_page(
+                dataset.user_id, "started", "recent", None, 51, conn
+            )
+        )
+    )
+
+
+def test_begin_write(bench, conn):
+    def begin_write():
+        db.begin_write(conn)
+        conn.rollback()
+
+    bench(begin_write)
+
+
+def test_get_reading_list_statuses(bench, conn, dataset):
+    book_ids = list(range(dataset.size, 0, -dataset.size // 50))
+    bench(db.get_reading_list_statuses, dataset.user_id, book_ids, conn)
+
+
+def test_apply_reading_list_changes(bench, conn, dataset):
+    def setup():
+        db.remove_from_reading_list(dataset.user_id, 3, conn)
+        db.create_reading_list(dataset.user_id, 4, "not_started", conn)
+        db.create_reading_list(dataset.user_id, 5, "not_started", conn)
+        changes = ([(3, "started")], [("complete", 4)], [5])
+        return (dataset.user_id, *changes, conn), {}
+
+    bench(db.apply_reading_list_changes, setup=setup)
+
+
+def test_get_reading_list_changes(bench, conn, dataset):
+    bench(db.get_reading_list_changes, dataset.user_id, "2000-01-01 00:00:00", conn)
+
+
+def test_get_tombstones(bench, conn, dataset):
+    bench(db.get_tombstones, dataset.user_id, "2000-01-01 00:00:00", conn)
+
+
+def test_purge_tombstones(bench, conn, dataset):
+    def setup():
+        db.create_reading_list(dataset.user_id, 6, "not_started", conn)
+        db.remove_from_reading_list(dataset.user_id, 6, conn)
+        return ("9999-12-31 00:00:00", conn), {}
+
+    bench(db.purge_tombstones, setup=setup)
+
+
+def test_get_book_in_reading_list(bench, conn, dataset):
+    bench(db.get_book_in_reading_list, dataset.user_id, dataset.book_id, conn)
+
+
+def test_get_completed_books(bench, conn, dataset):
+    bench(db.get_completed_books, dataset.user_id, conn)
+
+
+def test_get_readers(bench, conn, dataset):
+    bench(db.get_readers, dataset.book_id, conn)
+
+
+def test_get_book_read_count(bench, conn, dataset):
+    bench(db.get_book_read_count, dataset.book_id, conn)
+
+
+def test_remove_from_reading_list(bench, conn, dataset):
+    def setup():
+        db.create_reading_list(dataset.user_id, 2, "not_started", conn)
+        return (dataset.user_id, 2, conn), {}
+
+    bench(db.remove_from_reading_list, setup=setup)
+
+
+def test_update_reading_status(bench, conn, dataset):
+    statuses = itertools.cycle(["started", "complete"])
+    bench(
+        lambda: db.update_reading_status(
+            dataset.user_id, dataset.book_id, next(statuses), conn
+        )
+    )
+
+
+# Statistics
+def test_get_status_totals(bench, conn):
+    bench(db.get_status_totals, conn)
+
+
+def test_get_genre_stats(bench, conn):
+    bench(db.get_genre_stats, conn)
+
+
+def test_get_daily_completions(bench, conn):
+    bench(db.get_daily_completions, "2000-01-01", conn)
+
+
+def test_get_trending_books(bench, conn):
+    bench(db.get_trending_books, 10, conn)
@@ -0,0 +1,325 @@
+"""
+Benchmarks of the service layer, against the generated datasets.
+"""
+
+import ast
+import inspect
+import itertools
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import backend.database as db
+import backend.models as models
+import backend.search as search
+import backend.service as service
+import backend.snapshot as snapshot
+import backend.suggest as suggest
+
+_names = itertools.count()
+# Benchmarked through User.create_user and User.check_user
+NOT_BENCHMARKED = {"Hasher.password_hash", "Hasher.password_verification"}
+# Variables holding an instance of a service class
+INSTANCES = {"reading_list": "ReadingList"}
+
+
+def test_every_method_is_benchmarked():
+    methods = {
+        f"{class_name}.{name}"
+        for class_name, cls in inspect.getmembers(service, inspect.isclass)
+        if cls.__module__ == service.__name__
+        for name, _ in inspect.getmembers(cls, inspect.isfunction)
+        if not name.startswith("_")
+    }
+    benchmarked = set()
+    for node in ast.walk(ast.parse(inspect.getsource(sys.modules[__name__]))):
+        if not isinstance(node, ast.Attribute):
+            continue
+        owner = node.value
+        if isinstance(owner, ast.Name) and owner.id in INSTANCES:
+            benchmarked.add(f"{INSTANCES[owner.id]}.{node.attr}")
+        elif (
+            isinstance(owner, ast.Attribute)
+            and isinstance(owner.value, ast.Name)
+            and owner.value.id == "service"
+        ):
+            benchmarked.add(f"{owner.attr}.{node.attr}")
+    assert methods - NOT_BENCHMARKED - benchmarked == set()
+
+
+@pytest.fixture(autouse=True)
+def service_db(dataset, monkeypatch):
+    monkeypatch.setattr(service, "SQLITE_DB", dataset.path)
+
+
+# Users
+def test_create_user(bench):
+    bench(lambda: service.User.create_user(f"service{next(_names)}", "pw", "pw"))
+
+
+def test_verify_new_user(bench, dataset):
+    bench(service.User.verify_new_user, dataset.username)
+
+
+def test_check_user(bench, dataset):
+    bench(service.User.check_user, dataset.username, dataset.password)
+
+
+def test_get_user(bench, dataset):
+    bench(service.User.get_user, dataset.user_id)
+
+
+# Books
+def test_book_from_db(bench, dataset):
+    bench(service.Book.from_db, dataset.book_id)
+
+
+def test_get_books(bench):
+    bench(service.Book.get_books, 0, 15)
+
+
+def test_search_book(bench, dataset):
+    bench(service.Book.search_book, dataset.title_query)
+
+
+def test_search_page(bench, dataset):
+    bench(service.Book.search_page, dataset.title_query, None, 20, True)
+
+
+def test_get_books_by_ids(bench, dataset):
+    bench(
+        service.Book.get_books_by_ids, list(range(1, dataset.size, dataset.size // 50))
+    )
+
+
+def test_get_catalog_version(bench):
+    bench(service.Book.get_catalog_version)
+
+
+def test_from_ids(bench, dataset):
+    bench(service.Book.from_ids, list(range(1, dataset.size, dataset.size // 50)))
+
+
+def test_create_book(bench, search_index):
+    bench(service.Book.create_book, "Bench Book", "Bench Author", "Genre 0")
+
+
+def test_update_book(bench, search_index):
+    bench(service.Book.update_book, 1, "1984", "George Orwell", "Dystopian")
+
+
+def test_delete_book(bench, search_index):
+    def setup():
+        book_id = service.Book.create_book("Deleted Book", "Bench Author", "Genre 0")
+        return (book_id,), {}
+
+    bench(service.Book.delete_book, setup=setup)
+
+
+def test_get_genres(bench):
+    bench(service.Book.get_genres)
+
+
+def test_get_books_by_genre(bench, dataset):
+    bench(service.Book.get_books_by_genre, dataset.genre)
+
+
+# Catalog snapshot
+@pytest.fixture
+def catalog(service_db):
+    return service.Catalog.load()
+
+
+def test_catalog_load(bench):
+    bench(service.Catalog.load)
+
+
+def test_catalog_preload(bench, monkeypatch):
+    monkeypatch.setattr(snapshot, "CATALOG", snapshot.CurrentSnapshot(0))
+    bench(service.Catalog.preload)
+
+
+def test_catalog_snapshot(bench, catalog, monkeypatch):
+    monkeypatch.setattr(snapshot.CATALOG, "snapshot", catalog)
+    bench(service.Catalog.snapshot)
+
+
+def test_book_from_snapshot(bench, dataset, catalog):
+    bench(service.Book.from_ids, [dataset.book_id], catalog)
+
+
+def test_get_books_from_snapshot(bench, catalog):
+    bench(service.Book.get_books, 0, 15, None, None, None, catalog)
+
+
+def test_get_books_by_ids_from_snapshot(bench, dataset, catalog):
+    book_ids = list(range(1, dataset.size, dataset.size // 50))
+    bench(service.Book.get_books_by_ids, book_ids, catalog)
+
+
+def test_get_genres_from_snapshot(bench, catalog):
+    bench(service.Book.get_genres, catalog)
+
+
+def test_get_books_by_genre_from_snapshot(bench, dataset, catalog):
+    bench(service.Book.get_books_by_genre, dataset.genre, catalog)
+
+
+# Search index
+@pytest.fixture
+def search_index(service_db, monkeypatch):
+    monkeypatch.setattr(search, "INDEX", search.TrigramIndex())
+    service.Search.preload()
+    return search.INDEX
+
+
+def test_search_index_load(bench, service_db, monkeypatch):
+    monkeypatch.setattr(search, "INDEX", search.TrigramIndex())
+    bench(service.Search.preload)
+
+
+def test_search_index(bench, dataset, search_index):
+    bench(
+        search_index.search,
+        dataset.typo_query,
+        service.SEARCH_SIMILARITY_THRESHOLD,
+        service.SEARCH_MAX_RESULTS,
+    )
+
+
+def test_search_book_from_index(bench, dataset, search_index, catalog, monkeypatch):
+    monkeypatch.setattr(snapshot.CATALOG, "snapshot", catalog)
+    bench(service.Book.search_book, dataset.typo_query)
+
+
+# Autocomplete
+def test_prefix_index_build(bench, catalog):
+    bench(suggest.PrefixIndex, catalog)
+
+
+def test_suggestions(bench, catalog, monkeypatch):
+    monkeypatch.setattr(snapshot.CATALOG, "snapshot", catalog)
+    monkeypatch.setattr(suggest.SUGGESTIONS, "snapshot", suggest.PrefixIndex(catalog))
+    bench(service.Search.suggestions)
+
+
+def test_suggest(bench, dataset, catalog):
+    index = suggest.PrefixIndex(catalog)
+    bench(service.Search.suggest, dataset.title_query[:3], suggest.SUGGEST_TOP_K, index)
+
+
+# Reading lists
+def test_reading_list_load(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+    bench(reading_list.load)
+
+
+def test_reading_list_hydrate(bench, dataset):
+    entries = service.ReadingList(dataset.user_id).load()
+    bench(service.ReadingList.hydrate, entries)
+
+
+def test_reading_list_hydrate_from_snapshot(bench, dataset, catalog, monkeypatch):
+    monkeypatch.setattr(snapshot.CATALOG, "snapshot", catalog)
+    entries = service.ReadingList(dataset.user_id).load()
+    bench(service.ReadingList.hydrate, entries)
+
+
+def test_get_genres_of_reading_list(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+    bench(reading_list.get_genres)
+
+
+def test_add_book(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+
+    def setup():
+        reading_list.remove_book(1)
+        return (1,), {}
+
+    bench(reading_list.add_book, setup=setup)
+
+
+def test_read_books(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+    bench(reading_list.read_books)
+
+
+def test_remove_book(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+
+    def setup():
+        reading_list.add_book(2)
+        return (2,), {}
+
+    bench(reading_list.remove_book, setup=setup)
+
+
+def test_change_reading_status(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+    statuses = itertools.cycle(["started", "complete"])
+    bench(lambda: reading_list.change_reading_status(dataset.book_id, next(statuses)))
+
+
+def test_apply_batch(bench, conn, dataset):
+    operations = [
+        models.ReadingListOperation(action="add", book_id=3),
+        models.ReadingListOperation(action="update", book_id=4, status="complete"),
+        models.ReadingListOperation(action="remove", book_id=5),
+    ]
+
+    def setup():
+        db.remove_from_reading_list(dataset.user_id, 3, conn)
+        db.create_reading_list(dataset.user_id, 4, "not_started", conn)
+        db.create_reading_list(dataset.user_id, 5, "not_started", conn)
+        return (dataset.user_id, operations), {}
+
+    bench(service.ReadingList.apply_batch, setup=setup)
+
+
+def test_sync_cursor(bench):
+    bench(service.ReadingList.sync_cursor)
+
+
+def test_get_changes(bench, dataset):
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    cursor = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+    bench(service.ReadingList.get_changes, dataset.user_id, cursor)
+
+
+def test_compact_tombstones(bench, conn, dataset):
+    def setup():
+        db.create_reading_list(dataset.user_id, 6, "not_started", conn)
+        db.remove_from_reading_list(dataset.user_id, 6, conn)
+        return (), {}
+
+    bench(service.ReadingList.compact_tombstones, setup=setup)
+
+
+def test_get_recommendations(bench, dataset):
+    reading_list = service.ReadingList(dataset.user_id)
+    bench(reading_list.get_recommendations, 15)
+
+
+# Statistics
+def test_get_stats(bench):
+    bench(service.Stats.get, 10, 30)
+
+
+# Exports
+def test_export_books(bench):
+    bench(lambda: sum(len(batch) for batch in service.Export.books()))
+
+
+def test_get_page(bench, dataset):
+    bench(
+        lambda: sum(
+            len(batch)
+            for batch, _ in service.ReadingList.get_page(dataset.user_id, n=50)
+        )
+    )
+
+
+def test_export_reads(bench, dataset):
+    bench(lambda: sum(len(batch) for batch in service.Export.reads(dataset.user_id)))
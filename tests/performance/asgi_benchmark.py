@@ -0,0 +1,211 @@
+"""
+Measures the throughput of the application in process, without a server.
+
+Each scenario sends requests to backend.app through an ASGI transport from
+concurrent asyncio clients, and reports the requests per second and the
+latency percentiles of its route. The database is generated with
+backend.datagen when it does not exist yet.
+
+    poetry run python tests/performance/asgi_benchmark.py --db bench.sqlite3 \\
+        --requests 2000 --concurrency 16 --profile profiles/
+
+With --profile, each scenario is run a second time under cProfile, with the
+sync routes called on the event loop thread so that the profile includes
+them (cProfile only sees the thread it was enabled in). Open the .prof
+files with `python -m pstats` or snakeviz.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import logging
+import os
+import random
+import sqlite3
+from pathlib import Path
+from time import perf_counter
+from unittest.mock import patch
+
+import httpx
+
+PAGE_SIZE = 15
+SEARCH_TERMS = ("Garden", "River", "Silent", "Kyoto", "The Last", "Storm")
+
+# Request of each scenario: (method, path, params, json)
+SCENARIOS = {
+    "books": lambda rng, data: (
+        "GET",
+        "/api/books",
+        {"start": rng.randrange(data["books"]), "n": PAGE_SIZE},
+        None,
+    ),
+    "search": lambda rng, data: (
+        "GET",
+        "/api/search",
+        {"q": rng.choice(SEARCH_TERMS)},
+        None,
+    ),
+    "genres": lambda rng, data: ("GET", "/api/genre", None, None),
+    "books_by_genre": lambda rng, data: (
+        "GET",
+        "/api/books/genre",
+        {"genre": rng.choice(data["genres"])},
+        None,
+    ),
+    "reading_list": lambda rng, data: ("GET", "/api/reads", None, None),
+    "recommend": lambda rng, data: ("GET", "/api/recommend", {"n": 5}, None),
+    "change_status": lambda rng, data: (
+        "PUT",
+        "/api/reads",
+        None,
+        {
+            "book_id": data["book_id"],
+            "status": rng.choice(("not_started", "started", "complete")),
+        },
+    ),
+}
+
+
+def load_dataset(path, books, users):
+    """
+    Generates the database if needed and returns the values the scenarios
+    query it with, for the user with the longest reading list.
+    """
+    from backend import datagen
+
+    conn = sqlite3.connect(path)
+    if not conn.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'users'"
+    ).fetchone():
+        datagen.generate(conn, books, users)
+    user_id, book_id = conn.execute(
+        """
+        SELECT user, MIN(book) FROM reading_list
+        GROUP BY user ORDER BY COUNT(*) DESC LIMIT 1
+        """
+    ).fetchone()
+    data = {
+        "books": conn.execute("SELECT COUNT(*) FROM books").fetchone()[0],
+        "genres": [row[0] for row in conn.execute("SELECT DISTINCT genre FROM books")],
+        "user_id": user_id,
+        "book_id": book_id,
+    }
+    conn.close()
+    return data
+
+
+async def _noop_threadpool(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def inline_sync_routes():
+    """
+    Runs the sync routes and dependencies on the event loop thread.
+    """
+    with patch("fastapi.routing.run_in_threadpool", _noop_threadpool), patch(
+        "fastapi.dependencies.utils.run_in_threadpool", _noop_threadpool
+    ):
+        yield
+
+
+async def run_scenario(client, build, data, requests, concurrency, seed):
+    """
+    Sends `requests` requests from `concurrency` clients.
+    Returns the latencies (s), the number of errors and the wall time (s).
+    """
+    rng = random.Random(seed)  # nosec B311
+    remaining = iter(range(requests))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, path, params, body = build(rng, data)
+            start = perf_counter()
+            response = await client.request(method, path, params=params, json=body)
+            latencies.append(perf_counter() - start)
+            errors += response.status_code >= 400
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, perf_counter() - start
+
+
+async def run(app, token, data, args):
+    from backend.slowlog import percentile
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {token}"}
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    print(
+        f"{'scenario':16} {'requests':>8} {'errors':>6} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers
+    ) as client:
+        for name in names:
+            build = SCENARIOS[name]
+            await run_scenario(client, build, data, args.warmup, args.concurrency, 0)
+            latencies, errors, wall = await run_scenario(
+                client, build, data, args.requests, args.concurrency, args.seed
+            )
+            ms = [latency * 1000 for latency in latencies]
+            print(
+                f"{name:16} {len(ms):8} {errors:6} {len(ms) / wall:9.1f} "
+                f"{percentile(ms, 0.5):8.2f} {percentile(ms, 0.95):8.2f} "
+                f"{percentile(ms, 0.99):8.2f} {max(ms):8.2f}",
+                flush=True,
+            )
+
+            if args.profile:
+                profiler = cProfile.Profile()
+                with inline_sync_routes():
+                    profiler.enable()
+                    await run_scenario(
+                        client, build, data, args.requests, args.concurrency, args.seed
+                    )
+                    profiler.disable()
+                profiler.dump_stats(Path(args.profile) / f"{name}.prof")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="bench.sqlite3", help="SQLite database")
+    parser.add_argument("--books", type=int, default=10_000, help="If generated")
+    parser.add_argument("--users", type=int, default=1_000, help="If generated")
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--scenarios", help=f"Comma separated subset of {', '.join(SCENARIOS)}"
+    )
+    parser.add_argument("--profile", help="Directory to write the cProfile stats to")
+    parser.add_argument(
+        "--logs", action="store_true", help="Keep the per query INFO logs"
+    )
+    args = parser.parse_args()
+
+    # The application reads its settings when it is imported
+    os.environ["SQLITE_DB"] = args.db
+    os.environ.setdefault("JWT_SECRET", "benchmark")
+    os.environ.setdefault("JWT_ALGORITHM", "HS256")
+    os.environ.setdefault("SLOW_QUERY_LOG", "")
+    data = load_dataset(args.db, args.books, args.users)
+    from backend import security
+    from backend.app import app
+
+    if not args.logs:
+        logging.disable(logging.INFO)
+    if args.profile:
+        Path(args.profile).mkdir(parents=True, exist_ok=True)
+    token = security.create_jwt_token({"user_id": data["user_id"]})
+    asyncio.run(run(app, token, data, args))
+
+
+if __name__ == "__main__":
+    main()
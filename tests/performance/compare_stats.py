@@ -0,0 +1,82 @@
+"""
+Compares the stats CSV of two locust runs (written with --csv=<prefix>).
+
+Prints the change of the request rate and of the p50/p95/p99 latency of each
+endpoint, and exits with 1 if a p95 or p99 got slower than the threshold.
+
+    poetry run python tests/performance/compare_stats.py \\
+        baseline_stats.csv current_stats.csv --threshold 20
+"""
+
+import argparse
+import csv
+import sys
+
+COLUMNS = ("50%", "95%", "99%")
+GATED = ("95%", "99%")
+
+
+def read_stats(path):
+    """
+    Returns the rows of a locust stats CSV by "<method> <name>".
+    """
+    with open(path, newline="") as file:
+        return {
+            f"{row['Type']} {row['Name']}".strip(): row for row in csv.DictReader(file)
+        }
+
+
+def change(before, after):
+    before, after = float(before or 0), float(after or 0)
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns the report lines and the regressions above the threshold (%).
+    """
+    lines = [f"{'endpoint':48} {'req/s':>8} " + " ".join(f"{c:>8}" for c in COLUMNS)]
+    regressions = []
+    for name, row in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            lines.append(f"{name:48} (new)")
+            continue
+        changes = {
+            column: change(previous[column], row[column])
+            for column in ("Requests/s",) + COLUMNS
+        }
+        lines.append(
+            f"{name:48} " + " ".join(f"{value:+7.1f}%" for value in changes.values())
+        )
+        regressions.extend(
+            f"{name} {column} {previous[column]}ms -> {row[column]}ms"
+            for column in GATED
+            if changes[column] > threshold
+        )
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline", help="stats CSV of the previous run")
+    parser.add_argument("current", help="stats CSV of the new run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="Slowdown (%%) of a p95 or p99 that fails the comparison",
+    )
+    args = parser.parse_args()
+
+    lines, regressions = compare(
+        read_stats(args.baseline), read_stats(args.current), args.threshold
+    )
+    print("\n".join(lines))
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
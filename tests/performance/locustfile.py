@@ -1,119 +1,208 @@
-import random
+"""
+Multi-user workload of the library API.
 
-import requests
-from locust import HttpUser, between, events, task
+Every simulated user logs in with its own account from a pool generated by
+backend.datagen (user1, user2, ...) and runs a weighted mix of tasks that
+follows the production traffic. The run starts with a cold phase, where the
+catalog is browsed uniformly without conditional requests, and continues
+with a warm phase focused on the popular pages, revalidated with ETags.
 
+At the end of the run, the p95 and p99 of each endpoint are checked against
+the SLOs below and the exit code is set to 1 if one of them is exceeded.
+"""
+
+import itertools
+import logging
+import random
+import time
 
-class WikiFetUser(HttpUser):
+from locust import HttpUser, between, events, task
+from locust.exception import StopUser
+
+from backend.datagen import ADJECTIVES, DEFAULT_PASSWORD, GENRES, NOUNS, PLACES
+
+# Latency objectives (ms) of each endpoint, checked on both phases
+SLOS = {
+    "GET /api/books": {"p95": 100, "p99": 250},
+    "GET /api/search": {"p95": 250, "p99": 500},
+    "GET /api/genre": {"p95": 50, "p99": 100},
+    "GET /api/books/genre": {"p95": 250, "p99": 500},
+    "GET /api/reads": {"p95": 150, "p99": 300},
+    "POST /api/reads": {"p95": 200, "p99": 400},
+    "PUT /api/reads": {"p95": 200, "p99": 400},
+    "DELETE /api/reads": {"p95": 200, "p99": 400},
+    "GET /api/recommend": {"p95": 250, "p99": 500},
+    # bcrypt dominates the login time
+    "POST /api/login": {"p95": 1000, "p99": 2000},
+}
+# Share of failed requests above which the run fails
+MAX_FAILURE_RATIO = 0.01
+PAGE_SIZE = 15
+# Pages and genres requested during the warm phase
+HOT_PAGES = 10
+HOT_GENRES = list(GENRES)[:5]
+
+_user_ids = itertools.count(1)
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    parser.add_argument(
+        "--user-pool",
+        type=int,
+        default=1000,
+        help="Number of generated accounts (user1 to userN) to log in with",
+    )
+    parser.add_argument(
+        "--user-password", default=DEFAULT_PASSWORD, help="Password of the accounts"
+    )
+    parser.add_argument(
+        "--catalog-size", type=int, default=10_000, help="Number of books"
+    )
+    parser.add_argument(
+        "--cold-seconds",
+        type=float,
+        default=60,
+        help="Duration of the cold phase, at the start of the run",
+    )
+
+
+@events.test_start.add_listener
+def start_phases(environment, **kwargs):
+    environment.cold_until = time.monotonic() + environment.parsed_options.cold_seconds
+
+
+@events.quitting.add_listener
+def check_slos(environment, **kwargs):
+    """
+    Fails the run if an endpoint exceeds its SLO or too many requests failed.
+    """
+    stats = environment.stats
+    violations = []
+    for entry in stats.entries.values():
+        slo = SLOS.get(f"{entry.method} {entry.name.split(' [')[0]}")
+        if slo is None or not entry.num_requests:
+            continue
+        for name, fraction in (("p95", 0.95), ("p99", 0.99)):
+            value = entry.get_response_time_percentile(fraction)
+            if value > slo[name]:
+                violations.append(f"{entry.name} {name} {value}ms > {slo[name]}ms")
+    if stats.total.fail_ratio > MAX_FAILURE_RATIO:
+        violations.append(f"failure ratio {stats.total.fail_ratio:.2%}")
+
+    for violation in violations:
+        logging.error(f"SLO violated: {violation}")
+    if violations:
+        environment.process_exit_code = 1
+
+
+class LibraryUser(HttpUser):
     wait_time = between(1, 5)
-    host = "http://127.0.0.1:8000/"
-    book_n = list(range(1, 30))
-    genres = [
-        "Fantasy",
-        "Drama",
-        "Historical Fiction",
-        "Science Fiction",
-        "Adventure",
-        "Mystery",
-    ]
-    book_names = [
-        "1984",
-        "A Game of Thrones",
-        "A Tale of Two Cities",
-        "Beloved",
-        "Dune",
-    ]
-    reading_status = ["completed", "started", "not_started"]
-
-    token = ""
-
-    @events.init.add_listener
-    def register(self):
-        with self.client.post(
-            "api/register",
-            json={
-                "username": "newuser",
-                "password": "newpass",
-                "confirm_password": "newpass",
-            },
-            catch_response=True,
-        ) as response:
-            if response.status_code == 200:
-                response.success()
-            else:
-                response.failure("login failed")
+    host = "http://127.0.0.1:8000"
 
     def on_start(self):
-        self.login()
-
-    def login(self):
-        with requests.post(
-            f"{self.host}api/login", json={"username": "newuser", "password": "newpass"}
-        ) as response:
-            if response.status_code == 200:
-                result = response.json()
-                self.token = result["token"]
-
-    @task(2)
-    def test_get_books(self):
-        self.client.get("api/books", json={"books": f"{self.random_book_n()}"})
-
-    @task
-    def test_search_books(self):
-        self.client.get("api/search", params={"q": f"{self.random_book()}"})
-
-    @task
-    def test_get_genres(self):
-        self.client.get("api/genre")
-
-    @task
-    def test_get_books_by_genre(self):
-        self.client.get("api/books/genre", params={"genre": f"{self.random_genre()}"})
-
-    @task
-    def test_get_reading_list(self):
-        headers = {"Authorization": f"Bearer {self.token}"}
-        self.client.get("api/reads", headers=headers)
-
-    @task
-    def test_add_to_reading_list(self):
-        headers = {"Authorization": f"Bearer {self.token}"}
-        self.client.post(
-            "api/reads", params={"book_id": f"{self.random_book_n()}"}, headers=headers
+        options = self.environment.parsed_options
+        self.catalog_size = options.catalog_size
+        self.username = f"user{(next(_user_ids) - 1) % options.user_pool + 1}"
+        self.etags = {}
+        self.reads = {}
+        response = self.client.post(
+            "/api/login",
+            json={"username": self.username, "password": options.user_password},
+        )
+        if not response.ok:
+            logging.error(f"Could not log in as {self.username}: {response.text}")
+            raise StopUser()
+        self.client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+        self.load_reading_list()
+
+    @property
+    def phase(self):
+        cold = time.monotonic() < getattr(self.environment, "cold_until", 0)
+        return "cold" if cold else "warm"
+
+    def get(self, path, params=None):
+        """
+        GET request named by path and phase. In the warm phase, the
+        responses are revalidated with the ETag of the previous response.
+        """
+        phase = self.phase
+        headers = {}
+        key = (path, tuple(sorted((params or {}).items())))
+        if phase == "warm" and key in self.etags:
+            headers["If-None-Match"] = self.etags[key]
+        response = self.client.get(
+            path, params=params, headers=headers, name=f"{path} [{phase}]"
+        )
+        if "ETag" in response.headers:
+            self.etags[key] = response.headers["ETag"]
+        return response
+
+    def load_reading_list(self):
+        response = self.get("/api/reads")
+        if response.ok:
+            self.reads = {read["id"]: read["status"] for read in response.json()}
+
+    @task(30)
+    def browse_books(self):
+        if self.phase == "cold":
+            start = random.randrange(self.catalog_size)
+        else:
+            start = random.randrange(HOT_PAGES) * PAGE_SIZE
+        self.get("/api/books", {"start": start, "n": PAGE_SIZE})
+
+    @task(15)
+    def search_books(self):
+        words = random.choice((ADJECTIVES, NOUNS, PLACES))
+        self.get("/api/search", {"q": random.choice(words)})
+
+    @task(5)
+    def get_genres(self):
+        self.get("/api/genre")
+
+    @task(10)
+    def browse_genre(self):
+        genres = list(GENRES) if self.phase == "cold" else HOT_GENRES
+        self.get("/api/books/genre", {"genre": random.choice(genres)})
+
+    @task(15)
+    def get_reading_list(self):
+        self.load_reading_list()
+
+    @task(8)
+    def get_recommendations(self):
+        self.get("/api/recommend", {"n": 5})
+
+    @task(6)
+    def add_to_reading_list(self):
+        book_id = random.randint(1, self.catalog_size)
+        if book_id in self.reads:
+            return
+        response = self.client.post(
+            "/api/reads", params={"book_id": book_id}, name="/api/reads"
         )
+        if response.ok:
+            self.reads[book_id] = "not_started"
 
-    @task
+    @task(8)
     def change_reading_status(self):
-        headers = {"Authorization": f"Bearer {self.token}"}
-        self.client.put(
-            "api/reads",
-            json={
-                "book_id": f"{self.random_book_n()}",
-                "status": f"{self.random_reading_status()}",
-            },
-            headers=headers,
+        if not self.reads:
+            return self.add_to_reading_list()
+        book_id = random.choice(list(self.reads))
+        status = "started" if self.reads[book_id] == "not_started" else "complete"
+        response = self.client.put(
+            "/api/reads", json={"book_id": book_id, "status": status}
         )
+        if response.ok:
+            self.reads[book_id] = status
 
-    @task
+    @task(3)
     def remove_from_reading_list(self):
-        headers = {"Authorization": f"Bearer {self.token}"}
-        self.client.delete(
-            "api/reads", params={"book_id": f"{self.random_book_n()}"}, headers=headers
+        if not self.reads:
+            return
+        book_id = random.choice(list(self.reads))
+        response = self.client.delete(
+            "/api/reads", params={"book_id": book_id}, name="/api/reads"
         )
-
-    @task
-    def get_recommendations(self):
-        headers = {"Authorization": f"Bearer {self.token}"}
-        self.client.get("api/recommend", params={"n": 5}, headers=headers)
-
-    def random_book(self):
-        return random.choice(self.book_names)
-
-    def random_book_n(self):
-        return random.choice(self.book_n)
-
-    def random_genre(self):
-        return random.choice(self.genres)
-
-    def random_reading_status(self):
-        return random.choice(self.reading_status)
+        if response.ok:
+            del self.reads[book_id]
@@ -0,0 +1,87 @@
+"""
+Measures the per-item cost of turning database rows into a JSON response.
+
+Compares the default FastAPI path (validated models, response model
+validation, json.dumps) with the fast path used by the list endpoints
+(one TypeAdapter pass + orjson).
+
+    poetry run python tests/performance/serialization_benchmark.py --items 10000
+"""
+
+import argparse
+import json
+import timeit
+
+from pydantic import TypeAdapter
+
+from backend import models
+from backend.responses import FastJSONResponse
+
+ROW_UPDATED_AT = "2024-04-27 15:32:30"
+
+
+def make_rows(n):
+    return [
+        (i, f"Book {i}", f"Author {i % 500}", f"Genre {i % 20}", i % 97, "started")
+        for i in range(n)
+    ]
+
+
+def default_path(rows, adapter):
+    books = [
+        models.MyRead(
+            id=row[0],
+            title=row[1],
+            author=row[2],
+            genre=row[3],
+            reads=row[4],
+            status=row[5],
+            updated_at=ROW_UPDATED_AT,
+        )
+        for row in rows
+    ]
+    # FastAPI dumps the returned models, validates them against the response
+    # model and serializes the result before handing it to json.dumps
+    content = adapter.validate_python([book.model_dump() for book in books])
+    return json.dumps(adapter.dump_python(content, mode="json")).encode("utf-8")
+
+
+def fast_path(rows, adapter):
+    books = adapter.validate_python(
+        [
+            {
+                "id": row[0],
+                "title": row[1],
+                "author": row[2],
+                "genre": row[3],
+                "reads": row[4],
+                "status": row[5],
+                "updated_at": ROW_UPDATED_AT,
+            }
+            for row in rows
+        ]
+    )
+    return FastJSONResponse(books).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+    adapter = TypeAdapter(list[models.MyRead])
+    assert json.loads(default_path(rows, adapter)) == json.loads(
+        fast_path(rows, adapter)
+    ), "Both paths must render the same JSON"
+
+    for name, func in (("default", default_path), ("fast", fast_path)):
+        best = min(
+            timeit.repeat(lambda: func(rows, adapter), number=1, repeat=args.repeat)
+        )
+        print(f"{name:>8}: {best * 1e6 / args.items:8.2f} us/item ({args.items} items)")
+
+
+if __name__ == "__main__":
+    main()
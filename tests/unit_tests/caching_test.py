@@ -0,0 +1,137 @@
+import unittest
+from datetime import datetime
+
+from fastapi import Request
+
+import backend.caching as caching
+from backend.const import CATALOG_CACHE_CONTROL
+
+
+def make_request(path="/api/books", query="", headers=None):
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": [
+                (name.lower().encode(), value.encode())
+                for name, value in (headers or {}).items()
+            ],
+        }
+    )
+
+
+class TestCatalogETag(unittest.TestCase):
+    def test_etag_is_strong_and_quoted(self):
+        etag = caching.catalog_etag("epoch-1", make_request())
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+
+    def test_etag_ignores_query_parameter_order(self):
+        first = caching.catalog_etag("epoch-1", make_request(query="start=0&n=15"))
+        second = caching.catalog_etag("epoch-1", make_request(query="n=15&start=0"))
+        self.assertEqual(first, second)
+
+    def test_etag_changes_with_version_path_and_query(self):
+        etag = caching.catalog_etag("epoch-1", make_request(query="n=15"))
+        self.assertNotEqual(
+            etag, caching.catalog_etag("epoch-2", make_request(query="n=15"))
+        )
+        self.assertNotEqual(
+            etag, caching.catalog_etag("epoch-1", make_request(query="n=16"))
+        )
+        self.assertNotEqual(
+            etag,
+            caching.catalog_etag("epoch-1", make_request("/api/genre", "n=15")),
+        )
+
+
+class TestIsFresh(unittest.TestCase):
+    def test_no_header(self):
+        self.assertFalse(caching.is_fresh(make_request(), '"abc"'))
+
+    def test_matching_tag(self):
+        request = make_request(headers={"If-None-Match": '"old", "abc"'})
+        self.assertTrue(caching.is_fresh(request, '"abc"'))
+
+    def test_weak_tag_matches(self):
+        request = make_request(headers={"If-None-Match": 'W/"abc"'})
+        self.assertTrue(caching.is_fresh(request, '"abc"'))
+
+    def test_wildcard(self):
+        request = make_request(headers={"If-None-Match": "*"})
+        self.assertTrue(caching.is_fresh(request, '"abc"'))
+
+    def test_stale_tag(self):
+        request = make_request(headers={"If-None-Match": '"old"'})
+        self.assertFalse(caching.is_fresh(request, '"abc"'))
+
+
+class TestNotModified(unittest.TestCase):
+    def test_not_modified(self):
+        response = caching.not_modified('"abc"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.body, b"")
+        self.assertEqual(response.headers["etag"], '"abc"')
+        self.assertEqual(response.headers["cache-control"], CATALOG_CACHE_CONTROL)
+
+
+def make_entry(book_id, status="not_started"):
+    return (book_id, status, datetime(2024, 1, 1))
+
+
+class TestReadingListCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = caching.ReadingListCache(max_books=4)
+
+    def load(self, user_id, entries):
+        self.cache.put(user_id, entries, self.cache.begin_load(user_id))
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get(1))
+        self.load(1, [make_entry(10)])
+        self.assertEqual(self.cache.get(1), [make_entry(10)])
+
+    def test_update_in_place(self):
+        self.load(1, [make_entry(10), make_entry(30)])
+        self.cache.update(1, 20, make_entry(20)[1:])
+        self.cache.update(1, 10, None)
+        self.cache.update(1, 30, make_entry(30, "complete")[1:])
+        self.assertEqual(
+            self.cache.get(1), [make_entry(20), make_entry(30, "complete")]
+        )
+        self.assertEqual(self.cache.size, 2)
+
+    def test_update_of_uncached_user(self):
+        self.cache.update(1, 10, make_entry(10)[1:])
+        self.assertIsNone(self.cache.get(1))
+
+    def test_write_during_load(self):
+        token = self.cache.begin_load(1)
+        self.cache.update(1, 10, make_entry(10)[1:])
+        self.cache.put(1, [], token)
+        self.assertIsNone(self.cache.get(1))
+
+    def test_invalidate(self):
+        self.load(1, [make_entry(10)])
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_lru_eviction(self):
+        self.load(1, [make_entry(10), make_entry(11)])
+        self.load(2, [make_entry(20)])
+        self.cache.get(1)
+        self.load(3, [make_entry(30), make_entry(31)])
+        self.assertIsNone(self.cache.get(2))
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertEqual(self.cache.size, 4)
+
+    def test_list_larger_than_the_cache(self):
+        self.load(1, [make_entry(book_id) for book_id in range(5)])
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
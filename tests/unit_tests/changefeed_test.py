@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import unittest
+
+import backend.changefeed as changefeed
+import backend.metrics as metrics
+
+
+class TestEventBus(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.bus = changefeed.EventBus(queue_size=3)
+
+    async def test_publish_from_another_thread(self):
+        subscription = self.bus.subscribe(1)
+        other = self.bus.subscribe(2)
+        event = {"type": "added", "book_id": 10, "status": "started"}
+
+        thread = threading.Thread(target=self.bus.publish, args=(1, event))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(await asyncio.wait_for(subscription.queue.get(), 1), event)
+        self.assertTrue(other.queue.empty())
+
+    async def test_publish_without_subscribers(self):
+        self.bus.publish(1, {"type": "removed", "book_id": 10})
+        self.assertEqual(self.bus.subscriptions, {})
+
+    async def test_overflow(self):
+        subscription = self.bus.subscribe(1)
+        for book_id in range(5):
+            self.bus.publish(1, {"type": "removed", "book_id": book_id})
+        await asyncio.sleep(0)
+
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        self.assertEqual(
+            events, [changefeed.OVERFLOW, {"type": "removed", "book_id": 4}]
+        )
+
+    async def test_unsubscribe(self):
+        subscribers = metrics.SSE_SUBSCRIBERS.get()
+        subscription = self.bus.subscribe(1)
+        self.assertEqual(metrics.SSE_SUBSCRIBERS.get(), subscribers + 1)
+
+        self.bus.unsubscribe(subscription)
+        self.assertEqual(self.bus.subscriptions, {})
+        self.assertEqual(metrics.SSE_SUBSCRIBERS.get(), subscribers)
+
+
+class TestStream(unittest.IsolatedAsyncioTestCase):
+    async def test_stream(self):
+        bus = changefeed.EventBus(queue_size=3)
+        stream = changefeed.stream(bus, 1, heartbeat=0.01)
+
+        self.assertEqual(await anext(stream), changefeed.HEARTBEAT)
+        bus.publish(1, {"type": "removed", "book_id": 10})
+        self.assertEqual(
+            await anext(stream),
+            'event: removed\ndata: {"type": "removed", "book_id": 10}\n\n',
+        )
+
+        await stream.aclose()
+        self.assertEqual(bus.subscriptions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
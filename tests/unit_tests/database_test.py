@@ -1,7 +1,21 @@
+import random
+import sqlite3
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import backend.database as db
+import backend.metrics as metrics
+from backend import datagen
+
+
+class TestDatabaseConnection(unittest.TestCase):
+    @patch("sqlite3.connect")
+    def test_connect(self, mock_connect):
+        before = metrics.DB_CONNECTIONS.get()
+        conn = db.connect("test.sqlite3", check_same_thread=False)
+        self.assertEqual(conn, mock_connect.return_value)
+        mock_connect.assert_called_once_with("test.sqlite3", check_same_thread=False)
+        self.assertEqual(metrics.DB_CONNECTIONS.get(), before + 1)
 
 
 class TestDatabaseBookFunctions(unittest.TestCase):
@@ -18,20 +32,38 @@ class TestDatabaseBookFunctions(unittest.TestCase):
         self.cursor.fetchone.return_value = (1, "Sample Book", "Author A", "Genre A")
 
     def test_create_book(self):
-        db.create_book("Test Book", "Test Author", "Test Genre", self.conn)
+        book_id = db.create_book("Test Book", "Test Author", "Test Genre", self.conn)
+        self.conn.execute.assert_any_call(
+            """
+        INSERT INTO authors (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+            ("Test Author",),
+        )
+        self.conn.execute.assert_any_call(
+            """
+        INSERT INTO genres (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+    """,
+            ("Test Genre",),
+        )
         self.conn.execute.assert_called_with(
             """
         INSERT INTO books (title, author, genre)
-        VALUES (?, ?, ?)\n    """,
+        SELECT ?, authors.id, genres.id FROM authors, genres
+        WHERE authors.name = ? AND genres.name = ?
+        RETURNING id
+    """,
             ("Test Book", "Test Author", "Test Genre"),
         )
         self.conn.commit.assert_called_once()
+        self.assertEqual(book_id, 1)
 
     def test_get_books(self):
-        books = db.get_books(0, 2, self.conn)
+        books = db.get_books(0, 2, None, None, None, self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT * FROM books LIMIT ? OFFSET ?
+        SELECT id, title, author, genre, reads FROM catalog
+        WHERE TRUE
+        ORDER BY id LIMIT ? OFFSET ?
     """,
             (2, 0),
         )
@@ -48,7 +80,7 @@ class TestDatabaseBookFunctions(unittest.TestCase):
         genres = db.get_genres(self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT DISTINCT genre FROM books
+        SELECT name FROM genres WHERE books > 0 ORDER BY name
     """
         )
         self.assertEqual(genres, ["Fiction", "Non-Fiction"])
@@ -58,30 +90,162 @@ class TestDatabaseBookFunctions(unittest.TestCase):
         book = db.get_book(book_id, self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT * FROM books WHERE id = ?
+        SELECT * FROM catalog WHERE id = ?
     """,
             (book_id,),
         )
         self.assertEqual(book, (1, "Sample Book", "Author A", "Genre A"))
 
+    def test_get_book_not_found(self):
+        self.cursor.fetchone.return_value = None
+        self.assertIsNone(db.get_book(1, self.conn))
+
+    def test_get_existing_book_ids(self):
+        self.cursor.fetchall.return_value = [(1,), (2,)]
+        book_ids = db.get_existing_book_ids([1, 2, 3], self.conn)
+        self.conn.execute.assert_called_with(
+            """
+        SELECT id FROM books WHERE id IN (SELECT value FROM json_each(?))
+    """,
+            ("[1, 2, 3]",),
+        )
+        self.assertEqual(book_ids, {1, 2})
+
+    def test_get_books_by_ids(self):
+        self.cursor.fetchall.return_value = [(2, "Book", "Author", "Genre", 3)]
+        books = db.get_books_by_ids([2, 5], self.conn)
+        self.conn.execute.assert_called_with(
+            """
+        SELECT id, title, author, genre, reads FROM catalog
+        WHERE id IN (SELECT value FROM json_each(?))
+    """,
+            ("[2, 5]",),
+        )
+        self.assertEqual(books, [(2, "Book", "Author", "Genre", 3)])
+
     def test_get_book_count(self):
         self.cursor.fetchone.return_value = (5,)
         count = db.get_book_count(self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT COUNT(*) FROM books
+        SELECT COALESCE(SUM(books), 0) FROM genres
     """
         )
         self.assertEqual(count, 5)
 
+    def test_create_indexes(self):
+        db.create_indexes(self.conn)
+        statements = [call.args[0] for call in self.conn.execute.call_args_list]
+        self.assertEqual(len(statements), 13)
+        self.assertTrue(all("INDEX IF NOT EXISTS" in s for s in statements))
+        self.assertIn("CREATE UNIQUE INDEX", statements[0])
+        self.assertIn("ON reading_list (user, book)", statements[0])
+
+    def test_migrate(self):
+        self.cursor.fetchone.return_value = (0,)
+        db.migrate(self.conn)
+        statements = [call.args[0] for call in self.conn.execute.call_args_list]
+        self.assertEqual(statements[:2], ["PRAGMA user_version", "BEGIN"])
+        self.assertEqual(statements[-1], f"PRAGMA user_version = {len(db.MIGRATIONS)}")
+        self.assertEqual(self.conn.commit.call_count, len(db.MIGRATIONS))
+
+    def test_migrate_up_to_date(self):
+        self.cursor.fetchone.return_value = (len(db.MIGRATIONS),)
+        db.migrate(self.conn)
+        self.conn.execute.assert_called_once_with("PRAGMA user_version")
+        self.conn.commit.assert_not_called()
+
+    def test_migrations_of_an_old_database(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute(
+            "CREATE TABLE books (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "title TEXT, author TEXT, genre TEXT, created_at TIMESTAMP, "
+            "updated_at TIMESTAMP)"
+        )
+        conn.execute(
+            "CREATE TABLE reading_list (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "book INTEGER, user INTEGER, reading_status TEXT, "
+            "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+            "updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.execute(
+            "CREATE TABLE reading_list_tombstones (id INTEGER PRIMARY KEY "
+            "AUTOINCREMENT, book INTEGER, user INTEGER, deleted_at TIMESTAMP)"
+        )
+        conn.execute("INSERT INTO books (title, author, genre) VALUES ('T', 'A', 'G')")
+        conn.execute(
+            "INSERT INTO reading_list_tombstones (book, user) VALUES (1, 1), (1, 3)"
+        )
+        conn.executemany(
+            "INSERT INTO reading_list (book, user, reading_status) VALUES (1, ?, ?)",
+            [(1, "not_started"), (1, "complete"), (2, "complete")],
+        )
+        conn.commit()
+
+        db.create_tables(conn)
+        self.assertEqual(
+            conn.execute("PRAGMA user_version").fetchone()[0], len(db.MIGRATIONS)
+        )
+        # Duplicates removed, keeping the latest
+        self.assertEqual(
+            conn.execute("SELECT user, reading_status FROM reading_list").fetchall(),
+            [(1, "complete"), (2, "complete")],
+        )
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute(
+                "INSERT INTO reading_list (book, user, reading_status) "
+                "VALUES (1, 1, 'started')"
+            )
+        # Tombstones of books still in the list dropped
+        self.assertEqual(
+            conn.execute("SELECT book, user FROM reading_list_tombstones").fetchall(),
+            [(1, 3)],
+        )
+        # Read counts backfilled, then kept up to date
+        self.assertEqual(db.get_book_read_count(1, conn), 2)
+        db.update_reading_status(1, 1, "started", conn)
+        db.remove_from_reading_list(2, 1, conn)
+        db.create_reading_list(3, 1, "complete", conn)
+        self.assertEqual(db.get_book_read_count(1, conn), 1)
+        # Authors and genres interned, with their book counts
+        self.assertEqual(db.get_book(1, conn)[:5], (1, "T", "A", "G", 1))
+        self.assertEqual(conn.execute("SELECT * FROM genres").fetchall(), [(1, "G", 1)])
+        self.assertEqual(db.get_genres(conn), ["G"])
+        version = db.get_catalog_version(conn)
+        db.update_book(1, "T", "B", "H", conn)
+        self.assertNotEqual(db.get_catalog_version(conn), version)
+        self.assertEqual(
+            conn.execute("SELECT name, books FROM authors").fetchall(),
+            [("A", 0), ("B", 1)],
+        )
+        self.assertEqual(db.get_genres(conn), ["H"])
+        db.create_book("U", "B", "G", conn)
+        self.assertEqual(db.get_genres(conn), ["G", "H"])
+        self.assertEqual(db.get_book_count(conn), 2)
+        # Statistics backfilled, then kept up to date
+        self.assertEqual(db.get_status_totals(conn), (0, 1, 1))
+        self.assertEqual(db.get_genre_stats(conn), [("G", 0, 0, 0), ("H", 0, 1, 1)])
+        conn.close()
+
+    def test_get_catalog_version(self):
+        self.cursor.fetchone.return_value = ("0a1b2c3d4e5f6789-12",)
+        version = db.get_catalog_version(self.conn)
+        self.conn.execute.assert_called_with(
+            """
+        SELECT epoch || '-' || version FROM catalog_version WHERE id = 1
+    """
+        )
+        self.assertEqual(version, "0a1b2c3d4e5f6789-12")
+
     def test_search_book_by_title(self):
         search_title = "Sample"
-        searched_books = db.search_book_by_title(search_title, self.conn)
+        searched_books = db.search_book_by_title(search_title, 20, 10, self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT * FROM books WHERE title LIKE ?
+        SELECT * FROM catalog WHERE title LIKE ?
+        ORDER BY id LIMIT ? OFFSET ?
     """,
-            ("%Sample%",),
+            ("%Sample%", 10, 20),
         )
         self.assertEqual(
             searched_books,
@@ -91,42 +255,73 @@ class TestDatabaseBookFunctions(unittest.TestCase):
             ],
         )
 
-    def test_get_books_by_genre(self):
-        genre = "Fiction"
-        books_by_genre = db.get_books_by_genre(genre, self.conn)
+    def test_count_title_matches(self):
+        self.cursor.fetchone.return_value = (3,)
+        count = db.count_title_matches("Sample", 1000, self.conn)
+        self.assertEqual(count, 3)
+        self.assertEqual(self.conn.execute.call_args.args[1], (1000, "%Sample%"))
+
+    def test_get_books_filtered_and_sorted(self):
+        db.get_books(30, 15, "Fiction", "Author A", "popular", self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT * FROM books WHERE genre = ?
+        SELECT id, title, author, genre, reads FROM catalog
+        WHERE genre = ? AND author = ?
+        ORDER BY reads DESC, id DESC LIMIT ? OFFSET ?
     """,
-            (genre,),
+            ("Fiction", "Author A", 15, 30),
         )
+        with self.assertRaises(KeyError):
+            db.get_books(0, 15, None, None, "id; DROP TABLE books", self.conn)
+
+    def test_iter_books(self):
+        self.cursor.fetchmany.side_effect = [
+            [(1, "Sample Book", "Author A", "Genre A", 3)],
+            [(2, "Another Book", "Author B", "Genre B", 0)],
+            [],
+        ]
+        batches = list(db.iter_books(self.conn, batch_size=1))
         self.assertEqual(
-            books_by_genre,
+            batches,
             [
-                (1, "Sample Book", "Author A", "Genre A"),
-                (2, "Another Book", "Author B", "Genre B"),
+                [(1, "Sample Book", "Author A", "Genre A", 3)],
+                [(2, "Another Book", "Author B", "Genre B", 0)],
             ],
         )
+        self.cursor.fetchmany.assert_called_with(1)
+        self.conn.execute.assert_called_once()
 
     def test_update_book(self):
-        db.update_book(1, "Updated Book", "Updated Author", "Updated Genre", self.conn)
+        updated = db.update_book(
+            1, "Updated Book", "Updated Author", "Updated Genre", self.conn
+        )
         self.conn.execute.assert_called_with(
             """
         UPDATE books
-        SET title = ?, author = ?, genre = ?, updated_at = CURRENT_TIMESTAMP
+        SET title = ?,
+        author = (SELECT id FROM authors WHERE name = ?),
+        genre = (SELECT id FROM genres WHERE name = ?),
+        updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
+        RETURNING id
     """,
             ("Updated Book", "Updated Author", "Updated Genre", 1),
         )
         self.conn.commit.assert_called_once()
+        self.assertTrue(updated)
+
+    def test_update_book_not_found(self):
+        self.cursor.fetchall.return_value = []
+        self.assertFalse(db.update_book(9, "T", "A", "G", self.conn))
 
     def test_delete_book(self):
-        db.delete_book(1, self.conn)
+        deleted = db.delete_book(1, self.conn)
         calls = [
             (
                 (
                     """
         DELETE FROM books WHERE id = ?
+        RETURNING id
     """,
                     (1,),
                 ),
@@ -142,6 +337,87 @@ class TestDatabaseBookFunctions(unittest.TestCase):
         ]
         self.conn.execute.assert_has_calls(calls, any_order=True)
         self.conn.commit.assert_called_once()
+        self.assertTrue(deleted)
+
+
+class TestDatabaseStatsFunctions(unittest.TestCase):
+    def setUp(self):
+        self.conn = MagicMock()
+        self.cursor = MagicMock()
+        self.conn.execute.return_value = self.cursor
+
+    def test_get_status_totals(self):
+        self.cursor.fetchone.return_value = (3, 2, 5)
+        self.assertEqual(db.get_status_totals(self.conn), (3, 2, 5))
+        self.assertIn("FROM genre_stats", self.conn.execute.call_args.args[0])
+
+    def test_get_genre_stats(self):
+        self.cursor.fetchall.return_value = [("Fantasy", 3, 2, 5)]
+        self.assertEqual(db.get_genre_stats(self.conn), [("Fantasy", 3, 2, 5)])
+        self.assertIn("WHERE genres.books > 0", self.conn.execute.call_args.args[0])
+
+    def test_get_daily_completions(self):
+        self.cursor.fetchall.return_value = [("2024-04-27", 4)]
+        completions = db.get_daily_completions("2024-04-01", self.conn)
+        self.assertEqual(completions, [("2024-04-27", 4)])
+        self.assertEqual(self.conn.execute.call_args.args[1], ("2024-04-01",))
+
+    def test_get_trending_books(self):
+        self.cursor.fetchall.return_value = [(1, "Book", "Author", "Genre", 2, 7)]
+        books = db.get_trending_books(5, self.conn)
+        self.assertEqual(books, [(1, "Book", "Author", "Genre", 2, 7)])
+        self.assertEqual(self.conn.execute.call_args.args[1], (5,))
+        self.assertIn(
+            "ORDER BY s.started DESC, s.book DESC", self.conn.execute.call_args.args[0]
+        )
+
+    @patch("backend.datagen.Hasher.password_hash", return_value="hash")
+    def test_rollups_match_the_reading_lists(self, mock_hash):
+        conn = sqlite3.connect(":memory:")
+        datagen.generate(conn, 300, 20, reads_per_user=10)
+        rng = random.Random(7)
+        statuses = ["not_started", "started", "complete"]
+        for _ in range(300):
+            user_id, book_id = rng.randint(1, 20), rng.randint(1, 400)
+            db.create_reading_list(user_id, book_id, rng.choice(statuses), conn)
+            db.update_reading_status(user_id, book_id, rng.choice(statuses), conn)
+            if rng.random() < 0.2:
+                db.remove_from_reading_list(user_id, book_id, conn)
+            if rng.random() < 0.1:
+                db.update_book(book_id, "Title", "Author", rng.choice(["A", "B"]), conn)
+            if rng.random() < 0.05:
+                db.delete_book(book_id, conn)
+
+        counts = """
+            COUNT(r.id) FILTER (WHERE reading_status = 'not_started'),
+            COUNT(r.id) FILTER (WHERE reading_status = 'started'),
+            COUNT(r.id) FILTER (WHERE reading_status = 'complete')
+        """
+        self.assertEqual(
+            conn.execute("SELECT * FROM book_stats ORDER BY book").fetchall(),
+            conn.execute(
+                f"SELECT books.id, {counts} FROM books "
+                "LEFT JOIN reading_list r ON r.book = books.id "
+                "GROUP BY books.id ORDER BY books.id"
+            ).fetchall(),
+        )
+        self.assertEqual(
+            conn.execute("SELECT * FROM genre_stats ORDER BY genre").fetchall(),
+            conn.execute(
+                f"SELECT genres.id, {counts} FROM genres "
+                "LEFT JOIN books ON books.genre = genres.id "
+                "LEFT JOIN reading_list r ON r.book = books.id "
+                "GROUP BY genres.id ORDER BY genres.id"
+            ).fetchall(),
+        )
+        self.assertEqual(
+            db.get_daily_completions("2000-01-01", conn),
+            conn.execute(
+                "SELECT date(updated_at), COUNT(*) FROM reading_list "
+                "WHERE reading_status = 'complete' GROUP BY 1 ORDER BY 1"
+            ).fetchall(),
+        )
+        conn.close()
 
 
 class TestDatabaseUserFunctions(unittest.TestCase):
@@ -250,21 +526,28 @@ class TestDatabaseReadingListFunctions(unittest.TestCase):
         self.cursor.fetchone.return_value = (1, 1, 1, "not_started")
 
     def test_create_reading_list(self):
-        db.create_reading_list(1, 1, "not_started", self.conn)
+        self.cursor.fetchall.return_value = [("2024-04-27 15:32:30",)]
+        added_at = db.create_reading_list(1, 2, "not_started", self.conn)
         self.conn.execute.assert_called_with(
             """
         INSERT INTO reading_list (book, user, reading_status)
-        VALUES (?, ?, ?)
+        SELECT id, ?, ? FROM books WHERE id = ?
+        ON CONFLICT (user, book) DO NOTHING
+        RETURNING updated_at
     """,
-            (1, 1, "not_started"),
+            (1, "not_started", 2),
         )
         self.conn.commit.assert_called_once()
+        self.assertEqual(added_at, "2024-04-27 15:32:30")
+
+        self.cursor.fetchall.return_value = []
+        self.assertIsNone(db.create_reading_list(1, 2, "not_started", self.conn))
 
     def test_get_reading_lists(self):
         reading_lists = db.get_reading_lists(1, self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT * FROM reading_list WHERE user = ?
+        SELECT * FROM reading_list WHERE user = ? ORDER BY book
     """,
             (1,),
         )
@@ -272,6 +555,110 @@ class TestDatabaseReadingListFunctions(unittest.TestCase):
             reading_lists, [(1, 1, 1, "not_started"), (2, 1, 2, "in_progress")]
         )
 
+    def test_begin_write(self):
+        db.begin_write(self.conn)
+        self.conn.execute.assert_called_once_with("BEGIN IMMEDIATE")
+
+    def test_get_reading_list_statuses(self):
+        self.cursor.fetchall.return_value = [(1, "started"), (3, "complete")]
+        statuses = db.get_reading_list_statuses(1, [1, 2, 3], self.conn)
+        self.conn.execute.assert_called_with(
+            """
+        SELECT book, reading_status FROM reading_list
+        WHERE user = ? AND book IN (SELECT value FROM json_each(?))
+    """,
+            (1, "[1, 2, 3]"),
+        )
+        self.assertEqual(statuses, {1: "started", 3: "complete"})
+
+    def test_apply_reading_list_changes(self):
+        db.apply_reading_list_changes(
+            1, [(10, "started")], [("complete", 11)], [12], self.conn
+        )
+        params = [call.args[1] for call in self.conn.executemany.call_args_list]
+        self.assertEqual(
+            params, [[(10, 1, "started")], [("complete", 11, 1)], [(12, 1)]]
+        )
+        self.conn.commit.assert_called_once()
+
+    def test_get_reading_list_changes(self):
+        self.cursor.fetchall.return_value = [
+            (1, "Book", "Author", "Genre", 0, "started", "2024-04-27 15:32:30")
+        ]
+        changes = db.get_reading_list_changes(1, "2024-04-27 15:00:00", self.conn)
+        self.assertEqual(
+            self.conn.execute.call_args.args[1], (1, "2024-04-27 15:00:00")
+        )
+        self.assertIn("r.updated_at >= ?", self.conn.execute.call_args.args[0])
+        self.assertEqual(
+            changes,
+            [(1, "Book", "Author", "Genre", 0, "started", "2024-04-27 15:32:30")],
+        )
+
+    def test_get_tombstones(self):
+        self.cursor.fetchall.return_value = [(3,), (4,)]
+        removed = db.get_tombstones(1, "2024-04-27 15:00:00", self.conn)
+        self.conn.execute.assert_called_with(
+            """
+        SELECT DISTINCT book FROM reading_list_tombstones
+        WHERE user = ? AND deleted_at >= ?
+    """,
+            (1, "2024-04-27 15:00:00"),
+        )
+        self.assertEqual(removed, [3, 4])
+
+    def test_purge_tombstones(self):
+        self.cursor.rowcount = 5
+        purged = db.purge_tombstones("2024-04-27 15:00:00", self.conn)
+        self.conn.execute.assert_called_with(
+            """
+        DELETE FROM reading_list_tombstones WHERE deleted_at < ?
+    """,
+            ("2024-04-27 15:00:00",),
+        )
+        self.conn.commit.assert_called_once()
+        self.assertEqual(purged, 5)
+
+    def test_iter_reading_list(self):
+        self.cursor.fetchmany.side_effect = [
+            [(1, "Book", "Author", "Genre", 0, "started", "2024-04-27T15:32:30")],
+            [],
+        ]
+        batches = list(db.iter_reading_list(1, self.conn))
+        self.assertEqual(
+            batches,
+            [[(1, "Book", "Author", "Genre", 0, "started", "2024-04-27T15:32:30")]],
+        )
+        self.assertEqual(self.conn.execute.call_args.args[1], (1,))
+        self.cursor.fetchmany.assert_called_with(500)
+
+    def test_iter_reading_list_page(self):
+        self.cursor.fetchmany.side_effect = [
+            [(1, "Book", "Author", "Genre", 0, "started", "2024-04-27 15:32:30", 2)],
+            [],
+        ]
+        batches = list(
+            db.iter_reading_list_page(1, None, "recent", None, 10, self.conn)
+        )
+        self.assertEqual(
+            batches,
+            [[(1, "Book", "Author", "Genre", 0, "started", "2024-04-27 15:32:30", 2)]],
+        )
+        self.assertEqual(self.conn.execute.call_args.args[1], (1, 10))
+        self.assertIn(
+            "ORDER BY r.updated_at DESC, r.id DESC", self.conn.execute.call_args.args[0]
+        )
+
+    def test_iter_reading_list_page_filtered(self):
+        self.cursor.fetchmany.return_value = []
+        after = ("2024-04-27 15:32:30", 2)
+        list(db.iter_reading_list_page(1, "started", "oldest", after, 10, self.conn))
+        query, params = self.conn.execute.call_args.args
+        self.assertEqual(params, (1, "started", "2024-04-27 15:32:30", 2, 10))
+        self.assertIn("r.reading_status = ?", query)
+        self.assertIn("(r.updated_at, r.id) > (?, ?)", query)
+        self.assertIn("ORDER BY r.updated_at, r.id LIMIT ?", query)
+
     def test_get_completed_books(self):
         # Change the return value for this specific test
         self.cursor.fetchall.return_value = [
@@ -305,34 +692,44 @@ class TestDatabaseReadingListFunctions(unittest.TestCase):
         n = db.get_book_read_count(1, self.conn)
         self.conn.execute.assert_called_with(
             """
-        SELECT COUNT(*) FROM reading_list WHERE book = ?
-        AND reading_status = 'complete'
+        SELECT reads FROM books WHERE id = ?
     """,
             (1,),
         )
         assert n == 5
 
     def test_remove_from_reading_list(self):
-        db.remove_from_reading_list(1, 1, self.conn)
+        removed = db.remove_from_reading_list(1, 1, self.conn)
         self.conn.execute.assert_called_with(
             """
         DELETE FROM reading_list WHERE book = ? AND user = ?
+        RETURNING id
     """,
             (1, 1),
         )
         self.conn.commit.assert_called_once()
+        self.assertTrue(removed)
+
+        self.cursor.fetchall.return_value = []
+        self.assertFalse(db.remove_from_reading_list(1, 1, self.conn))
 
     def test_update_reading_status(self):
-        db.update_reading_status(1, 1, "completed", self.conn)
+        self.cursor.fetchall.return_value = [("2024-04-27 15:32:30",)]
+        updated_at = db.update_reading_status(1, 1, "complete", self.conn)
         self.conn.execute.assert_called_with(
             """
         UPDATE reading_list
         SET reading_status = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE book = ? AND user = ?
+        WHERE book = ? AND user = ? AND reading_status <> ?
+        RETURNING updated_at
     """,
-            ("completed", 1, 1),
+            ("complete", 1, 1, "complete"),
         )
         self.conn.commit.assert_called_once()
+        self.assertEqual(updated_at, "2024-04-27 15:32:30")
+
+        self.cursor.fetchall.return_value = []
+        self.assertIsNone(db.update_reading_status(1, 1, "complete", self.conn))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import logging
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+import backend.datagen as datagen
+
+
+@patch("backend.datagen.Hasher.password_hash", return_value="hash")
+class TestGenerate(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def generate(self, seed=42):
+        conn = sqlite3.connect(":memory:")
+        counts = datagen.generate(conn, 600, 30, reads_per_user=20, seed=seed)
+        return conn, counts
+
+    def test_counts(self, mock_hash):
+        conn, counts = self.generate()
+        seeded = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0] - 600
+        self.assertEqual(counts["books"], 600)
+        self.assertEqual(counts["users"], 30)
+        self.assertEqual(
+            conn.execute("SELECT COUNT(*) FROM reading_list").fetchone()[0],
+            counts["reading_list"],
+        )
+        self.assertGreater(counts["reading_list"], 0)
+        self.assertGreaterEqual(seeded, 0)
+        mock_hash.assert_called_once_with("password")
+
+    def test_users(self, mock_hash):
+        conn, _ = self.generate()
+        users = conn.execute("SELECT id, username, password_hash FROM users").fetchall()
+        self.assertEqual(users[0], (1, "user1", "hash"))
+        self.assertTrue(all(username == f"user{id}" for id, username, _ in users))
+
+    def test_deterministic(self, mock_hash):
+        query = "SELECT book, user, reading_status FROM reading_list ORDER BY id"
+        first, _ = self.generate()
+        second, _ = self.generate()
+        other, _ = self.generate(seed=7)
+        self.assertEqual(
+            first.execute(query).fetchall(), second.execute(query).fetchall()
+        )
+        self.assertNotEqual(
+            first.execute(query).fetchall(), other.execute(query).fetchall()
+        )
+
+    def test_unique_reads(self, mock_hash):
+        conn, _ = self.generate()
+        duplicates = conn.execute(
+            """
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM reading_list GROUP BY book, user HAVING COUNT(*) > 1
+            )
+            """
+        ).fetchone()[0]
+        self.assertEqual(duplicates, 0)
+
+    def test_popularity_is_skewed(self, mock_hash):
+        conn, counts = self.generate()
+        top = conn.execute(
+            """
+            SELECT COUNT(*) FROM reading_list
+            GROUP BY book ORDER BY COUNT(*) DESC LIMIT 10
+            """
+        ).fetchall()
+        # The 10 most read books of a 600+ books catalog get a large share
+        self.assertGreater(sum(count for count, in top), counts["reading_list"] / 5)
+
+
+class TestZipfWeights(unittest.TestCase):
+    def test_zipf_weights(self):
+        self.assertEqual(datagen.zipf_weights(3, 1), [1, 1.5, 1.5 + 1 / 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import unittest
+
+import backend.export as export
+from backend.models import ExportFormat
+
+COLUMNS = ("id", "title")
+
+
+class TestExportEncoders(unittest.TestCase):
+    def test_ndjson(self):
+        chunks = list(
+            export.encode([[(1, "Dune")], [(2, "Emma")]], COLUMNS, ExportFormat.ndjson)
+        )
+        self.assertEqual(len(chunks), 2)
+        lines = b"".join(chunks).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"id": 1, "title": "Dune"}, {"id": 2, "title": "Emma"}],
+        )
+
+    def test_csv(self):
+        chunks = list(
+            export.encode(
+                [[(1, "Dune"), (2, "War, and Peace")]], COLUMNS, ExportFormat.csv
+            )
+        )
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(
+            b"".join(chunks).decode().splitlines(),
+            ["id,title", "1,Dune", '2,"War, and Peace"'],
+        )
+
+    def test_csv_empty(self):
+        chunks = list(export.encode(iter([]), COLUMNS, ExportFormat.csv))
+        self.assertEqual(chunks, [b"id,title\r\n"])
+
+    def test_encoding_is_lazy(self):
+        def batches():
+            yield [(1, "Dune")]
+            raise AssertionError("Second batch must not be read yet")
+
+        chunks = export.encode(batches(), COLUMNS, ExportFormat.ndjson)
+        self.assertEqual(next(chunks), b'{"id":1,"title":"Dune"}\n')
+
+    def test_json_page(self):
+        batches = [([(1, "Dune")], None), ([(2, "Emma")], None), ([], "next")]
+        chunks = list(export.to_json_page(batches, COLUMNS, "books"))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(
+            json.loads(b"".join(chunks)),
+            {
+                "books": [{"id": 1, "title": "Dune"}, {"id": 2, "title": "Emma"}],
+                "next_cursor": "next",
+            },
+        )
+
+    def test_json_page_empty(self):
+        chunks = export.to_json_page([([], None)], COLUMNS, "books")
+        self.assertEqual(
+            json.loads(b"".join(chunks)), {"books": [], "next_cursor": None}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import backend.metrics as metrics
+
+
+class TestMetricTypes(unittest.TestCase):
+    def test_counter(self):
+        counter = metrics.Counter("test_total", "Test counter.", ("route",))
+        counter.inc("/a")
+        counter.inc("/a", amount=2)
+        self.assertEqual(counter.get("/a"), 3)
+        self.assertEqual(list(counter.samples()), [('test_total{route="/a"}', 3)])
+
+    def test_gauge(self):
+        gauge = metrics.Gauge("test_depth", "Test gauge.")
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertEqual(list(gauge.samples()), [("test_depth", 1)])
+
+    def test_histogram(self):
+        histogram = metrics.Histogram("test_seconds", "Test histogram.", ("fn",))
+        histogram.observe(0.0005, "f")
+        histogram.observe(0.003, "f")
+        histogram.observe(60, "f")
+        samples = dict(histogram.samples())
+        self.assertEqual(samples['test_seconds_bucket{fn="f",le="0.0005"}'], 1)
+        self.assertEqual(samples['test_seconds_bucket{fn="f",le="0.001"}'], 1)
+        self.assertEqual(samples['test_seconds_bucket{fn="f",le="0.005"}'], 2)
+        self.assertEqual(samples['test_seconds_bucket{fn="f",le="10.0"}'], 2)
+        self.assertEqual(samples['test_seconds_bucket{fn="f",le="+Inf"}'], 3)
+        self.assertEqual(samples['test_seconds_count{fn="f"}'], 3)
+        self.assertAlmostEqual(samples['test_seconds_sum{fn="f"}'], 60.0035)
+        self.assertEqual(histogram.get("f"), 3)
+
+    def test_hit_ratio(self):
+        counter = metrics.Counter("test_cache_total", "Test.", ("cache", "result"))
+        ratio = metrics.HitRatio("test_ratio", "Test.", counter)
+        counter.inc("etag", "hit", amount=3)
+        counter.inc("etag", "miss")
+        self.assertEqual(list(ratio.samples()), [('test_ratio{cache="etag"}', 0.75)])
+
+    def test_samples_added_while_rendering(self):
+        counter = metrics.Counter("test_total", "Test counter.", ("route",))
+        histogram = metrics.Histogram("test_seconds", "Test histogram.", ("fn",))
+        counter.inc("/a")
+        histogram.observe(0.001, "f")
+        for metric, add in (
+            (counter, lambda: counter.inc("/b")),
+            (histogram, lambda: histogram.observe(0.001, "g")),
+        ):
+            with self.subTest(metric=metric.name):
+                samples = metric.samples()
+                next(samples)
+                add()
+                list(samples)
+
+    def test_render(self):
+        text = metrics.render()
+        self.assertIn("# TYPE http_request_duration_seconds histogram\n", text)
+        self.assertIn("# TYPE bcrypt_queue_depth gauge\n", text)
+        self.assertTrue(text.endswith("\n"))
+
+
+class TestTimed(unittest.TestCase):
+    def test_function(self):
+        @metrics.timed
+        def timed_function_test(value):
+            return value * 2
+
+        before = metrics.DB_LATENCY.get("timed_function_test")
+        self.assertEqual(timed_function_test(2), 4)
+        self.assertEqual(metrics.DB_LATENCY.get("timed_function_test"), before + 1)
+
+    def test_generator(self):
+        @metrics.timed
+        def timed_generator_test():
+            yield 1
+            yield 2
+
+        before = metrics.DB_LATENCY.get("timed_generator_test")
+        batches = timed_generator_test()
+        self.assertEqual(next(batches), 1)
+        self.assertEqual(metrics.DB_LATENCY.get("timed_generator_test"), before)
+        batches.close()
+        self.assertEqual(metrics.DB_LATENCY.get("timed_generator_test"), before + 1)
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    def test_requests_are_labelled_by_route(self):
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        def get_item(item_id: int):
+            return item_id
+
+        app.add_middleware(metrics.MetricsMiddleware)
+        client = TestClient(app)
+
+        before = metrics.HTTP_REQUESTS.get("GET", "/items/{item_id}", "200")
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/missing")
+        self.assertEqual(
+            metrics.HTTP_REQUESTS.get("GET", "/items/{item_id}", "200"), before + 2
+        )
+        self.assertGreaterEqual(metrics.HTTP_REQUESTS.get("GET", "unmatched", "404"), 1)
+        self.assertGreaterEqual(metrics.HTTP_LATENCY.get("GET", "/items/{item_id}"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
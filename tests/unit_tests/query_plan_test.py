@@ -0,0 +1,229 @@
+import inspect
+import logging
+import re
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+import backend.database as db
+from backend import datagen
+
+# Tables growing with the number of books or users
+LARGE_TABLES = (
+    "books",
+    "authors",
+    "reading_list",
+    "users",
+    "reading_list_tombstones",
+    "book_stats",
+)
+
+# Functions allowed to scan a large table, and why
+ALLOWED_SCANS = {
+    "create_tables": "stops at the first book, to check the table is empty",
+    "get_books": "LIMIT/OFFSET pagination walks the table or the sort index",
+    "search_book_by_title": "LIKE '%...%' cannot use an index",
+    "count_title_matches": "counts the matches of a LIKE among a sample of books",
+    "iter_books": "exports the whole catalog",
+    "get_users": "lists all the users, not used in the application",
+    "purge_tombstones": "the periodic compaction reads all the tombstones",
+}
+
+# Every function of the database module with the arguments to call it with.
+# Writes come last so the reads run against the generated data.
+USER_ID = 1
+CALLS: tuple[tuple[str, tuple], ...] = (
+    ("get_books", (100, 15, None, None, None)),
+    ("get_books", (0, 15, None, None, "popular")),
+    ("get_books", (0, 15, "Fiction", None, "title")),
+    ("get_genres", ()),
+    ("get_book", (10,)),
+    ("get_book_count", ()),
+    ("get_existing_book_ids", ([1, 10, 20],)),
+    ("get_books_by_ids", ([20, 1, 10, 999_999],)),
+    ("get_catalog_version", ()),
+    ("search_book_by_title", ("Garden", 0, 20)),
+    ("count_title_matches", ("Garden", 1000)),
+    ("iter_books", ()),
+    ("get_users", ()),
+    ("get_user", (USER_ID,)),
+    ("get_user_by_username", ("user2",)),
+    ("get_reading_lists", (USER_ID,)),
+    ("iter_reading_list", (USER_ID,)),
+    ("iter_reading_list_page", (USER_ID, None, "recent", None, 16)),
+    ("iter_reading_list_page", (USER_ID, "started", "oldest", ("2024-01-01", 5), 16)),
+    ("get_book_in_reading_list", (USER_ID, 10)),
+    ("get_reading_list_statuses", (USER_ID, [1, 10, 20])),
+    ("get_reading_list_changes", (USER_ID, "2024-01-01 00:00:00")),
+    ("get_tombstones", (USER_ID, "2024-01-01 00:00:00")),
+    ("get_completed_books", (USER_ID,)),
+    ("get_readers", (10,)),
+    ("get_book_read_count", (10,)),
+    ("get_status_totals", ()),
+    ("get_genre_stats", ()),
+    ("get_daily_completions", ("2024-01-01",)),
+    ("get_trending_books", (10,)),
+    ("create_tables", ()),
+    ("migrate", ()),
+    ("create_indexes", ()),
+    ("create_catalog_version_triggers", ()),
+    ("create_book", ("Title", "Author", "Fiction")),
+    ("update_book", (10, "Title", "Author", "Fiction")),
+    ("create_user", ("planner", "hash")),
+    ("update_user", (2, "user2", "hash")),
+    ("create_reading_list", (USER_ID, 10, "started")),
+    ("update_reading_status", (USER_ID, 10, "complete")),
+    ("begin_write", ()),
+    ("apply_reading_list_changes", (USER_ID, [(20, "started")], [], [])),
+    ("remove_from_reading_list", (USER_ID, 10)),
+    ("purge_tombstones", ("2024-01-01 00:00:00",)),
+    ("delete_book", (11,)),
+    ("delete_user", (3,)),
+    ("drop_tables", ()),
+)
+# Not queries, or helpers of the module
+NOT_QUERIES = {"connect", "instrumented"}
+
+_SCAN = re.compile(r"^SCAN (\w+)")
+# Statements run by triggers are reported as comments and DDL has no plan
+_QUERY = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE)\b", re.I)
+_ALIAS = re.compile(r"\b(" + "|".join(LARGE_TABLES) + r")\s+(?:AS\s+)?(\w+)", re.I)
+
+
+def explain(conn, statement):
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    return [row[3] for row in rows]
+
+
+def trace(conn, func, *args):
+    """
+    Calls a database function and returns the statements it issued.
+    """
+    statements = []
+    conn.set_trace_callback(statements.append)
+    result = func(*args, conn)
+    if inspect.isgenerator(result):
+        list(result)
+    conn.set_trace_callback(None)
+    return statements
+
+
+def large_scans(statement, plan):
+    """
+    Returns the large tables scanned by a plan, resolving the table aliases.
+    """
+    aliases = {alias: table for table, alias in _ALIAS.findall(statement)}
+    scans = []
+    for detail in plan:
+        if match := _SCAN.match(detail):
+            table = aliases.get(match[1], match[1])
+            if table in LARGE_TABLES:
+                scans.append(detail)
+    return scans
+
+
+class TestQueryPlans(unittest.TestCase):
+    @classmethod
+    @patch("backend.datagen.Hasher.password_hash", return_value="hash")
+    def setUpClass(cls, mock_hash):
+        logging.disable(logging.INFO)
+        cls.conn = sqlite3.connect(":memory:")
+        datagen.generate(cls.conn, 5_000, 200, reads_per_user=20)
+
+        # Query plans of the statements issued by each function, explained
+        # right after the call with the bound values
+        cls.plans = {}
+        cls.sort_plans = cls.get_books_plans()
+        for name, args in CALLS:
+            statements = trace(cls.conn, getattr(db, name), *args)
+            cls.plans.setdefault(name, []).extend(
+                (statement, explain(cls.conn, statement))
+                for statement in statements
+                if _QUERY.match(statement)
+            )
+
+    @classmethod
+    def get_books_plans(cls):
+        """
+        Plans of the catalog page query by (genre, author, sort), before the
+        calls change the data.
+        """
+        author = cls.conn.execute("SELECT author FROM books LIMIT 1").fetchone()[0]
+        filters = [(None, None), ("Fiction", None), (None, author)]
+        plans = {}
+        for genre, author in filters:
+            for sort in db.BOOK_SORTS:
+                (statement,) = trace(cls.conn, db.get_books, 0, 15, genre, author, sort)
+                plans[genre, author, sort] = explain(cls.conn, statement)
+        return plans
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        logging.disable(logging.NOTSET)
+
+    def scans(self, name):
+        return [
+            scan
+            for statement, plan in self.plans[name]
+            for scan in large_scans(statement, plan)
+        ]
+
+    def test_every_function_is_covered(self):
+        functions = {
+            name
+            for name, func in inspect.getmembers(db, inspect.isfunction)
+            if func.__module__ == db.__name__ and name not in NOT_QUERIES
+        }
+        self.assertEqual(functions, {name for name, _ in CALLS})
+
+    def test_no_scan_of_large_tables(self):
+        for name, _ in CALLS:
+            if name not in ALLOWED_SCANS:
+                with self.subTest(function=name):
+                    self.assertEqual(self.scans(name), [])
+
+    def test_allowed_scans_are_needed(self):
+        # Remove the functions that no longer scan from the allow-list
+        for name in ALLOWED_SCANS:
+            with self.subTest(function=name):
+                self.assertNotEqual(self.scans(name), [])
+
+    def test_book_sorts_use_an_index(self):
+        # Top-N queries read the N books of the page from an index, except
+        # for the books of an author, which are few enough to be sorted
+        for (genre, author, sort), plan in self.sort_plans.items():
+            if author is None:
+                with self.subTest(genre=genre, sort=sort):
+                    self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+        author_plan = next(
+            plan
+            for (genre, author, sort), plan in self.sort_plans.items()
+            if author is not None and sort == "popular"
+        )
+        self.assertIn(
+            "SEARCH books USING INDEX books_author_reads (author=?)", author_plan
+        )
+
+    def test_reading_list_sorts_use_an_index(self):
+        # Pages of a reading list are read in order from an index
+        for statement, plan in self.plans["iter_reading_list_page"]:
+            with self.subTest(statement=statement):
+                self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+        self.assertIn(
+            "SEARCH r USING INDEX reading_list_user_status_updated_at "
+            "(user=? AND reading_status=? AND updated_at>?)",
+            self.plans["iter_reading_list_page"][1][1],
+        )
+
+    def test_large_scans(self):
+        statement = "SELECT * FROM reading_list r JOIN books b ON b.id = r.book"
+        self.assertEqual(
+            large_scans(statement, ["SCAN r", "SEARCH b USING INTEGER PRIMARY KEY"]),
+            ["SCAN r"],
+        )
+        self.assertEqual(large_scans("SELECT 1", ["SCAN catalog_version"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
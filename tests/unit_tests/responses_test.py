@@ -0,0 +1,69 @@
+import json
+import unittest
+from datetime import datetime
+
+import backend.models as models
+from backend.responses import FastJSONResponse
+
+
+class TestFastJSONResponse(unittest.TestCase):
+    def test_render_models(self):
+        books = [
+            models.MyRead.model_construct(
+                id=1,
+                title="Book",
+                author="Author",
+                genre="Genre",
+                reads=2,
+                status=models.StatusEnum.started,
+                updated_at=datetime(2024, 4, 27, 15, 32, 30),
+            )
+        ]
+        response = FastJSONResponse(books)
+        self.assertEqual(response.media_type, "application/json")
+        self.assertEqual(
+            json.loads(response.body),
+            [
+                {
+                    "id": 1,
+                    "title": "Book",
+                    "author": "Author",
+                    "genre": "Genre",
+                    "reads": 2,
+                    "status": "started",
+                    "updated_at": "2024-04-27T15:32:30",
+                }
+            ],
+        )
+
+    def test_render_nested_models(self):
+        books = models.Books.model_construct(
+            books=[models.Book(id=1, title="Book", author="Author", genre="Genre")],
+            previous_n=0,
+            next_n=None,
+        )
+        response = FastJSONResponse(books)
+        self.assertEqual(
+            json.loads(response.body),
+            {
+                "books": [
+                    {
+                        "id": 1,
+                        "title": "Book",
+                        "author": "Author",
+                        "genre": "Genre",
+                        "reads": None,
+                    }
+                ],
+                "previous_n": 0,
+                "next_n": None,
+            },
+        )
+
+    def test_render_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            FastJSONResponse({"value": object()})
+
+
+if __name__ == "__main__":
+    unittest.main()
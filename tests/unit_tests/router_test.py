@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import backend.caching as caching
+import backend.search as search
+import backend.security as security
+import backend.snapshot as snapshot
+from backend import datagen
+from backend.router import router
+
+ADMIN_ID = 1
+USER_ID = 2
+
+
+class TestRoutes(unittest.TestCase):
+    """
+    Calls the routes over HTTP, against a small generated database.
+    """
+
+    @classmethod
+    @patch("backend.datagen.Hasher.password_hash", return_value="hash")
+    def setUpClass(cls, mock_hash):
+        logging.disable(logging.INFO)
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, "db.sqlite3")
+        conn = sqlite3.connect(cls.path)
+        datagen.generate(conn, 100, 3, reads_per_user=10)
+        cls.book_count = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+        # Books out of the user's reading list
+        cls.unread = [
+            row[0]
+            for row in conn.execute(
+                "SELECT id FROM books WHERE id NOT IN "
+                "(SELECT book FROM reading_list WHERE user = ?) LIMIT 2",
+                (USER_ID,),
+            )
+        ]
+        conn.close()
+
+        app = FastAPI()
+        app.include_router(router)
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        for target, value in (
+            ("backend.service.SQLITE_DB", self.path),
+            ("backend.security.SECRET_KEY", "secret"),
+            ("backend.security.ALGORITHM", "HS256"),
+            ("backend.security.ADMIN_USER_IDS", {ADMIN_ID}),
+            # Served from the database, the in-memory indexes are not loaded
+            ("backend.snapshot.CATALOG", snapshot.CurrentSnapshot(0)),
+            ("backend.search.INDEX", search.TrigramIndex()),
+            ("backend.suggest.SUGGESTIONS", snapshot.CurrentSnapshot(0)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        caching.READING_LISTS.clear()
+
+    def auth(self, user_id=USER_ID):
+        token = security.create_jwt_token({"user_id": user_id})
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_suggest(self):
+        response = self.client.get("/api/search/suggest", params={"prefix": "a"})
+        self.assertEqual(response.status_code, 200)
+        # Empty until the autocomplete index is built
+        self.assertEqual(response.json(), [])
+        self.assertIn("etag", response.headers)
+
+        for params in ({}, {"prefix": ""}, {"prefix": "a", "n": 1000}):
+            with self.subTest(params=params):
+                response = self.client.get("/api/search/suggest", params=params)
+                self.assertEqual(response.status_code, 422)
+
+    def test_books_batch(self):
+        response = self.client.get("/api/books/batch", params={"ids": "3,1,1000"})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([book["id"] for book in body["books"]], [3, 1])
+        self.assertEqual(body["missing"], [1000])
+
+        ids = ",".join(map(str, range(1, 200)))
+        response = self.client.get("/api/books/batch", params={"ids": ids})
+        self.assertEqual(response.status_code, 400)
+        for ids in ("1,a", "", str(2**63)):
+            with self.subTest(ids=ids):
+                response = self.client.get("/api/books/batch", params={"ids": ids})
+                self.assertEqual(response.status_code, 422)
+
+    def test_reads_sync(self):
+        response = self.client.get("/api/reads", headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        cursor = response.headers["x-sync-cursor"]
+
+        book_id = self.unread[0]
+        self.client.post("/api/reads", params={"book_id": book_id}, headers=self.auth())
+        response = self.client.get(
+            "/api/reads", params={"since": cursor}, headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(book_id, [book["id"] for book in response.json()["changed"]])
+        self.assertEqual(response.headers["x-sync-cursor"], response.json()["cursor"])
+
+        expired = datetime.now(timezone.utc) - timedelta(days=365)
+        for since, status_code in (
+            ("yesterday", 400),
+            (expired.strftime("%Y-%m-%dT%H:%M:%SZ"), 410),
+        ):
+            with self.subTest(since=since):
+                response = self.client.get(
+                    "/api/reads", params={"since": since}, headers=self.auth()
+                )
+                self.assertEqual(response.status_code, status_code)
+        self.assertEqual(self.client.get("/api/reads").status_code, 403)
+
+    def test_reads_page(self):
+        response = self.client.get(
+            "/api/reads", params={"limit": 2, "sort": "oldest"}, headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(len(page["books"]), 2)
+
+        response = self.client.get(
+            "/api/reads",
+            params={"limit": 2, "sort": "oldest", "cursor": page["next_cursor"]},
+            headers=self.auth(),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(
+            page["books"][0]["id"], [book["id"] for book in response.json()["books"]]
+        )
+
+        response = self.client.get(
+            "/api/reads", params={"cursor": "invalid"}, headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            "/api/reads", params={"limit": 0}, headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 422)
+
+    def test_reads_stream_needs_a_token(self):
+        response = self.client.get("/api/reads/stream")
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(
+            "/api/reads/stream", params={"access_token": "invalid"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_reads_batch(self):
+        operations = [
+            {"action": "add", "book_id": self.unread[1]},
+            {"action": "update", "book_id": self.unread[1], "status": "complete"},
+            {"action": "add", "book_id": 1000},
+        ]
+        response = self.client.post(
+            "/api/reads/batch", json=operations, headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status_code"] for result in response.json()], [200, 200, 404]
+        )
+
+        with patch("backend.service.READS_BATCH_MAX_SIZE", 2):
+            response = self.client.post(
+                "/api/reads/batch", json=operations, headers=self.auth()
+            )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/api/reads/batch", json=[{"action": "read", "book_id": 1}]
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_batch(self):
+        requests = [
+            {"path": "/api/me"},
+            {"path": "/api/books", "params": {"n": 2}},
+            {"path": "/api/search"},
+            {"path": "/api/unknown"},
+        ]
+        response = self.client.post("/api/batch", json=requests, headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        me, books, *_ = response.json()
+        self.assertEqual(me["body"]["id"], USER_ID)
+        self.assertEqual(len(books["body"]["books"]), 2)
+        # The requests fail on their own
+        self.assertEqual(
+            [item["status_code"] for item in response.json()], [200, 200, 422, 404]
+        )
+
+        with patch("backend.router.BATCH_MAX_REQUESTS", 3):
+            response = self.client.post(
+                "/api/batch", json=requests, headers=self.auth()
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post("/api/batch", json=[]).status_code, 403)
+
+    def test_export_books_is_for_administrators(self):
+        response = self.client.get("/api/export/books", headers=self.auth(ADMIN_ID))
+        self.assertEqual(response.status_code, 200)
+        lines = response.text.splitlines()
+        self.assertEqual(len(lines), self.book_count)
+        self.assertEqual(json.loads(lines[0])["id"], 1)
+
+        response = self.client.get(
+            "/api/export/books", params={"format": "csv"}, headers=self.auth(ADMIN_ID)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="books.csv"', response.headers["content-disposition"])
+
+        response = self.client.get("/api/export/books", headers=self.auth())
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get("/api/export/books").status_code, 403)
+
+    def test_export_reads(self):
+        response = self.client.get("/api/export/reads", headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'filename="reads.ndjson"', response.headers["content-disposition"]
+        )
+        response = self.client.get(
+            "/api/export/reads", params={"format": "xml"}, headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.client.get("/api/export/reads").status_code, 403)
+
+    def test_stats(self):
+        response = self.client.get("/api/stats", params={"n": 3, "days": 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.json()["trending"]), 3)
+        for params in ({"n": 0}, {"days": 100_000}):
+            with self.subTest(params=params):
+                self.assertEqual(
+                    self.client.get("/api/stats", params=params).status_code, 422
+                )
+
+    def test_slow_queries_are_for_administrators(self):
+        for method in ("GET", "DELETE"):
+            with self.subTest(method=method):
+                response = self.client.request(
+                    method, "/api/admin/slow-queries", headers=self.auth(ADMIN_ID)
+                )
+                self.assertEqual(response.status_code, 200)
+                response = self.client.request(
+                    method, "/api/admin/slow-queries", headers=self.auth()
+                )
+                self.assertEqual(response.status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import patch
+
+import backend.search as search
+
+BOOKS = [
+    (1, "The Hobbit", "J. R. R. Tolkien"),
+    (2, "Dune", "Frank Herbert"),
+    (3, "Dune Messiah", "Frank Herbert"),
+    (4, "Harry Potter and the Chamber of Secrets", "J. K. Rowling"),
+    (5, "Emma", "Jane Austen"),
+    (6, "Hobbit", "Unknown"),
+]
+
+
+class TestTrigrams(unittest.TestCase):
+    def test_trigrams(self):
+        self.assertEqual(search.trigrams("Dune"), {"  d", " du", "dun", "une", "ne "})
+        # Words are padded separately, punctuation is dropped
+        self.assertEqual(search.trigrams("A-b"), {"  a", " a ", "  b", " b "})
+        self.assertEqual(search.trigrams(" ?! "), set())
+
+    def test_sound(self):
+        self.assertEqual(search.sound("Doon"), "dn")
+        self.assertEqual(search.sound("Dune"), "dn")
+        self.assertEqual(search.sound("Emma"), "em")
+        self.assertEqual(search.sound("Don Quixote"), "dnqxt")
+        self.assertEqual(search.sound(""), "")
+
+
+class TestTrigramIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = search.TrigramIndex()
+        self.index.load(BOOKS)
+
+    def test_load(self):
+        self.assertTrue(self.index.loaded)
+        # Each distinct text is indexed once
+        self.assertEqual(len(self.index.sizes), 11)
+        self.assertEqual(self.index.books[self.index.codes["Frank Herbert"]], [2, 3])
+
+    def test_search_typos(self):
+        self.assertEqual(self.index.search("Hobit", 0.5), [6, 1])
+        self.assertEqual(self.index.search("hary poter", 0.5), [4])
+        self.assertEqual(self.index.search("Tolkein", 0.5), [1])
+        self.assertEqual(self.index.search("Dun", 0.5), [2, 3])
+        # Too few trigrams of a short word are left by a typo, its sound
+        # matches
+        self.assertEqual(self.index.search("Doon", 0.5), [2])
+
+    def test_search_ranking(self):
+        # Titles and authors both match, the closest texts first
+        self.assertEqual(self.index.search("frank dune", 0.5), [2, 3])
+        self.assertEqual(self.index.search("Dune Messiah", 0.3), [3, 2])
+        self.assertEqual(self.index.search("Dune Messiah", 0.5, limit=1), [3])
+
+    def test_search_short_ranking(self):
+        self.index.add(7, "Don Quixote", "Miguel de Cervantes")
+        # The texts sounding like a short query come before the ones only
+        # matching more of its trigrams, after the ones containing it
+        self.assertEqual(self.index.search("Doon", 0.5), [2, 7])
+        self.assertEqual(self.index.search("Don", 0.5), [7, 2])
+        # Only when the threshold is low enough
+        self.assertEqual(self.index.search("Doon", 0.6), [7])
+
+    def test_search_threshold(self):
+        self.assertEqual(self.index.search("Emmy", 0.5), [5])
+        self.assertEqual(self.index.search("Emmy", 0.8), [])
+        self.assertEqual(self.index.search("", 0.5), [])
+
+    @patch("backend.search.COMMON_MIN_TEXTS", 1)
+    def test_common_trigrams(self):
+        with patch("backend.search.COMMON_SHARE", 4):
+            # "  h" is in more than 11 // 4 texts: The Hobbit, Hobbit, Harry
+            # Potter and Frank Herbert
+            grams = search.trigrams("Hobbit")
+            self.assertEqual(len(self.index._postings(grams)), len(grams) - 1)
+            self.assertEqual(self.index.search("Hobbit", 1), [6, 1])
+        with patch("backend.search.COMMON_SHARE", 11):
+            # The trigrams of "J" are all common
+            self.assertEqual(self.index.search("J", 1), [1, 4])
+
+    def test_add(self):
+        self.index.add(7, "The Hobbit", "Tolkien")
+        self.assertEqual(self.index.search("Hobbit", 0.5), [6, 1, 7])
+        self.assertEqual(self.index.search("Tolkien", 1), [7, 1])
+        # Adding a book again updates it
+        self.index.add(7, "Silmarillion", "Tolkien")
+        self.assertEqual(self.index.search("Hobbit", 0.5), [6, 1])
+        self.assertEqual(self.index.search("Silmarilion", 0.5), [7])
+
+    def test_remove(self):
+        self.index.remove(2)
+        self.assertEqual(self.index.search("Dune", 0.5), [3])
+        self.index.remove(3)
+        self.assertEqual(self.index.search("Dune", 0.5), [])
+        self.assertEqual(self.index.search("Herbert", 0.5), [])
+        self.index.remove(3)
+        # A text indexed again reuses its code
+        self.index.add(3, "Dune", "Frank Herbert")
+        self.assertEqual(self.index.search("Dune", 0.5), [3])
+        self.assertEqual(len(self.index.sizes), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,13 @@ from fastapi.security import HTTPAuthorizationCredentials
 from jose import ExpiredSignatureError, JWTError
 
 from backend.const import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
-from backend.security import create_jwt_token, get_user, get_user_from_token
+from backend.security import (
+    create_jwt_token,
+    get_admin,
+    get_stream_user,
+    get_user,
+    get_user_from_token,
+)
 
 
 class TestAuthenticationFunctions(unittest.TestCase):
@@ -85,6 +91,37 @@ class TestAuthenticationFunctions(unittest.TestCase):
         self.assertEqual(context.exception.status_code, 401)
         self.assertEqual(context.exception.detail, "Invalid authentication scheme")
 
+    @patch("backend.security.ADMIN_USER_IDS", {1})
+    def test_get_admin(self):
+        self.assertEqual(get_admin(1), 1)
+
+    @patch("backend.security.ADMIN_USER_IDS", {1})
+    def test_get_admin_not_admin(self):
+        with self.assertRaises(HTTPException) as context:
+            get_admin(2)
+
+        self.assertEqual(context.exception.status_code, 403)
+        self.assertEqual(context.exception.detail, "Admin access required")
+
+    @patch("backend.security.get_user_from_token", return_value=1)
+    def test_get_stream_user(self, mock_get_user_from_token):
+        authorization = HTTPAuthorizationCredentials(
+            scheme="Bearer", credentials="header_token"
+        )
+        self.assertEqual(get_stream_user(authorization, "query_token", None), 1)
+        mock_get_user_from_token.assert_called_with("header_token")
+        # Without the header, from the query parameter then the cookie
+        self.assertEqual(get_stream_user(None, "query_token", "cookie_token"), 1)
+        mock_get_user_from_token.assert_called_with("query_token")
+        self.assertEqual(get_stream_user(None, None, "cookie_token"), 1)
+        mock_get_user_from_token.assert_called_with("cookie_token")
+
+    def test_get_stream_user_missing(self):
+        with self.assertRaises(HTTPException) as context:
+            get_stream_user(None, None, None)
+
+        self.assertEqual(context.exception.status_code, 401)
+
 
 if __name__ == "__main__":
     unittest.main()
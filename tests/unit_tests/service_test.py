@@ -1,10 +1,22 @@
+import sqlite3
 import unittest
+from datetime import date, datetime, timedelta, timezone
 from unittest.mock import ANY, MagicMock, patch
 
 from fastapi import HTTPException
 
+import backend.caching as caching
 import backend.models as models
+import backend.search as search
 import backend.service as service
+import backend.snapshot as snapshot
+import backend.suggest as suggest
+
+CATALOG_BOOKS = [
+    (1, "Book Title", "Author", "Genre", 100),
+    (2, "Next Title", "Author", "Other", 10),
+    (3, "Last Title", "Writer", "Genre", 50),
+]
 
 
 class TestHasher(unittest.TestCase):
@@ -131,25 +143,46 @@ class TestUser(unittest.TestCase):
         mock_conn.close.assert_called_once()
 
 
+class TestSharedConnection(unittest.TestCase):
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_genres", return_value=["Fantasy"])
+    @patch("backend.database.get_catalog_version", return_value="v-1")
+    def test_shared_connection(
+        self, mock_get_catalog_version, mock_get_genres, mock_connect
+    ):
+        mock_conn = mock_connect.return_value
+
+        with service.shared_connection() as conn:
+            self.assertEqual(service.Book.get_genres(), ["Fantasy"])
+            self.assertEqual(service.Book.get_catalog_version(), "v-1")
+            mock_conn.close.assert_not_called()
+
+        self.assertEqual(conn, mock_conn)
+        mock_connect.assert_called_once()
+        mock_get_genres.assert_called_once_with(mock_conn)
+        mock_conn.close.assert_called_once()
+
+        # Outside of the block, each call opens its own connection again
+        service.Book.get_genres()
+        self.assertEqual(mock_connect.call_count, 2)
+        self.assertEqual(mock_conn.close.call_count, 2)
+
+
 class TestBook(unittest.TestCase):
     @patch("sqlite3.connect")
     @patch("backend.database.get_book")
-    @patch("backend.database.get_book_read_count")
-    def test_from_db_book_found(
-        self, mock_get_book_read_count, mock_get_book, mock_connect
-    ):
+    def test_from_db_book_found(self, mock_get_book, mock_connect):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
-        mock_get_book.return_value = (1, "Book Title", "Author Name", "Genre")
-        mock_get_book_read_count.return_value = 100
+        mock_get_book.return_value = (1, "Book Title", "Author Name", "Genre", 100)
 
         book = service.Book.from_db(1)
         self.assertIsInstance(book, models.Book)
         self.assertEqual(book.id, 1)
         self.assertEqual(book.title, "Book Title")
+        self.assertEqual(book.reads, 100)
         mock_get_book.assert_called_once_with(1, mock_conn)
-        mock_get_book_read_count.assert_called_once_with(1, mock_conn)
         mock_conn.close.assert_called_once()
 
     @patch("sqlite3.connect")
@@ -167,21 +200,14 @@ class TestBook(unittest.TestCase):
 
     @patch("sqlite3.connect")
     @patch("backend.database.get_books")
-    @patch("backend.database.get_book_read_count")
-    @patch("backend.database.get_book_count")
-    def test_get_books(
-        self,
-        mock_get_book_count,
-        mock_get_book_read_count,
-        mock_get_books,
-        mock_connect,
-    ):
+    def test_get_books(self, mock_get_books, mock_connect):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
-        mock_get_books.return_value = [(1, "Book Title", "Author", "Genre")]
-        mock_get_book_read_count.return_value = 100
-        mock_get_book_count.return_value = 20
+        mock_get_books.return_value = [
+            (1, "Book Title", "Author", "Genre", 100),
+            (2, "Next Title", "Author", "Genre", 10),
+        ]
 
         books = service.Book.get_books(0, 1)
         self.assertIsInstance(books, models.Books)
@@ -189,22 +215,35 @@ class TestBook(unittest.TestCase):
         self.assertEqual(books.books[0].title, "Book Title")
         self.assertEqual(books.books[0].author, "Author")
         self.assertEqual(books.books[0].genre, "Genre")
+        self.assertEqual(books.books[0].reads, 100)
+        self.assertEqual((books.previous_n, books.next_n), (0, 1))
 
-        mock_get_books.assert_called_once_with(0, 1, mock_conn)
-        mock_get_book_read_count.assert_called_once_with(1, mock_conn)
+        mock_get_books.assert_called_once_with(0, 2, None, None, None, mock_conn)
         mock_conn.close.assert_called_once()
 
     @patch("sqlite3.connect")
-    @patch("backend.database.get_book_read_count")
+    @patch("backend.database.get_books")
+    def test_get_books_last_page(self, mock_get_books, mock_connect):
+        mock_connect.return_value = MagicMock()
+        mock_get_books.return_value = [(3, "Book Title", "Author", "Genre", 1)]
+
+        books = service.Book.get_books(2, 1, "Genre", "Author", "popular")
+        self.assertEqual((books.previous_n, books.next_n), (1, None))
+        mock_get_books.assert_called_once_with(
+            2, 2, "Genre", "Author", "popular", mock_connect.return_value
+        )
+        with self.assertRaises(ValueError):
+            service.Book.get_books(0, 1, sort="reads")
+
+    @patch("sqlite3.connect")
     @patch("backend.database.search_book_by_title")
-    def test_search_book_found(
-        self, mock_search_book_by_title, mock_get_book_read_count, mock_connect
-    ):
+    def test_search_book_found(self, mock_search_book_by_title, mock_connect):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
-        mock_search_book_by_title.return_value = [(1, "Book Title", "Author", "Genre")]
-        mock_get_book_read_count.return_value = 100
+        mock_search_book_by_title.return_value = [
+            (1, "Book Title", "Author", "Genre", 100)
+        ]
 
         books = service.Book.search_book("Book Title")
         self.assertIsInstance(books, list)
@@ -212,8 +251,11 @@ class TestBook(unittest.TestCase):
         self.assertEqual(books[0].title, "Book Title")
         self.assertEqual(books[0].author, "Author")
         self.assertEqual(books[0].genre, "Genre")
+        self.assertEqual(books[0].reads, 100)
 
-        mock_search_book_by_title.assert_called_once_with("Book Title", mock_conn)
+        mock_search_book_by_title.assert_called_once_with(
+            "Book Title", 0, 101, mock_conn
+        )
         mock_conn.close.assert_called_once()
 
     @patch("sqlite3.connect")
@@ -223,6 +265,215 @@ class TestBook(unittest.TestCase):
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
         mock_search_book_by_title.return_value = []
+        self.assertEqual(service.Book.search_book("Book Title"), [])
+        mock_conn.close.assert_called_once()
+
+    @patch("backend.service.SEARCH_ESTIMATE_SAMPLE", 10)
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_book_count", return_value=100)
+    @patch("backend.database.count_title_matches", return_value=3)
+    @patch("backend.database.search_book_by_title")
+    def test_search_page(
+        self,
+        mock_search_book_by_title,
+        mock_count_title_matches,
+        mock_get_book_count,
+        mock_connect,
+    ):
+        mock_conn = mock_connect.return_value
+        rows = [(book_id, "Title", "Author", "Genre", 0) for book_id in (4, 5, 6)]
+        mock_search_book_by_title.return_value = rows
+
+        page = service.Book.search_page("Title", "2", 2, estimate=True)
+        self.assertEqual([book.id for book in page.books], [4, 5])
+        self.assertEqual(page.next_cursor, "4")
+        # 3 matches among the first 10 books out of 100
+        self.assertEqual(page.total_estimate, 30)
+        mock_search_book_by_title.assert_called_once_with("Title", 2, 3, mock_conn)
+        mock_count_title_matches.assert_called_once_with("Title", 10, mock_conn)
+
+        mock_search_book_by_title.return_value = rows[:1]
+        page = service.Book.search_page("Title", "4", 2)
+        self.assertEqual([book.id for book in page.books], [4])
+        self.assertIsNone(page.next_cursor)
+        self.assertIsNone(page.total_estimate)
+
+    @patch("backend.service.SEARCH_MAX_RESULTS", 5)
+    @patch("sqlite3.connect")
+    @patch("backend.database.search_book_by_title")
+    def test_search_page_max_results(self, mock_search_book_by_title, mock_connect):
+        mock_search_book_by_title.return_value = [
+            (book_id, "Title", "Author", "Genre", 0) for book_id in range(3)
+        ]
+        # The books after the first 5 cannot be paged through
+        page = service.Book.search_page("Title", "3", 4)
+        mock_search_book_by_title.assert_called_once_with(
+            "Title", 3, 3, mock_connect.return_value
+        )
+        self.assertEqual(len(page.books), 2)
+        self.assertIsNone(page.next_cursor)
+
+        for cursor in ("5", "-1", "one"):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(HTTPException) as context:
+                    service.Book.search_page("Title", cursor)
+                self.assertEqual(context.exception.status_code, 400)
+
+    @patch("backend.service.Catalog.snapshot")
+    @patch("backend.service.Book.get_catalog_version", return_value="v1")
+    def test_search_page_from_index(self, mock_version, mock_snapshot):
+        index = search.TrigramIndex()
+        index.load(row[:3] for row in CATALOG_BOOKS)
+        mock_snapshot.return_value = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+
+        with patch("backend.search.INDEX", index):
+            page = service.Book.search_page("Title", None, 1, estimate=True)
+            self.assertEqual([book.id for book in page.books], [1])
+            self.assertEqual(page.total_estimate, 3)
+            page = service.Book.search_page("Title", page.next_cursor, 2)
+            self.assertEqual([book.id for book in page.books], [2, 3])
+            self.assertIsNone(page.next_cursor)
+
+    @patch("backend.service.Catalog.snapshot")
+    @patch("backend.service.Book.get_catalog_version", return_value="v1")
+    @patch("sqlite3.connect")
+    @patch("backend.database.search_book_by_title")
+    def test_search_book_from_index(
+        self, mock_search_book_by_title, mock_connect, mock_version, mock_snapshot
+    ):
+        index = search.TrigramIndex()
+        index.load(row[:3] for row in CATALOG_BOOKS)
+        mock_snapshot.return_value = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+
+        with patch("backend.search.INDEX", index):
+            books = service.Book.search_book("Last Titel")
+        self.assertEqual(
+            books,
+            [
+                models.Book(
+                    id=3, title="Last Title", author="Writer", genre="Genre", reads=50
+                )
+            ],
+        )
+        mock_snapshot.assert_called_once_with("v1")
+        mock_search_book_by_title.assert_not_called()
+        mock_connect.assert_not_called()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.search_book_by_title")
+    def test_search_book_from_index_fallback(
+        self, mock_search_book_by_title, mock_connect
+    ):
+        index = search.TrigramIndex()
+        index.load(row[:3] for row in CATALOG_BOOKS)
+        mock_search_book_by_title.return_value = [CATALOG_BOOKS[0]]
+
+        with patch("backend.search.INDEX", index):
+            # Names shorter than a trigram are searched in the titles
+            books = service.Book.search_book("it")
+            self.assertEqual([book.id for book in books], [1])
+            mock_search_book_by_title.assert_called_once_with(
+                "it", 0, ANY, mock_connect.return_value
+            )
+            # The ones close to no text find nothing, without a scan
+            mock_connect.reset_mock()
+            page = service.Book.search_page("itl", estimate=True)
+            self.assertEqual((page.books, page.total_estimate), ([], 0))
+            mock_search_book_by_title.assert_called_once()
+            mock_connect.assert_not_called()
+
+    @patch("backend.service.Catalog.snapshot", return_value=None)
+    @patch("backend.service.Book.get_catalog_version", return_value="v2")
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_books_by_ids")
+    def test_search_book_from_index_without_snapshot(
+        self, mock_get_books_by_ids, mock_connect, mock_version, mock_snapshot
+    ):
+        index = search.TrigramIndex()
+        index.load(row[:3] for row in CATALOG_BOOKS)
+        # Book 2 was deleted since the index was loaded
+        mock_get_books_by_ids.return_value = [CATALOG_BOOKS[0]]
+
+        with patch("backend.search.INDEX", index):
+            books = service.Book.search_book("Author")
+        self.assertEqual([book.id for book in books], [1])
+        mock_get_books_by_ids.assert_called_once_with([1, 2], mock_connect.return_value)
+        mock_connect.return_value.close.assert_called_once()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_books_by_ids")
+    def test_get_books_by_ids(self, mock_get_books_by_ids, mock_connect):
+        mock_get_books_by_ids.return_value = [CATALOG_BOOKS[2], CATALOG_BOOKS[0]]
+
+        batch = service.Book.get_books_by_ids([1, 7, 3, 1])
+        self.assertEqual([book.id for book in batch.books], [1, 3, 1])
+        self.assertEqual(batch.books[1].reads, 50)
+        self.assertEqual(batch.missing, [7])
+        mock_get_books_by_ids.assert_called_once_with(
+            [1, 7, 3, 1], mock_connect.return_value
+        )
+        mock_connect.return_value.close.assert_called_once()
+
+    @patch("sqlite3.connect")
+    def test_get_books_by_ids_from_snapshot(self, mock_connect):
+        catalog = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+        batch = service.Book.get_books_by_ids([3, 9, 2], catalog)
+        self.assertEqual(
+            batch.books,
+            [
+                models.Book(
+                    id=3, title="Last Title", author="Writer", genre="Genre", reads=50
+                ),
+                models.Book(
+                    id=2, title="Next Title", author="Author", genre="Other", reads=10
+                ),
+            ],
+        )
+        self.assertEqual(batch.missing, [9])
+        self.assertEqual(service.Book.get_books_by_ids([]).books, [])
+        mock_connect.assert_not_called()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.create_book", return_value=4)
+    def test_create_book(self, mock_create_book, mock_connect):
+        index = search.TrigramIndex()
+        with patch("backend.search.INDEX", index):
+            book_id = service.Book.create_book("Title", "Author", "Genre")
+        self.assertEqual(book_id, 4)
+        mock_create_book.assert_called_once_with(
+            "Title", "Author", "Genre", mock_connect.return_value
+        )
+        self.assertEqual(index.search("Titel", 0.5), [4])
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.update_book")
+    def test_update_book(self, mock_update_book, mock_connect):
+        index = search.TrigramIndex()
+        index.load([(1, "Title", "Author")])
+        with patch("backend.search.INDEX", index):
+            service.Book.update_book(1, "Other", "Author", "Genre")
+            self.assertEqual(index.search("Title", 0.5), [])
+            self.assertEqual(index.search("Other", 0.5), [1])
+
+            mock_update_book.return_value = False
+            with self.assertRaises(HTTPException) as context:
+                service.Book.update_book(2, "Title", "Author", "Genre")
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(index.search("Title", 0.5), [])
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.delete_book")
+    def test_delete_book(self, mock_delete_book, mock_connect):
+        index = search.TrigramIndex()
+        index.load([(1, "Title", "Author")])
+        with patch("backend.search.INDEX", index):
+            service.Book.delete_book(1)
+            mock_delete_book.return_value = False
+            with self.assertRaises(HTTPException) as context:
+                service.Book.delete_book(1)
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(index.search("Title", 0.5), [])
+        mock_delete_book.assert_called_with(1, mock_connect.return_value)
 
     @patch("sqlite3.connect")
     @patch("backend.database.get_genres")
@@ -239,42 +490,185 @@ class TestBook(unittest.TestCase):
         mock_conn.close.assert_called_once()
 
     @patch("sqlite3.connect")
-    @patch("backend.database.get_books_by_genre")
-    @patch("backend.database.get_book_read_count")
-    def test_get_books_by_genre(
-        self, mock_get_book_read_count, mock_get_books_by_genre, mock_connect
-    ):
+    @patch("backend.database.get_catalog_version")
+    def test_get_catalog_version(self, mock_get_catalog_version, mock_connect):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
-        book_data = [
-            (1, "Book_1", "Author_1", "Fantasy", 10),
-            (2, "Book_2", "Author_2", "Fantasy", 30),
+        mock_get_catalog_version.return_value = "epoch-3"
+
+        version = service.Book.get_catalog_version()
+        self.assertEqual(version, "epoch-3")
+        mock_get_catalog_version.assert_called_once_with(mock_conn)
+        mock_conn.close.assert_called_once()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_books")
+    def test_get_books_by_genre(self, mock_get_books, mock_connect):
+        mock_conn = MagicMock()
+        mock_conn.close = MagicMock()
+        mock_connect.return_value = mock_conn
+        mock_get_books.return_value = [
+            (2, "Book_2", "Author_2", "Fantasy", 20),
             (3, "Book_3", "Author_3", "Fantasy", 15),
+            (1, "Book_1", "Author_1", "Fantasy", 10),
         ]
-        mock_get_books_by_genre.return_value = book_data
-        mock_get_book_read_count.side_effect = lambda book_id, conn: (
-            10 if book_id == 1 else (20 if book_id == 2 else 15)
-        )
 
         books = service.Book.get_books_by_genre("Fantasy")
-        self.assertEqual(len(books), 3)
-        # Book Two should be first due to higher reads
-        self.assertEqual(books[0].id, 2)
-        self.assertEqual(books[1].id, 3)
-        self.assertEqual(books[2].id, 1)
-
-        mock_get_books_by_genre.assert_called_once_with("Fantasy", mock_conn)
-        calls = [((book_id, mock_conn),) for book_id in [1, 2, 3]]
-        mock_get_book_read_count.assert_has_calls(calls, any_order=True)
+        self.assertEqual([book.id for book in books], [2, 3, 1])
+        mock_get_books.assert_called_once_with(
+            0, 16, "Fantasy", None, "popular", mock_conn
+        )
         mock_conn.close.assert_called_once()
 
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_books")
+    def test_get_books_from_snapshot(self, mock_get_books, mock_connect):
+        catalog = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+
+        books = service.Book.get_books(0, 1, "Genre", None, "popular", catalog)
+        self.assertEqual(
+            books.books,
+            [
+                models.Book(
+                    id=1, title="Book Title", author="Author", genre="Genre", reads=100
+                )
+            ],
+        )
+        self.assertEqual((books.previous_n, books.next_n), (0, 1))
+        books = service.Book.get_books(1, 1, "Genre", None, "popular", catalog)
+        self.assertEqual([book.id for book in books.books], [3])
+        self.assertIsNone(books.next_n)
+        mock_connect.assert_not_called()
+
+        # The books of an author come from the database
+        mock_get_books.return_value = []
+        service.Book.get_books(0, 1, None, "Writer", None, catalog)
+        mock_get_books.assert_called_once_with(
+            0, 2, None, "Writer", None, mock_connect.return_value
+        )
+
+    @patch("sqlite3.connect")
+    def test_get_genres_from_snapshot(self, mock_connect):
+        catalog = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+        self.assertEqual(service.Book.get_genres(catalog), ["Genre", "Other"])
+        mock_connect.assert_not_called()
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, snapshot.CATALOG, "snapshot", None)
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_books", return_value=iter([CATALOG_BOOKS]))
+    @patch("backend.database.get_catalog_version", return_value="v1")
+    def test_preload(self, mock_version, mock_iter_books, mock_connect):
+        service.Catalog.preload()
+        catalog = snapshot.CATALOG.snapshot
+        self.assertEqual((catalog.version, len(catalog)), ("v1", 3))
+        mock_iter_books.assert_called_once_with(mock_connect.return_value)
+        mock_connect.return_value.close.assert_called_once()
+
+    @patch("backend.service.Book.get_catalog_version", return_value="v1")
+    def test_snapshot_not_loaded(self, mock_version):
+        self.assertIsNone(service.Catalog.snapshot())
+
+    @patch("backend.snapshot.CurrentSnapshot.refresh")
+    @patch("backend.service.Book.get_catalog_version", return_value="v1")
+    def test_snapshot(self, mock_version, mock_refresh):
+        catalog = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+        snapshot.CATALOG.set(catalog)
+        self.assertIs(service.Catalog.snapshot(), catalog)
+        self.assertIs(service.Catalog.snapshot("v1"), catalog)
+        mock_refresh.assert_not_called()
+
+        # A stale snapshot is reloaded, and served meanwhile unless a given
+        # version is needed
+        mock_version.return_value = "v2"
+        self.assertIs(service.Catalog.snapshot(), catalog)
+        self.assertIsNone(service.Catalog.snapshot("v2"))
+        mock_refresh.assert_called_with(service.Catalog.load)
+
+
+class TestSearch(unittest.TestCase):
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_books", return_value=iter([CATALOG_BOOKS]))
+    def test_preload(self, mock_iter_books, mock_connect):
+        index = search.TrigramIndex()
+        with patch("backend.search.INDEX", index):
+            service.Search.preload()
+        self.assertTrue(index.loaded)
+        self.assertEqual(index.search("Writer", 0.5), [3])
+        mock_iter_books.assert_called_once_with(mock_connect.return_value)
+        mock_connect.return_value.close.assert_called_once()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_books", return_value=iter([]))
+    def test_preload_suggestions(self, mock_iter_books, mock_connect):
+        catalog = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+        suggestions = snapshot.CurrentSnapshot(0)
+        with (
+            patch("backend.search.INDEX", search.TrigramIndex()),
+            patch.object(snapshot.CATALOG, "snapshot", catalog),
+            patch("backend.suggest.SUGGESTIONS", suggestions),
+        ):
+            service.Search.preload()
+        self.assertEqual(suggestions.snapshot.version, "v1")
+
+    @patch("backend.service.Catalog.snapshot")
+    def test_suggestions(self, mock_snapshot):
+        catalog = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
+        suggestions = snapshot.CurrentSnapshot(0)
+        with patch("backend.suggest.SUGGESTIONS", suggestions):
+            mock_snapshot.return_value = None
+            self.assertIsNone(service.Search.suggestions())
+
+            mock_snapshot.return_value = catalog
+            index = suggest.PrefixIndex(catalog)
+            suggestions.set(index)
+            self.assertIs(service.Search.suggestions(), index)
+
+            # A new catalog snapshot rebuilds the index in the background
+            with patch.object(suggestions, "refresh") as mock_refresh:
+                mock_snapshot.return_value = snapshot.CatalogSnapshot("v2", [])
+                self.assertIs(service.Search.suggestions(), index)
+            mock_refresh.assert_called_once()
+
+    def test_suggest(self):
+        index = suggest.PrefixIndex(snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS]))
+        self.assertEqual(
+            service.Search.suggest("t", 2, index),
+            [
+                models.Suggestion(text="Book Title", kind="title", reads=100),
+                models.Suggestion(text="Last Title", kind="title", reads=50),
+            ],
+        )
+        self.assertEqual(
+            service.Search.suggest("wri", 2, index),
+            [models.Suggestion(text="Writer", kind="author", reads=50)],
+        )
+        self.assertEqual(service.Search.suggest("t", 2, None), [])
+
 
 class TestReadingList(unittest.TestCase):
+    def setUp(self):
+        caching.READING_LISTS.clear()
+
+    @patch("backend.service.Catalog.snapshot", return_value=None)
+    @patch("backend.service.Book.get_catalog_version", return_value="v1")
     @patch("sqlite3.connect")
     @patch("backend.service.Book.from_db")
+    @patch("backend.database.get_books_by_ids")
     @patch("backend.database.get_reading_lists")
-    def test_init_and_load(self, mock_get_reading_lists, mock_from_db, mock_connect):
+    def test_init_and_load(
+        self,
+        mock_get_reading_lists,
+        mock_get_books_by_ids,
+        mock_from_db,
+        mock_connect,
+        mock_version,
+        mock_snapshot,
+    ):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
@@ -296,44 +690,105 @@ class TestReadingList(unittest.TestCase):
                 "2024-04-27T15:32:30",
             ),
         ]
-        mock_from_db.side_effect = lambda book_id: MagicMock(
-            id=book_id,
-            title=f"Book {book_id}",
-            author="Author A",
-            genre="Fantasy",
-            reads=50,
-        )
+        mock_get_books_by_ids.return_value = [
+            (102, "Book 102", "Author A", "Fantasy", 50),
+            (101, "Book 101", "Author A", "Fantasy", 50),
+        ]
 
         reading_list = service.ReadingList(user_id=1)
-        self.assertEqual(len(reading_list.books), 2)
-        mock_get_reading_lists.assert_called_once_with(1, mock_conn)
-        mock_from_db.assert_has_calls(
-            [unittest.mock.call(101), unittest.mock.call(102)]
+        mock_connect.assert_not_called()
+        books = reading_list.books
+        self.assertEqual(
+            [(book.id, book.title, book.status) for book in books],
+            [
+                (101, "Book 101", models.StatusEnum.complete),
+                (102, "Book 102", models.StatusEnum.not_started),
+            ],
         )
-        mock_conn.close.assert_called_once()
+        mock_get_reading_lists.assert_called_once_with(1, mock_conn)
+        # The books are read in one query, not one per entry
+        mock_get_books_by_ids.assert_called_once_with([101, 102], mock_conn)
+        mock_from_db.assert_not_called()
+
+        # The entries stay cached when the catalog changes, the books are
+        # read again
+        mock_version.return_value = "v2"
+        self.assertEqual(service.ReadingList(user_id=1).books, books)
+        mock_get_reading_lists.assert_called_once()
+        self.assertEqual(mock_get_books_by_ids.call_count, 2)
+        mock_snapshot.assert_called_with("v2")
+
+    @patch("backend.service.Catalog.snapshot")
+    @patch("backend.database.get_reading_lists")
+    @patch("sqlite3.connect")
+    def test_load_from_the_snapshot(
+        self, mock_connect, mock_get_reading_lists, mock_snapshot
+    ):
+        mock_get_reading_lists.return_value = [
+            (1, 3, 1, "started", "2024-04-27T15:32:30", "2024-04-27T15:32:30"),
+            (2, 9, 1, "started", "2024-04-27T15:32:30", "2024-04-27T15:32:30"),
+        ]
+        mock_snapshot.return_value = snapshot.CatalogSnapshot("v1", [CATALOG_BOOKS])
 
+        # Without the books that no longer exist
+        [book] = service.ReadingList(user_id=1).books
+        self.assertEqual((book.id, book.title, book.reads), (3, "Last Title", 50))
+        self.assertEqual(book.status, models.StatusEnum.started)
+
+    @patch("backend.changefeed.READING_LIST_EVENTS.publish")
     @patch("sqlite3.connect")
+    @patch(
+        "backend.database.get_book", return_value=(101, "Title", "Author", "Genre", 0)
+    )
     @patch("backend.database.create_reading_list")
-    @patch("backend.database.get_book_in_reading_list")
     def test_add_book(
         self,
-        mock_get_book_in_reading_list,
         mock_create_reading_list,
+        mock_get_book,
         mock_connect,
+        mock_publish,
     ):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
-        mock_get_book_in_reading_list.return_value = ()
+        mock_create_reading_list.return_value = "2024-04-27 15:32:30"
 
         reading_list = service.ReadingList(user_id=1)
-        mock_conn.close.assert_called_once()
-        reading_list.add_book(book_id=101, status=models.StatusEnum.not_started)
-        mock_get_book_in_reading_list.assert_called_once_with(1, 101, mock_conn)
+        mock_connect.assert_not_called()
+        added = reading_list.add_book(book_id=101, status=models.StatusEnum.not_started)
+        self.assertEqual(
+            added,
+            models.Book(id=101, title="Title", author="Author", genre="Genre", reads=0),
+        )
         mock_create_reading_list.assert_called_once_with(
             1, 101, models.StatusEnum.not_started, mock_conn
         )
-        mock_conn.close.assert_has_calls(([], []))
+        mock_get_book.assert_called_once_with(101, mock_conn)
+        mock_conn.close.assert_called_once()
+        mock_publish.assert_called_once_with(
+            1, {"type": "added", "book_id": 101, "status": "not_started"}
+        )
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_book")
+    @patch("backend.database.create_reading_list", return_value=None)
+    def test_add_book_not_added(
+        self, mock_create_reading_list, mock_get_book, mock_connect
+    ):
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        reading_list = service.ReadingList(user_id=1)
+
+        mock_get_book.return_value = (101, "Title", "Author", "Genre", 0)
+        with self.assertRaises(HTTPException) as context:
+            reading_list.add_book(book_id=101)
+        self.assertEqual(context.exception.status_code, 400)
+
+        mock_get_book.return_value = None
+        with self.assertRaises(HTTPException) as context:
+            reading_list.add_book(book_id=101)
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(mock_conn.close.call_count, 2)
 
     @patch("sqlite3.connect")
     @patch("backend.database.get_completed_books")
@@ -344,79 +799,416 @@ class TestReadingList(unittest.TestCase):
         mock_get_completed_books.return_value = ["Book 101", "Book 102"]
 
         reading_list = service.ReadingList(user_id=1)
-        mock_conn.close.assert_called_once()
         books = reading_list.read_books()
         self.assertEqual(books, ["Book 101", "Book 102"])
         mock_get_completed_books.assert_called_once_with(1, mock_conn)
-        mock_conn.close.assert_has_calls(([], []))
+        mock_conn.close.assert_called_once()
 
+    @patch("backend.changefeed.READING_LIST_EVENTS.publish")
     @patch("sqlite3.connect")
     @patch("backend.database.remove_from_reading_list")
-    def test_remove_book(self, mock_remove_from_reading_list, mock_connect):
+    def test_remove_book(
+        self, mock_remove_from_reading_list, mock_connect, mock_publish
+    ):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
 
         reading_list = service.ReadingList(user_id=1)
-        mock_conn.close.assert_called_once()
         reading_list.remove_book(book_id=101)
         mock_remove_from_reading_list.assert_called_once_with(1, 101, mock_conn)
-        mock_conn.close.assert_has_calls(([], []))
+        mock_conn.close.assert_called_once()
+        mock_publish.assert_called_once_with(1, {"type": "removed", "book_id": 101})
+
+        mock_publish.reset_mock()
+        mock_remove_from_reading_list.return_value = False
+        reading_list.remove_book(book_id=101)
+        mock_publish.assert_not_called()
 
+    @patch("backend.changefeed.READING_LIST_EVENTS.publish")
     @patch("sqlite3.connect")
+    @patch(
+        "backend.database.get_book", return_value=(101, "Title", "Author", "Genre", 3)
+    )
     @patch("backend.database.update_reading_status")
-    def test_change_reading_status(self, mock_update_reading_status, mock_connect):
+    def test_change_reading_status(
+        self,
+        mock_update_reading_status,
+        mock_get_book,
+        mock_connect,
+        mock_publish,
+    ):
         mock_conn = MagicMock()
         mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
+        mock_update_reading_status.return_value = "2024-04-27 15:32:30"
         user_id = 1
         book_id = 101
         new_status = models.StatusEnum.started
 
         reading_list = service.ReadingList(user_id)
-        mock_conn.close.assert_called_once()
-        reading_list.change_reading_status(book_id, new_status)
+        book = reading_list.change_reading_status(book_id, new_status)
 
+        self.assertEqual(book.reads, 3)
         mock_update_reading_status.assert_called_once_with(
             user_id, book_id, new_status, mock_conn
         )
-        mock_conn.close.assert_has_calls(([], []))
+        mock_get_book.assert_called_once_with(book_id, mock_conn)
+        mock_conn.close.assert_called_once()
+        mock_publish.assert_called_once_with(
+            user_id, {"type": "updated", "book_id": book_id, "status": "started"}
+        )
 
+        # Unchanged status
+        mock_publish.reset_mock()
+        mock_update_reading_status.return_value = None
+        self.assertEqual(reading_list.change_reading_status(book_id, new_status), book)
+        mock_publish.assert_not_called()
+
+    @patch("backend.changefeed.READING_LIST_EVENTS.publish")
+    @patch("backend.service.Catalog.snapshot", return_value=None)
+    @patch("backend.service.Book.get_catalog_version", return_value="v1")
+    @patch(
+        "backend.database.get_books_by_ids",
+        return_value=[(101, "Title", "Author", "Genre", 0)],
+    )
+    @patch("backend.database.get_reading_lists", return_value=[])
     @patch("sqlite3.connect")
-    @patch("backend.database.get_books_by_genre")
-    @patch("backend.service.ReadingList.get_genres", return_value=["Fantasy"])
-    @patch("backend.service.Book.from_db")
-    def test_get_recommendations(
-        self, mock_from_db, mock_get_genres, mock_get_books_by_genre, mock_connect
+    @patch(
+        "backend.database.get_book", return_value=(101, "Title", "Author", "Genre", 0)
+    )
+    @patch("backend.database.update_reading_status")
+    @patch("backend.database.create_reading_list")
+    def test_writes_update_the_cached_list(
+        self,
+        mock_create_reading_list,
+        mock_update_reading_status,
+        mock_get_book,
+        mock_connect,
+        mock_get_reading_lists,
+        mock_get_books_by_ids,
+        mock_version,
+        mock_snapshot,
+        mock_publish,
+    ):
+        mock_create_reading_list.return_value = "2024-04-27 15:32:30"
+        mock_update_reading_status.return_value = "2024-04-28 10:00:00"
+        self.assertEqual(service.ReadingList(1).books, [])
+
+        service.ReadingList(1).add_book(101)
+        service.ReadingList(1).change_reading_status(101, "started")
+        [book] = service.ReadingList(1).books
+        self.assertEqual(
+            (book.id, book.status, book.updated_at),
+            (101, models.StatusEnum.started, datetime(2024, 4, 28, 10)),
+        )
+
+        service.ReadingList(1).remove_book(101)
+        self.assertEqual(service.ReadingList(1).books, [])
+        mock_get_reading_lists.assert_called_once()
+
+    @patch("backend.changefeed.READING_LIST_EVENTS.publish")
+    @patch("sqlite3.connect")
+    @patch("backend.database.apply_reading_list_changes")
+    @patch("backend.database.get_existing_book_ids", return_value={1, 2, 3})
+    @patch("backend.database.get_reading_list_statuses")
+    def test_apply_batch(
+        self,
+        mock_get_reading_list_statuses,
+        mock_get_existing_book_ids,
+        mock_apply_reading_list_changes,
+        mock_connect,
+        mock_publish,
     ):
         mock_conn = MagicMock()
-        mock_conn.close = MagicMock()
         mock_connect.return_value = mock_conn
 
-        mock_get_genres.return_value = ["Fantasy", "Science Fiction"]
-        mock_get_books_by_genre.return_value = [
-            (101, "Fantasy Book", "Author A", "Fantasy", 50),
-            (102, "Sci-Fi Book", "Author B", "Science Fiction", 30),
+        def get_statuses(user_id, book_ids, conn):
+            # Read in the write transaction
+            mock_conn.execute.assert_called_once_with("BEGIN IMMEDIATE")
+            return {1: "started", 2: "complete"}
+
+        mock_get_reading_list_statuses.side_effect = get_statuses
+        operations = [
+            models.ReadingListOperation(action="add", book_id=3),
+            models.ReadingListOperation(action="add", book_id=3),
+            models.ReadingListOperation(action="add", book_id=4),
+            models.ReadingListOperation(action="update", book_id=1, status="complete"),
+            models.ReadingListOperation(action="update", book_id=2),
+            models.ReadingListOperation(action="remove", book_id=2),
+            models.ReadingListOperation(action="remove", book_id=2),
         ]
-        book_mocks = [
-            MagicMock(id=101, genre="Fantasy", reads=50),
-            MagicMock(id=102, genre="Science Fiction", reads=30),
+
+        results = service.ReadingList.apply_batch(1, operations)
+
+        self.assertEqual(
+            [(result.status_code, result.detail) for result in results],
+            [
+                (200, "OK"),
+                (400, "Book already in reading list!"),
+                (404, "Book not found!"),
+                (200, "OK"),
+                (400, "Status is required!"),
+                (200, "OK"),
+                (404, "Book not in reading list!"),
+            ],
+        )
+        mock_get_reading_list_statuses.assert_called_once_with(
+            1, [1, 2, 3, 4], mock_conn
+        )
+        mock_apply_reading_list_changes.assert_called_once_with(
+            1, [(3, "not_started")], [("complete", 1)], [2], mock_conn
+        )
+        mock_conn.close.assert_called_once()
+        mock_publish.assert_has_calls(
+            [
+                unittest.mock.call(
+                    1, {"type": "added", "book_id": 3, "status": "not_started"}
+                ),
+                unittest.mock.call(
+                    1, {"type": "updated", "book_id": 1, "status": "complete"}
+                ),
+                unittest.mock.call(1, {"type": "removed", "book_id": 2}),
+            ]
+        )
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_tombstones", return_value=[3, 4])
+    @patch("backend.database.get_reading_list_changes")
+    def test_get_changes(
+        self, mock_get_reading_list_changes, mock_get_tombstones, mock_connect
+    ):
+        mock_conn = mock_connect.return_value
+        mock_get_reading_list_changes.return_value = [
+            (1, "Book", "Author", "Genre", 2, "started", "2024-04-27 15:32:30"),
+            (4, "Other", "Author", "Genre", 0, "not_started", "2024-04-27 15:32:31"),
         ]
-        mock_from_db.side_effect = book_mocks
+        since = service.ReadingList.sync_cursor()
+
+        changes = service.ReadingList.get_changes(1, since)
+
+        sqlite_since = since.replace("T", " ").rstrip("Z")
+        mock_get_reading_list_changes.assert_called_once_with(
+            1, sqlite_since, mock_conn
+        )
+        mock_get_tombstones.assert_called_once_with(1, sqlite_since, mock_conn)
+        self.assertEqual([book.id for book in changes.changed], [1, 4])
+        self.assertEqual(changes.changed[0].status, models.StatusEnum.started)
+        # Book 4 was removed and added again
+        self.assertEqual(changes.removed, [3])
+        self.assertGreaterEqual(changes.cursor, since)
+        mock_conn.close.assert_called_once()
+
+    def test_get_changes_invalid_cursor(self):
+        with self.assertRaises(HTTPException) as context:
+            service.ReadingList.get_changes(1, "yesterday")
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_get_changes_expired_cursor(self):
+        with self.assertRaises(HTTPException) as context:
+            service.ReadingList.get_changes(1, "2020-01-01T00:00:00Z")
+        self.assertEqual(context.exception.status_code, 410)
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_reading_list_page")
+    def test_get_page(self, mock_iter_reading_list_page, mock_connect):
+        mock_conn = mock_connect.return_value
+        rows = [
+            (book_id, "Book", "Author", "Genre", 0, "started", "2024-04-27 15:32:30", 9)
+            for book_id in range(3)
+        ]
+        mock_iter_reading_list_page.return_value = iter([rows[:2], rows[2:]])
+
+        page = service.ReadingList.get_page(1, models.StatusEnum.started, None, None, 2)
+        mock_connect.assert_not_called()
+        batches = list(page)
+
+        mock_iter_reading_list_page.assert_called_once_with(
+            1, "started", "recent", None, 3, mock_conn
+        )
+        self.assertEqual(
+            batches,
+            [
+                (
+                    [
+                        (
+                            0,
+                            "Book",
+                            "Author",
+                            "Genre",
+                            0,
+                            "started",
+                            "2024-04-27T15:32:30",
+                        ),
+                        (
+                            1,
+                            "Book",
+                            "Author",
+                            "Genre",
+                            0,
+                            "started",
+                            "2024-04-27T15:32:30",
+                        ),
+                    ],
+                    None,
+                ),
+                ([], batches[-1][1]),
+            ],
+        )
+        mock_conn.close.assert_called_once()
+
+        # The cursor points after the last book of the page
+        mock_iter_reading_list_page.return_value = iter([])
+        list(service.ReadingList.get_page(1, None, "oldest", batches[-1][1], 2))
+        mock_iter_reading_list_page.assert_called_with(
+            1, None, "oldest", ("2024-04-27 15:32:30", 9), 3, mock_conn
+        )
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_reading_list_page")
+    def test_get_page_last(self, mock_iter_reading_list_page, mock_connect):
+        mock_iter_reading_list_page.return_value = iter(
+            [[(1, "Book", "Author", "Genre", 0, "started", "2024-04-27 15:32:30", 9)]]
+        )
+        batches = list(service.ReadingList.get_page(1, n=2))
+        self.assertEqual(len(batches[0][0]), 1)
+        self.assertEqual(batches[-1], ([], None))
+
+    def test_get_page_invalid_cursor(self):
+        for cursor in ("nope", "WzEsIDJd", "e30=", "bnVsbA=="):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(HTTPException) as context:
+                    service.ReadingList.get_page(1, cursor=cursor)
+                self.assertEqual(context.exception.status_code, 400)
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.purge_tombstones", return_value=2)
+    def test_compact_tombstones(self, mock_purge_tombstones, mock_connect):
+        self.assertEqual(service.ReadingList.compact_tombstones(), 2)
+        before = mock_purge_tombstones.call_args.args[0]
+        self.assertRegex(before, r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+        mock_connect.return_value.close.assert_called_once()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.apply_reading_list_changes")
+    @patch("backend.database.get_existing_book_ids", return_value={1})
+    @patch("backend.database.get_reading_list_statuses", return_value={})
+    def test_apply_batch_rollback(
+        self,
+        mock_get_reading_list_statuses,
+        mock_get_existing_book_ids,
+        mock_apply_reading_list_changes,
+        mock_connect,
+    ):
+        mock_apply_reading_list_changes.side_effect = sqlite3.OperationalError
+        operation = models.ReadingListOperation(action="add", book_id=1)
+        with self.assertRaises(sqlite3.OperationalError):
+            service.ReadingList.apply_batch(1, [operation])
+        mock_connect.return_value.rollback.assert_called_once()
+        mock_connect.return_value.close.assert_called_once()
+
+    @patch("backend.service.READS_BATCH_MAX_SIZE", 2)
+    def test_apply_batch_too_many_operations(self):
+        operation = models.ReadingListOperation(action="remove", book_id=1)
+        with self.assertRaises(HTTPException) as context:
+            service.ReadingList.apply_batch(1, [operation] * 3)
+        self.assertEqual(context.exception.status_code, 400)
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_books")
+    def test_get_recommendations(self, mock_get_books, mock_connect):
+        mock_conn = MagicMock()
+        mock_conn.close = MagicMock()
+        mock_connect.return_value = mock_conn
+        mock_get_books.side_effect = lambda start, n, genre, author, sort, conn: {
+            "Fantasy": [
+                (101, "Fantasy Book", "Author A", "Fantasy", 50),
+                (103, "Other Fantasy Book", "Author C", "Fantasy", 20),
+            ],
+            "Science Fiction": [
+                (102, "Sci-Fi Book", "Author B", "Science Fiction", 30),
+            ],
+        }[genre]
 
         reading_list = service.ReadingList(user_id=1)
-        reading_list.books = [book_mocks[0]]
+        reading_list.books = [
+            MagicMock(id=101, genre="Fantasy"),
+            MagicMock(id=104, genre="Science Fiction"),
+        ]
         recommendations = reading_list.get_recommendations(n=2)
 
-        self.assertEqual(len(recommendations), 1)
-        self.assertEqual(recommendations[0].id, 102)
-        mock_get_books_by_genre.assert_has_calls(
+        self.assertEqual([book.id for book in recommendations], [102, 103])
+        mock_get_books.assert_has_calls(
             [
-                unittest.mock.call("Fantasy", mock_conn),
-                unittest.mock.call("Science Fiction", mock_conn),
-            ]
+                unittest.mock.call(0, 4, "Fantasy", None, "popular", mock_conn),
+                unittest.mock.call(0, 4, "Science Fiction", None, "popular", mock_conn),
+            ],
+            any_order=True,
         )
-        mock_from_db.assert_has_calls(
-            [unittest.mock.call(101), unittest.mock.call(102)], any_order=True
+        mock_conn.close.assert_called_once()
+
+
+class TestStats(unittest.TestCase):
+    @patch("sqlite3.connect")
+    @patch("backend.database.get_trending_books")
+    @patch("backend.database.get_daily_completions")
+    @patch("backend.database.get_genre_stats")
+    @patch("backend.database.get_status_totals")
+    def test_get(
+        self,
+        mock_get_status_totals,
+        mock_get_genre_stats,
+        mock_get_daily_completions,
+        mock_get_trending_books,
+        mock_connect,
+    ):
+        mock_conn = mock_connect.return_value
+        mock_get_status_totals.return_value = (1, 1, 2)
+        mock_get_genre_stats.return_value = [("Genre", 1, 1, 2), ("Other", 0, 0, 0)]
+        mock_get_daily_completions.return_value = [("2024-04-27", 2)]
+        mock_get_trending_books.return_value = [(1, "Book", "Author", "Genre", 2, 1)]
+
+        stats = service.Stats.get(5, 7)
+        self.assertEqual(stats.statuses.completion_rate, 0.5)
+        self.assertEqual(
+            stats.genres[1],
+            models.GenreStats(
+                genre="Other", not_started=0, started=0, complete=0, completion_rate=0
+            ),
         )
-        mock_conn.close.assert_has_calls(([], []))
+        self.assertEqual(stats.daily_completions[0].day, date(2024, 4, 27))
+        self.assertEqual(stats.trending[0].readers, 1)
+        mock_get_trending_books.assert_called_once_with(5, mock_conn)
+        # Today and the 6 days before
+        since = mock_get_daily_completions.call_args.args[0]
+        first_day = datetime.now(timezone.utc).date() - timedelta(days=6)
+        self.assertEqual(since, first_day.isoformat())
+        mock_conn.close.assert_called_once()
+
+
+class TestExport(unittest.TestCase):
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_books")
+    def test_books(self, mock_iter_books, mock_connect):
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        mock_iter_books.return_value = iter([[(1, "Book", "Author", "Genre", 0)]])
+
+        batches = service.Export.books()
+        mock_connect.assert_not_called()
+        self.assertEqual(list(batches), [[(1, "Book", "Author", "Genre", 0)]])
+        mock_iter_books.assert_called_once_with(mock_conn)
+        mock_conn.close.assert_called_once()
+
+    @patch("sqlite3.connect")
+    @patch("backend.database.iter_reading_list")
+    def test_reads_closes_connection_early(self, mock_iter_reading_list, mock_connect):
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        mock_iter_reading_list.return_value = iter([["batch 1"], ["batch 2"]])
+
+        batches = service.Export.reads(1)
+        self.assertEqual(next(batches), ["batch 1"])
+        batches.close()
+        mock_iter_reading_list.assert_called_once_with(1, mock_conn)
+        mock_conn.close.assert_called_once()
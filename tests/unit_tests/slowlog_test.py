@@ -0,0 +1,155 @@
+import sqlite3
+import unittest
+from time import sleep
+from unittest.mock import patch
+
+import backend.slowlog as slowlog
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_literals_are_replaced(self):
+        self.assertEqual(
+            slowlog.fingerprint(
+                "SELECT * FROM reading_list WHERE user = 12\n"
+                "        AND reading_status = 'complete'"
+            ),
+            "SELECT * FROM reading_list WHERE user = ? AND reading_status = ?",
+        )
+
+    def test_escaped_quotes_and_floats(self):
+        self.assertEqual(
+            slowlog.fingerprint(
+                "SELECT * FROM books WHERE title = 'Ender''s' OR x = 1.5"
+            ),
+            "SELECT * FROM books WHERE title = ? OR x = ?",
+        )
+
+    def test_in_lists_collapse(self):
+        self.assertEqual(
+            slowlog.fingerprint("SELECT * FROM books WHERE id IN (1, 2, 3)"),
+            slowlog.fingerprint("SELECT * FROM books WHERE id IN (4,5)"),
+        )
+
+    def test_identifiers_are_kept(self):
+        self.assertEqual(
+            slowlog.fingerprint("SELECT t1.id FROM t1"), "SELECT t1.id FROM t1"
+        )
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    def test_record_and_report(self):
+        log = slowlog.SlowQueryLog(threshold_ms=10)
+        for ms in range(1, 101):
+            log.record("get_book", f"SELECT * FROM books WHERE id = {ms}", ms / 1000)
+        log.record("get_genres", "SELECT DISTINCT genre FROM books", 0.5)
+
+        report = log.report()
+        self.assertEqual(len(report), 2)
+        self.assertEqual(report[0]["function"], "get_genres")
+        entry = report[1]
+        self.assertEqual(entry["fingerprint"], "SELECT * FROM books WHERE id = ?")
+        self.assertEqual(entry["calls"], 100)
+        self.assertAlmostEqual(entry["p50_ms"], 51)
+        self.assertAlmostEqual(entry["p99_ms"], 100)
+        self.assertAlmostEqual(entry["max_ms"], 100)
+
+        log.reset()
+        self.assertEqual(log.report(), [])
+
+    def test_plan_is_captured_once(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, genre TEXT)")
+        log = slowlog.SlowQueryLog(threshold_ms=0)
+        log.record("f", "SELECT * FROM books WHERE genre = 'a'", 0.1, conn)
+        with patch("backend.slowlog.explain") as mock_explain:
+            log.record("f", "SELECT * FROM books WHERE genre = 'b'", 0.1, conn)
+            mock_explain.assert_not_called()
+        self.assertEqual(log.report()[0]["plan"], ["SCAN books"])
+        conn.close()
+
+
+class TestTracked(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY)")
+        slowlog.install(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_statements_are_recorded(self):
+        @slowlog.tracked
+        def count_books(conn: sqlite3.Connection):
+            return conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+        with patch.object(slowlog.SLOW_QUERIES, "threshold", 0), patch.object(
+            slowlog.SLOW_QUERIES, "record"
+        ) as mock_record:
+            self.assertEqual(count_books(self.conn), 0)
+        mock_record.assert_called_once()
+        function, statement, elapsed, conn = mock_record.call_args.args
+        self.assertEqual(function, "count_books")
+        self.assertEqual(statement, "SELECT COUNT(*) FROM books")
+        self.assertIs(conn, self.conn)
+
+    def test_fast_statements_are_ignored(self):
+        @slowlog.tracked
+        def count_books(conn: sqlite3.Connection):
+            return conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+        with patch.object(slowlog.SLOW_QUERIES, "threshold", 60), patch.object(
+            slowlog.SLOW_QUERIES, "record"
+        ) as mock_record:
+            count_books(conn=self.conn)
+        mock_record.assert_not_called()
+
+    def test_nested_calls_are_not_charged_to_the_caller(self):
+        @slowlog.tracked
+        def insert_book(book_id, conn: sqlite3.Connection):
+            conn.execute("INSERT INTO books VALUES (?)", (book_id,))
+            sleep(0.02)
+
+        @slowlog.tracked
+        def seed(conn: sqlite3.Connection):
+            conn.execute("SELECT id FROM books LIMIT 1").fetchall()
+            for book_id in range(3):
+                insert_book(book_id, conn)
+
+        with patch.object(slowlog.SLOW_QUERIES, "threshold", 0.01), patch.object(
+            slowlog.SLOW_QUERIES, "record"
+        ) as mock_record:
+            seed(self.conn)
+        self.assertEqual(
+            [call.args[:2] for call in mock_record.call_args_list],
+            [("insert_book", f"INSERT INTO books VALUES ({i})") for i in range(3)],
+        )
+
+    def test_generators_are_timed_while_producing(self):
+        self.conn.executemany("INSERT INTO books VALUES (?)", [(1,), (2,)])
+
+        @slowlog.tracked
+        def iter_books(conn: sqlite3.Connection):
+            for row in conn.execute("SELECT id FROM books"):
+                sleep(0.01)
+                yield row
+
+        with patch.object(slowlog.SLOW_QUERIES, "threshold", 0.015), patch.object(
+            slowlog.SLOW_QUERIES, "record"
+        ) as mock_record:
+            for _ in iter_books(self.conn):
+                # The time the caller takes is not charged
+                sleep(0.05)
+        mock_record.assert_called_once()
+        function, statement, elapsed, conn = mock_record.call_args.args
+        self.assertEqual((function, statement), ("iter_books", "SELECT id FROM books"))
+        self.assertLess(elapsed, 0.05)
+        self.assertIs(conn, self.conn)
+
+    def test_untracked_statements_are_ignored(self):
+        with patch.object(slowlog.SLOW_QUERIES, "record") as mock_record:
+            self.conn.execute("SELECT COUNT(*) FROM books")
+        mock_record.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import logging
+import sqlite3
+import unittest
+from unittest.mock import MagicMock, patch
+
+import backend.database as db
+import backend.snapshot as snapshot
+from backend import datagen
+
+BOOKS = [
+    (1, "Dune", "Frank Herbert", "Science Fiction", 5),
+    (2, "Emma", "Jane Austen", "Romance", 2),
+    (4, "Anna", "Leo Tolstoy", "Romance", 5),
+    (7, "Persuasion", "Jane Austen", "Romance", 0),
+]
+
+
+def make_snapshot(version="v1", books=BOOKS):
+    # Rows come in batches, like database.iter_books
+    return snapshot.CatalogSnapshot(version, [books[:2], books[2:]])
+
+
+def as_row(book: snapshot.BookRow):
+    return (book.id, book.title, book.author, book.genre, book.reads)
+
+
+class TestCatalogSnapshot(unittest.TestCase):
+    def test_columns(self):
+        catalog = make_snapshot()
+        self.assertEqual(len(catalog), 4)
+        self.assertEqual(list(catalog.ids), [1, 2, 4, 7])
+        # Each author and genre is stored once
+        self.assertEqual(len(catalog.authors), 3)
+        self.assertEqual(catalog.get_genres(), ["Romance", "Science Fiction"])
+
+    def test_get(self):
+        catalog = make_snapshot()
+        self.assertEqual(as_row(catalog.get(4)), BOOKS[2])
+        self.assertIsNone(catalog.get(3))
+        self.assertIsNone(catalog.get(8))
+
+    def test_page(self):
+        catalog = make_snapshot()
+
+        def ids(*args):
+            return [book.id for book in catalog.page(*args)]
+
+        self.assertEqual(ids(0, 3), [1, 2, 4])
+        self.assertEqual(ids(1, 2, None, "popular"), [1, 2])
+        self.assertEqual(ids(0, 4, None, "popular"), [4, 1, 2, 7])
+        self.assertEqual(ids(0, 4, None, "title"), [4, 1, 2, 7])
+        self.assertEqual(ids(1, 2, None, "recent"), [4, 2])
+        self.assertEqual(ids(3, 2, None, "recent"), [1])
+        self.assertEqual(ids(0, 5, "Romance", "popular"), [4, 2, 7])
+        self.assertEqual(ids(0, 2, "Romance", "recent"), [7, 4])
+        self.assertEqual(ids(5, 2, "Romance"), [])
+        self.assertEqual(ids(0, 2, "Poetry"), [])
+
+    @patch("backend.datagen.Hasher.password_hash", return_value="hash")
+    def test_pages_match_the_database(self, mock_hash):
+        logging.disable(logging.INFO)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        datagen.generate(conn, 500, 50, reads_per_user=20)
+        catalog = snapshot.CatalogSnapshot("v1", db.iter_books(conn))
+
+        for genre in (None, "Fiction", "Poetry"):
+            for sort in db.BOOK_SORTS:
+                for start in (0, 15, 490):
+                    with self.subTest(genre=genre, sort=sort, start=start):
+                        self.assertEqual(
+                            list(map(as_row, catalog.page(start, 15, genre, sort))),
+                            db.get_books(start, 15, genre, None, sort, conn),
+                        )
+        self.assertEqual(catalog.get_genres(), db.get_genres(conn))
+
+
+def run_inline(target, args, daemon):
+    # Runs the background loads in the calling thread
+    return MagicMock(start=lambda: target(*args))
+
+
+@patch("backend.snapshot.threading.Thread", side_effect=run_inline)
+class TestCurrentSnapshot(unittest.TestCase):
+    def load(self):
+        self.loads += 1
+        return make_snapshot(f"v{self.loads + 1}")
+
+    def setUp(self):
+        self.loads = 0
+        self.current = snapshot.CurrentSnapshot(min_interval=0)
+
+    def test_no_snapshot(self, mock_thread):
+        self.assertIsNone(self.current.get("v1", self.load))
+        self.assertEqual(self.loads, 0)
+
+    def test_up_to_date(self, mock_thread):
+        catalog = make_snapshot("v1")
+        self.current.set(catalog)
+        self.assertIs(self.current.get("v1", self.load), catalog)
+        mock_thread.assert_not_called()
+
+    def test_refresh_in_the_background(self, mock_thread):
+        catalog = make_snapshot("v1")
+        self.current.set(catalog)
+        # The previous snapshot is served while the new one loads
+        self.assertIs(self.current.get("v2", self.load), catalog)
+        self.assertTrue(mock_thread.call_args.kwargs["daemon"])
+        self.assertEqual(self.current.get("v2", self.load).version, "v2")
+        self.assertEqual(self.loads, 1)
+        self.assertFalse(self.current.loading)
+
+    def test_refresh_rate_limit(self, mock_thread):
+        self.current = snapshot.CurrentSnapshot(min_interval=60)
+        self.current.set(make_snapshot("v1"))
+        self.current.get("v2", self.load)
+        self.current.get("v3", self.load)
+        self.assertEqual(self.loads, 1)
+
+    def test_refresh_interval_scales_with_the_load_time(self, mock_thread):
+        self.current.set(make_snapshot("v1"))
+        with patch("backend.snapshot.time.monotonic", side_effect=[0, 0, 2]):
+            self.current.get("v2", self.load)
+        self.assertEqual(self.current.load_seconds, 2)
+        # Not before 10 times the last load time
+        with patch("backend.snapshot.time.monotonic", return_value=21):
+            self.current.get("v3", self.load)
+        self.assertEqual(self.loads, 1)
+        with patch("backend.snapshot.time.monotonic", side_effect=[22, 22, 23]):
+            self.current.get("v3", self.load)
+        self.assertEqual(self.loads, 2)
+
+    def test_one_load_at_a_time(self, mock_thread):
+        self.current.set(make_snapshot("v1"))
+        self.current.loading = True
+        self.current.get("v2", self.load)
+        mock_thread.assert_not_called()
+
+    def test_failed_refresh(self, mock_thread):
+        catalog = make_snapshot("v1")
+        self.current.set(catalog)
+
+        def load():
+            raise sqlite3.OperationalError("database is locked")
+
+        with self.assertLogs(level=logging.ERROR):
+            self.current.get("v2", load)
+        self.assertIs(self.current.snapshot, catalog)
+        self.assertFalse(self.current.loading)
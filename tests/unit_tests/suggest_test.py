@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch
+
+import backend.snapshot as snapshot
+import backend.suggest as suggest
+
+BOOKS = [
+    (1, "The Hobbit", "J. R. R. Tolkien", "Fantasy", 50),
+    (2, "The Lord of the Rings", "J. R. R. Tolkien", "Fantasy", 40),
+    (3, "Hobbit Holes", "Unknown", "Poetry", 1),
+    (4, "Émile", "Jean-Jacques Rousseau", "Philosophy", 5),
+    (5, "The Hobbit", "Unknown", "Fantasy", 20),
+]
+
+
+def make_index(k=3):
+    return suggest.PrefixIndex(snapshot.CatalogSnapshot("v1", [BOOKS]), k)
+
+
+class TestNormalize(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(suggest.normalize("  Émile,  Zola "), "emile zola")
+        self.assertEqual(suggest.normalize("Straße"), "strasse")
+        self.assertEqual(suggest.normalize("?!"), "")
+
+    def test_keys(self):
+        self.assertEqual(
+            suggest._keys("The Lord of the Rings"),
+            {
+                "the lord of the rings",
+                "lord of the rings",
+                "of the rings",
+                "the rings",
+                "rings",
+            },
+        )
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def test_texts(self):
+        index = make_index()
+        self.assertEqual(index.version, "v1")
+        # Distinct titles and authors, the most read first
+        self.assertEqual(
+            index.texts,
+            [
+                "J. R. R. Tolkien",
+                "The Hobbit",
+                "The Lord of the Rings",
+                "Unknown",
+                "Émile",
+                "Jean-Jacques Rousseau",
+                "Hobbit Holes",
+            ],
+        )
+        self.assertEqual(list(index.reads), [90, 70, 40, 21, 5, 5, 1])
+
+    def test_suggest(self):
+        index = make_index()
+        self.assertEqual(
+            index.suggest("hob", 3),
+            [("The Hobbit", True, 70), ("Hobbit Holes", True, 1)],
+        )
+        self.assertEqual(index.suggest("TOLK", 3), [("J. R. R. Tolkien", False, 90)])
+        self.assertEqual(index.suggest("emi", 3), [("Émile", True, 5)])
+        self.assertEqual(index.suggest("the", 1), [("The Hobbit", True, 70)])
+        self.assertEqual(index.suggest("lord of th", 3)[0][0], "The Lord of the Rings")
+        self.assertEqual(index.suggest("xyz", 3), [])
+        self.assertEqual(index.suggest("...", 3), [])
+
+    def test_suggest_whole_word(self):
+        index = make_index()
+        self.assertEqual(len(index.suggest("j", 3)), 2)
+        self.assertEqual(index.suggest("j ", 3), [("J. R. R. Tolkien", False, 90)])
+
+    @patch("backend.suggest.SCAN_KEYS", 2)
+    def test_precomputed_prefixes(self):
+        index = make_index(k=2)
+        # The prefixes of more than 2 keys, e.g. "ho" of hobbit, hobbit holes
+        # and holes
+        self.assertEqual(
+            set(index.top), {"", "h", "ho", "j", "r", "t", "th", "the", "the "}
+        )
+        for prefix in ("h", "hob", "the", "the l", "r"):
+            with self.subTest(prefix=prefix):
+                expected = sorted(
+                    {
+                        code
+                        for key, code in zip(index.keys, index.codes)
+                        if key.startswith(prefix)
+                    }
+                )[:2]
+                self.assertEqual(index.top.get(prefix, expected), expected)
+                self.assertEqual(
+                    index.suggest(prefix, 2),
+                    [
+                        (index.texts[code], index.titles[code], index.reads[code])
+                        for code in expected
+                    ],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()